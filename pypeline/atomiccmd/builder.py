@@ -236,9 +236,13 @@ class AtomicCmdBuilder:
                 return option
 
 
+# Max heap size (in MB) of Java processes (-Xmx), see the Node 'memory' property
+JAVA_MAX_HEAP_SIZE = 4096
+
+
 class AtomicJava7CmdBuilder(AtomicCmdBuilder):
     def __init__(self, config, jar, gc_threads = 1, **kwargs):
-        call = ["/usr/lib/jvm/java-7-openjdk-amd64/bin/java", "-server", "-Xmx4g",
+        call = ["/usr/lib/jvm/java-7-openjdk-amd64/bin/java", "-server", "-Xmx%im" % (JAVA_MAX_HEAP_SIZE,),
                 "-Djava.io.tmpdir=%s" % config.temp_root,
                 "-Djava.awt.headless=true"]
 
@@ -259,7 +263,7 @@ class AtomicJava7CmdBuilder(AtomicCmdBuilder):
 
 class AtomicJavaCmdBuilder(AtomicCmdBuilder):
     def __init__(self, config, jar, gc_threads = 1, **kwargs):
-        call = ["java", "-server", "-Xmx4g",
+        call = ["java", "-server", "-Xmx%im" % (JAVA_MAX_HEAP_SIZE,),
                 "-Djava.io.tmpdir=%s" % config.temp_root,
                 "-Djava.awt.headless=true"]
 
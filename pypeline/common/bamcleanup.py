@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Cleanup of pre-aligned BAM files in a single pass (see 'bam_cleanup'):
+Unmapped reads and reads with a low mapping quality are removed, read-groups
+are replaced with a single read-group, and the MD / NM tags are recalculated
+against the reference sequence, corresponding to the previous pipeline of
+'samtools view -F0x4 -q N | AddOrReplaceReadGroups | samtools calmd'.
+"""
+import mmap
+import itertools
+
+
+# CIGAR operations consuming bases from the read and / or the reference
+_CIGAR_MATCH = frozenset((0, 7, 8)) # M, =, X
+_CIGAR_INS = 1
+_CIGAR_DEL = 2
+_CIGAR_SKIP = 3
+_CIGAR_SOFT_CLIP = 4
+
+
+class Reference(object):
+    """Memory-mapped FASTA file, indexed using 'samtools faidx'; sequences are
+    read directly from the (uncompressed) FASTA file, using the .fai index."""
+
+    def __init__(self, filename):
+        self._contigs = {}
+        with open(filename + ".fai") as handle:
+            for line in handle:
+                if line.strip():
+                    name, length, offset, line_bases, line_width = line.split("\t")[:5]
+                    self._contigs[name] = (int(length), int(offset),
+                                           int(line_bases), int(line_width))
+
+        self._handle = open(filename, "rb")
+        self._mmap = mmap.mmap(self._handle.fileno(), 0, access = mmap.ACCESS_READ)
+
+
+    def fetch(self, contig, start, end):
+        """Returns the uppercase sequence of a contig in the range [start, end),
+        clipped to the length of the contig."""
+        length, offset, line_bases, line_width = self._contigs[contig]
+        start, end = max(0, start), min(end, length)
+        if start >= end:
+            return ""
+
+        first = offset + (start // line_bases) * line_width + start % line_bases
+        last = offset + ((end - 1) // line_bases) * line_width + (end - 1) % line_bases
+        return self._mmap[first:last + 1].translate(None, "\r\n").upper()
+
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._handle.close()
+            self._mmap = self._handle = None
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+
+def calculate_md_nm(cigar, sequence, reference):
+    """Returns the MD and NM tags of an alignment, as calculated by 'samtools
+    calmd', given the CIGAR (list of (op, length) tuples), the sequence of the
+    read, and the (uppercase) reference sequence, starting at the position of
+    the alignment. As with 'calmd', 'N's are always counted as mismatches."""
+    md_tag, nm_tag, matches = [], 0, 0
+    read_pos = ref_pos = 0
+    for (op, length) in cigar:
+        if op in _CIGAR_MATCH:
+            read_bases = sequence[read_pos:read_pos + length].upper()
+            ref_bases = reference[ref_pos:ref_pos + length]
+            if (read_bases == ref_bases) and ("N" not in ref_bases):
+                matches += len(ref_bases)
+            else:
+                for (read_base, ref_base) in itertools.izip(read_bases, ref_bases):
+                    if (read_base == ref_base) and (ref_base != "N"):
+                        matches += 1
+                    else:
+                        md_tag.append("%i%s" % (matches, ref_base))
+                        nm_tag += 1
+                        matches = 0
+            read_pos += length
+            ref_pos += length
+        elif op == _CIGAR_INS:
+            read_pos += length
+            nm_tag += length
+        elif op == _CIGAR_DEL:
+            md_tag.append("%i^%s" % (matches, reference[ref_pos:ref_pos + length]))
+            ref_pos += length
+            nm_tag += length
+            matches = 0
+        elif op == _CIGAR_SKIP:
+            ref_pos += length
+        elif op == _CIGAR_SOFT_CLIP:
+            read_pos += length
+        # Hard clipping and padding do not consume any bases
+
+    md_tag.append(str(matches))
+    return "".join(md_tag), nm_tag
+
+
+def cleanup_header(header, read_group):
+    """Returns a copy of a BAM header (dictionary, as used by pysam), in which
+    any read-groups have been replaced with 'read_group' (a dictionary)."""
+    header = dict(header)
+    header["RG"] = [dict(read_group)]
+    return header
+
+
+def cleanup_reads(reads, contigs, reference, read_group_id, min_mapq = 0):
+    """Takes a sequence of reads, and yields mapped reads with a mapping quality
+    of at least 'min_mapq', with the RG tag set to 'read_group_id', and with
+    the MD and NM tags calculated against the reference (see 'Reference');
+    'contigs' is the list of reference names in the BAM header."""
+    for read in reads:
+        if read.is_unmapped or (read.mapq < min_mapq):
+            continue
+
+        values = [("RG", read_group_id)]
+        sequence, cigar = read.seq, read.cigar
+        if sequence and cigar:
+            region = reference.fetch(contigs[read.tid], read.pos, read.pos + read.alen)
+            md_tag, nm_tag = calculate_md_nm(cigar, sequence, region)
+            values.extend((("NM", nm_tag), ("MD", md_tag)))
+
+        read.tags = _update_tags(read.tags, values)
+        yield read
+
+
+def _update_tags(tags, values):
+    """Replaces the values of existing tags, and appends any new tags."""
+    replacements = dict(values)
+    result = [(key, replacements.pop(key, value)) for (key, value) in tags]
+    result.extend((key, value) for (key, value) in values if key in replacements)
+    return result
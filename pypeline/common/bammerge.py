@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Merging of coordinate sorted BAM files (see the script 'bam_merge'), as a
+light-weight alternative to Picard MergeSamFiles. Headers are merged, with
+read-groups (RG) and programs (PG) that have the same ID but different
+attributes renamed (and the tags of the reads updated accordingly), and
+reads are merged using a k-way merge of the (sorted) input files. Reads at
+the same position are written in the order of the input files.
+"""
+import heapq
+
+
+class BAMMergeError(RuntimeError):
+    pass
+
+
+# Sort key for the reference ID of reads without a reference sequence
+_UNMAPPED_TID = float("inf")
+
+
+def merge_headers(headers):
+    """Merges a list of BAM headers (dictionaries, as used by pysam), which
+    must contain the same reference sequences (SQ) in the same order. Returns
+    a tuple containing the merged header, and a list containing a dictionary
+    of {tag : {old ID : new ID}} for each header, for any renamed RG / PG,
+    or None if no RG / PG was renamed."""
+    if not headers:
+        raise BAMMergeError("No headers to merge")
+
+    sequences = _get_sequences(headers[0])
+    for header in headers[1:]:
+        if _get_sequences(header) != sequences:
+            raise BAMMergeError("Reference sequences (SQ) differ between BAM files")
+
+    merged = {"HD" : {"VN" : headers[0].get("HD", {}).get("VN", "1.0"),
+                      "SO" : "coordinate"},
+              "SQ" : [dict(record) for record in headers[0].get("SQ", ())]}
+
+    mappings = [{} for _ in headers]
+    for key in ("RG", "PG"):
+        records, index = [], {}
+        for (header, mapping) in zip(headers, mappings):
+            renamed, added = {}, []
+            for record in header.get(key, ()):
+                record = dict(record)
+                existing = index.get(record["ID"])
+                if existing is None:
+                    index[record["ID"]] = record
+                    added.append(record)
+                elif existing != record:
+                    new_id = renamed[record["ID"]] = _get_unique_id(record["ID"], index)
+                    record["ID"] = new_id
+                    index[record["ID"]] = record
+                    added.append(record)
+
+            # Chains of programs (PP) refer to records in the same header
+            for record in added:
+                if record.get("PP") in renamed:
+                    record["PP"] = renamed[record["PP"]]
+            records.extend(added)
+            if renamed:
+                mapping[key] = renamed
+
+        if records:
+            merged[key] = records
+
+    comments = []
+    for header in headers:
+        for comment in header.get("CO", ()):
+            if comment not in comments:
+                comments.append(comment)
+    if comments:
+        merged["CO"] = comments
+
+    return merged, [(mapping or None) for mapping in mappings]
+
+
+def merge_reads(files, mappings = None):
+    """Takes a list of sequences of coordinate sorted reads, and yields the
+    reads in coordinate order; reads without a reference sequence are yielded
+    last. If a list of mappings is given (see 'merge_headers'), the RG / PG
+    tags of reads are updated as needed. Raises BAMMergeError if a file is
+    not sorted by coordinate."""
+    mappings = mappings or [None] * len(files)
+    iterators = [_read_keys(index, reads, mapping)
+                 for (index, (reads, mapping)) in enumerate(zip(files, mappings))]
+
+    # Keys are unique across iterators, so that reads are never compared
+    for (_, _, _, read) in heapq.merge(*iterators):
+        yield read
+
+
+def _read_keys(index, reads, mapping):
+    last_key = (-1, -1)
+    for read in reads:
+        if mapping:
+            _update_tags(read, mapping)
+
+        tid = read.tid
+        key = ((tid if tid >= 0 else _UNMAPPED_TID), read.pos)
+        if key < last_key:
+            raise BAMMergeError("BAM file is not sorted by coordinate: Read %r found after "
+                                "position %s" % (read.qname, last_key))
+        last_key = key
+
+        yield (key[0], key[1], index, read)
+
+
+def _update_tags(read, mapping):
+    tags, changed = [], False
+    for (key, value) in read.tags:
+        if key in mapping and value in mapping[key]:
+            value, changed = mapping[key][value], True
+        tags.append((key, value))
+
+    if changed:
+        read.tags = tags
+
+
+def _get_sequences(header):
+    return [(record["SN"], record["LN"]) for record in header.get("SQ", ())]
+
+
+def _get_unique_id(name, used):
+    for counter in xrange(1, len(used) + 2):
+        candidate = "%s.%i" % (name, counter)
+        if candidate not in used:
+            return candidate
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Minimal reader / writer for BGZF (blocked GZIP) files, as used by BAM.
+
+BGZFWriter compresses blocks using a pool of threads; since zlib releases the
+GIL while compressing, this allows compression to make use of multiple cores.
+"""
+import os
+import sys
+import zlib
+import struct
+import traceback
+import collections
+import multiprocessing.pool
+
+
+class BGZFError(RuntimeError):
+    pass
+
+
+# Header (with the 'BC' extra subfield), and footer (CRC32 / ISIZE) of blocks
+_HEADER = struct.Struct("<4BI2BH2BHH")
+_FOOTER = struct.Struct("<2I")
+_MAGIC = "\x1f\x8b\x08\x04"
+# Max number of uncompressed bytes per block, such that blocks stay below 64kb
+_MAX_BLOCK_SIZE = 0xff00
+# Empty block used to mark the end of a BGZF file
+_EOF_BLOCK = "1f8b08040000000000ff0600424302001b0003000000000000000000".decode("hex")
+
+
+class BGZFWriter:
+    """File-like object writing data as BGZF blocks to a handle; blocks are
+    compressed using (at most) 'threads' threads, and written in order."""
+    def __init__(self, handle, threads = 1, level = zlib.Z_DEFAULT_COMPRESSION):
+        self._handle = handle
+        self._level = level
+        self._buffer = []
+        self._buffered = 0
+        self._pool = None
+        self._pending = collections.deque()
+        self._max_pending = 2 * threads
+        if threads > 1:
+            self._pool = multiprocessing.pool.ThreadPool(threads)
+
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= _MAX_BLOCK_SIZE:
+            data = "".join(self._buffer)
+            remaining = len(data) % _MAX_BLOCK_SIZE
+            for offset in xrange(0, len(data) - remaining, _MAX_BLOCK_SIZE):
+                self._write_block(data[offset:offset + _MAX_BLOCK_SIZE])
+
+            self._buffer = [data[len(data) - remaining:]]
+            self._buffered = remaining
+
+
+    def close(self):
+        """Writes any buffered data, followed by the BGZF EOF block."""
+        if self._handle is not None:
+            if self._buffered:
+                self._write_block("".join(self._buffer))
+            self._buffer, self._buffered = [], 0
+
+            while self._pending:
+                self._handle.write(self._pending.popleft().get())
+            self._handle.write(_EOF_BLOCK)
+            self._handle.flush()
+            self._terminate()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, _exc_value, _traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # No EOF block is written, to mark the output as truncated
+            self._terminate()
+
+
+    def _write_block(self, data):
+        if self._pool is None:
+            self._handle.write(compress_block(data, self._level))
+            return
+
+        while len(self._pending) >= self._max_pending:
+            self._handle.write(self._pending.popleft().get())
+        self._pending.append(self._pool.apply_async(compress_block, (data, self._level)))
+
+
+    def _terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._handle = None
+
+
+def compress_block(data, level = zlib.Z_DEFAULT_COMPRESSION):
+    """Returns 'data' compressed as one or more BGZF blocks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    block_size = _HEADER.size + len(compressed) + _FOOTER.size
+    if block_size > 0x10000:
+        # Incompressible data may result in blocks larger than allowed
+        middle = len(data) // 2
+        return compress_block(data[:middle], level) + compress_block(data[middle:], level)
+
+    header = _HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, block_size - 1)
+    footer = _FOOTER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+    return "".join((header, compressed, footer))
+
+
+def read_blocks(handle):
+    """Yields the (uncompressed) contents of each BGZF block read from the
+    handle; empty blocks (such as the EOF block) are skipped."""
+    while True:
+        header = handle.read(_HEADER.size)
+        if not header:
+            return
+        elif (len(header) < _HEADER.size) or not header.startswith(_MAGIC):
+            raise BGZFError("Invalid or truncated BGZF block header")
+
+        fields = _HEADER.unpack(header)
+        extra_len, subfield = fields[7], fields[8:11]
+        if subfield != (66, 67, 2):
+            raise BGZFError("BGZF block does not start with a 'BC' subfield")
+
+        # Skips any additional subfields following 'BC'
+        block = handle.read(fields[11] + 1 - _HEADER.size)
+        if len(block) != fields[11] + 1 - _HEADER.size:
+            raise BGZFError("Truncated BGZF block")
+
+        compressed = block[extra_len - 6:-_FOOTER.size]
+        checksum, length = _FOOTER.unpack(block[-_FOOTER.size:])
+        try:
+            data = zlib.decompress(compressed, -15)
+        except zlib.error, error:
+            raise BGZFError("Error decompressing BGZF block: %s" % (error,))
+
+        if (len(data) != length) or ((zlib.crc32(data) & 0xffffffff) != checksum):
+            raise BGZFError("Checksum / length mismatch in BGZF block")
+        elif data:
+            yield data
+
+
+def recompress(in_handle, out_handle, threads = 1, level = zlib.Z_DEFAULT_COMPRESSION):
+    """Reads a BGZF file (e.g. an uncompressed BAM file) from 'in_handle', and
+    writes it to 'out_handle', compressed using up to 'threads' threads."""
+    with BGZFWriter(out_handle, threads, level) as writer:
+        for block in read_blocks(in_handle):
+            writer.write(block)
+
+
+def start_compressor(threads, level = zlib.Z_DEFAULT_COMPRESSION):
+    """Redirects STDOUT to a pipe, read by a forked process which compresses
+    the uncompressed BAM written by pysam (mode "wbu") to the original STDOUT,
+    using multiple threads. pysam does not release the GIL while writing, and
+    a thread in this process could therefore not safely read from the pipe.
+    Returns the pid of the process (see 'wait_for_compressor')."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid: # pragma: no coverage
+        status = 1
+        try:
+            os.close(write_fd)
+            with os.fdopen(read_fd, "rb") as in_handle:
+                recompress(in_handle, sys.stdout, threads, level)
+            status = 0
+        except Exception:
+            sys.stderr.write("Error compressing BAM:\n%s" % (traceback.format_exc(),))
+        finally:
+            os._exit(status)
+
+    os.close(read_fd)
+    os.dup2(write_fd, sys.stdout.fileno())
+    os.close(write_fd)
+    return pid
+
+
+def wait_for_compressor(pid):
+    """Closes STDOUT, and waits for the process started by 'start_compressor';
+    returns 0 if the output was compressed successfully, and 1 otherwise."""
+    try:
+        # Closes the pipe, if not already closed by pysam
+        os.close(sys.stdout.fileno())
+    except OSError:
+        pass
+
+    _, status = os.waitpid(pid, 0)
+    return 1 if status else 0
@@ -26,6 +26,9 @@ import shutil
 import errno
 import bz2
 import gzip
+import mmap
+import hashlib
+import multiprocessing.pool
 
 from pypeline.common.utilities import safe_coerce_to_tuple, \
      safe_coerce_to_frozenset
@@ -72,10 +75,10 @@ def create_temp_dir(root):
 def missing_files(filenames):
     """Given a list of filenames, returns a list of those that
     does not exist. Note that this function does not differentiate
-    between files and folders."""
+    between files and folders. Uses the active FileStatusCache, if any."""
     result = []
     for filename in safe_coerce_to_frozenset(filenames):
-        if not os.path.exists(filename):
+        if try_stat(filename) is None:
             result.append(filename)
 
     return result
@@ -83,10 +86,14 @@ def missing_files(filenames):
 
 def modified_after(younger, older):
     """Returns true any of the files expected to be 'younger' have
-    been modified after any of the files expected to be 'older'."""
+    been modified after any of the files expected to be 'older'.
+    Uses the active FileStatusCache, if any."""
     def get_mtimes(filenames):
         for filename in filenames:
-            yield os.path.getmtime(filename)
+            stats = try_stat(filename)
+            if stats is None:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), filename)
+            yield stats.st_mtime
 
     younger_time = max(get_mtimes(safe_coerce_to_frozenset(younger)))
     older_time   = min(get_mtimes(safe_coerce_to_frozenset(older)))
@@ -94,23 +101,101 @@ def modified_after(younger, older):
     return younger_time > older_time
 
 
+class FileStatusCache:
+    """Cache of the results of calling 'os.stat' on files, used to ensure that
+    each file is only stat'ed once, when checking the state of many nodes
+    sharing the same files (e.g. reference sequences). The cache is used by
+    'missing_files' and 'modified_after' while the object is active, i.e.
+    within a 'with' statement. Entries for files that are (potentially)
+    modified must be removed using 'invalidate'.
+
+    Parameters:
+      threads -- Number of threads used by 'prefetch'; calls to 'os.stat'
+                 release the GIL, so multiple threads may be used to hide
+                 the latency of network file systems.
+    """
+    def __init__(self, threads = 1):
+        self._threads = threads
+        self._stats = {}
+        self._previous = None
+
+    def stat(self, filename):
+        """Returns the (cached) result of 'os.stat', or None if the
+        file does not exist (or is otherwise inaccessible)."""
+        try:
+            return self._stats[filename]
+        except KeyError:
+            stats = self._stats[filename] = _try_stat(filename)
+            return stats
+
+    def prefetch(self, filenames):
+        """Stat's all (uncached) files, using multiple threads if enabled."""
+        filenames = [filename for filename in set(filenames) if filename not in self._stats]
+        # Threads are not worth the overhead for small numbers of files
+        threads = min(self._threads, len(filenames) // _MIN_FILES_PER_THREAD)
+        if threads > 1:
+            pool = multiprocessing.pool.ThreadPool(threads)
+            try:
+                chunksize = max(1, len(filenames) // (threads * 4))
+                results = pool.map(_try_stat, filenames, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_try_stat, filenames)
+
+        self._stats.update(zip(filenames, results))
+
+    def invalidate(self, filenames):
+        """Removes cached results for the specified files."""
+        for filename in safe_coerce_to_frozenset(filenames):
+            self._stats.pop(filename, None)
+
+    def clear(self):
+        self._stats.clear()
+
+    def __enter__(self):
+        global _STATUS_CACHE # pylint: disable=W0603
+        self._previous, _STATUS_CACHE = _STATUS_CACHE, self
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        global _STATUS_CACHE # pylint: disable=W0603
+        _STATUS_CACHE, self._previous = self._previous, None
+
+
 def is_executable(filename):
     """Returns true if the specified file is an executable file."""
     return os.path.isfile(filename) and os.access(filename, os.X_OK)
 
 
+def find_executable(filename):
+    """Returns the path to an executable, if the filename refers to an
+    executable file by relative or full path, or if the executable is
+    found on the current PATH; otherwise None is returned. Searches of
+    the PATH are cached, using the (PATH, filename) pair as the key."""
+    if os.path.dirname(filename):
+        return filename if is_executable(filename) else None
+
+    key = (os.environ["PATH"], filename)
+    try:
+        return _EXECUTABLE_CACHE[key]
+    except KeyError:
+        result = None
+        for path in os.environ["PATH"].split(os.pathsep):
+            if is_executable(os.path.join(path, filename)):
+                result = os.path.join(path, filename)
+                break
+
+        _EXECUTABLE_CACHE[key] = result
+        return result
+
+
 def executable_exists(filename):
     """Returns true if the filename refers to an executable file,
     either by relative or full path, or if the executable is found
     on the current PATH."""
-    if os.path.dirname(filename):
-        return is_executable(filename)
-
-    for path in os.environ["PATH"].split(os.pathsep):
-        if is_executable(os.path.join(path, filename)):
-            return True
-
-    return False
+    return find_executable(filename) is not None
 
 
 def missing_executables(filenames):
@@ -185,6 +270,32 @@ def open_ro(filename):
         raise
 
 
+def try_stat(filename):
+    """Returns the result of calling 'os.stat' on the file, or None if the
+    file does not exist (or is otherwise inaccessible). The currently active
+    FileStatusCache is used, if any."""
+    if _STATUS_CACHE is None:
+        return _try_stat(filename)
+    return _STATUS_CACHE.stat(filename)
+
+
+def file_checksum(filename):
+    """Returns the MD5 hexdigest of the contents of a file. Checksums are
+    memoised using the device, inode, size, and mtime of the file, so that
+    a file is only read once, as long as it is not modified. Raises OSError
+    if the file does not exist."""
+    stats = try_stat(filename)
+    if stats is None:
+        raise OSError(errno.ENOENT, "No such file or directory", filename)
+
+    key = (stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime)
+    try:
+        return _CHECKSUM_CACHE[key]
+    except KeyError:
+        checksum = _CHECKSUM_CACHE[key] = _calculate_checksum(filename)
+        return checksum
+
+
 def try_remove(filename):
     """Tries to remove a file. Unlike os.remove, the function does not
     raise an exception if the file does not exist, but does raise
@@ -211,3 +322,37 @@ def describe_files(files):
     if len(paths) == 1:
         return "%i files in '%s'" % (len(files), paths.pop())
     return "%i files" % (len(files),)
+
+
+def _try_stat(filename):
+    try:
+        return os.stat(filename)
+    except OSError:
+        return None
+
+
+def _calculate_checksum(filename):
+    hasher = hashlib.md5()
+    with open(filename, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        if size:
+            # Memory-mapped to avoid copying (potentially huge) files
+            mapped = mmap.mmap(handle.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, _CHECKSUM_CHUNK_SIZE):
+                    hasher.update(buffer(mapped, offset, _CHECKSUM_CHUNK_SIZE))
+            finally:
+                mapped.close()
+    return hasher.hexdigest()
+
+
+# Cache of (PATH, filename) -> path / None, see find_executable
+_EXECUTABLE_CACHE = {}
+# Currently active FileStatusCache, see FileStatusCache.__enter__
+_STATUS_CACHE = None
+# Cache of (device, inode, size, mtime) -> MD5 hexdigest, see file_checksum
+_CHECKSUM_CACHE = {}
+# Number of bytes passed to the hash function at a time by file_checksum
+_CHECKSUM_CHUNK_SIZE = 16 * 1024 * 1024
+# Minimum number of files per thread used by FileStatusCache.prefetch
+_MIN_FILES_PER_THREAD = 256
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import itertools
+
+from pypeline.common.formats._common import FormatError
+
+
+class FASTQError(FormatError):
+    pass
+
+
+def read_fastq(lines):
+    """Parses 4-line FASTQ records found in a sequence of lines, and yields
+    each record as a single string, including the terminal newline. Only the
+    header ('@') and separator ('+') lines are validated."""
+    lines = iter(lines)
+    for header in lines:
+        record = [header]
+        record.extend(itertools.islice(lines, 3))
+        if len(record) != 4:
+            raise FASTQError("Truncated FASTQ record: %r" % (header.rstrip(),))
+        elif not (header.startswith("@") and record[2].startswith("+")):
+            raise FASTQError("Malformed FASTQ record: %r" % (header.rstrip(),))
+        elif not record[3].endswith("\n"):
+            record[3] += "\n"
+
+        yield "".join(record)
+
+
+def split_fastq(handles, outputs):
+    """Distributes the FASTQ records found in one or more files (e.g. the two
+    mates of a set of pair-ended reads) between N chunks. 'handles' is a list
+    of input file handles, and 'outputs' a list containing a list of N output
+    handles for each input handle. Records are assigned to chunks in a round-
+    robin fashion, reading each input in lock-step, so that mates are written
+    to the same chunk. Returns the number of records read from each input."""
+    assert len(handles) == len(outputs)
+
+    count = 0
+    records = itertools.izip_longest(*[read_fastq(handle) for handle in handles])
+    chunks = itertools.cycle(zip(*outputs))
+    for (mates, chunk) in itertools.izip(records, chunks):
+        if None in mates:
+            raise FASTQError("FASTQ files contain different numbers of records")
+
+        for (record, handle) in zip(mates, chunk):
+            handle.write(record)
+        count += 1
+
+    return count
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Bit-packed mappability tracks, as created by 'bam_mappability'.
+
+A track records one bit per position of each contig, set if the position is
+mappable. The file consists of a header (an 8 byte magic string, and the
+offset of the index), followed by the packed bits of each contig (most
+significant bit first, padded to whole bytes), and finally the index, which
+records the name, length and offset of each contig. Tracks are memory-mapped
+when read, and positions are looked up without decompressing any data.
+"""
+import os
+import mmap
+import struct
+
+import numpy
+
+from pypeline.common.formats._common import FormatError
+
+
+class MappabilityError(FormatError):
+    pass
+
+
+_MAGIC = "PYPMAP\x00\x01"
+_HEADER = struct.Struct("<8sQ")
+_INDEX_SIZE = struct.Struct("<I")
+_INDEX_NAME = struct.Struct("<H")
+_INDEX_ENTRY = struct.Struct("<QQ")
+# Value of the character used to mark uniquely mappable positions by GEM
+_GEM_MAPPABLE = ord("!")
+
+
+def is_mappability_track(filename):
+    """Returns true if the file is a bit-packed mappability track."""
+    with open(filename, "rb") as handle:
+        return handle.read(len(_MAGIC)) == _MAGIC
+
+
+def write_mappability(filename, contigs):
+    """Writes a mappability track, given a sequence of (name, mappability)
+    tuples, where 'mappability' is a sequence of booleans (e.g. an array)."""
+    with _MappabilityWriter(filename) as writer:
+        for (name, values) in contigs:
+            writer.add_contig(name)
+            writer.add_values(numpy.asarray(values, dtype = bool))
+
+
+def convert_gem_mappability(lines, filename):
+    """Converts the output of 'gem-mappability' into a mappability track; only
+    uniquely mappable positions (marked using '!') are considered mappable."""
+    in_seq = False
+    with _MappabilityWriter(filename) as writer:
+        for line in lines:
+            if line.startswith("~~"):
+                in_seq = False
+            elif line.startswith("~"):
+                in_seq = True
+                writer.add_contig(line[1:].strip())
+            elif in_seq:
+                values = numpy.fromstring(line.rstrip("\r\n"), dtype = numpy.uint8)
+                writer.add_values(values == _GEM_MAPPABLE)
+
+
+class MappabilityTrack:
+    def __init__(self, filename):
+        self._filename = filename
+        self._contigs = {}
+        self._handle = open(filename, "rb")
+        try:
+            self._mmap = mmap.mmap(self._handle.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._handle.close()
+            raise MappabilityError("Empty or invalid mappability track: %r" % (filename,))
+        self._data = numpy.frombuffer(self._mmap, dtype = numpy.uint8)
+
+        try:
+            self._read_index()
+        except (struct.error, MappabilityError):
+            self.close()
+            raise MappabilityError("Invalid mappability track: %r" % (filename,))
+
+
+    @property
+    def contigs(self):
+        """Returns a dictionary of contig names and lengths."""
+        return dict((name, length) for (name, (_, length)) in self._contigs.iteritems())
+
+
+    def is_mappable(self, contig, positions):
+        """Returns true if the (0-based) position on the contig is mappable; if
+        'positions' is a sequence of positions, an array of booleans is
+        returned instead. Raises KeyError for unknown contigs, and IndexError
+        for positions outside the contig."""
+        offset, length = self._contigs[contig]
+        if isinstance(positions, (int, long, numpy.integer)):
+            if not (0 <= positions < length):
+                raise IndexError("Position %i outside %r (length %i)"
+                                 % (positions, contig, length))
+            value = ord(self._mmap[offset + (positions >> 3)])
+            return bool(value & (128 >> (positions & 7)))
+
+        positions = numpy.asarray(positions, dtype = numpy.int64)
+        if len(positions) and ((positions.min() < 0) or (positions.max() >= length)):
+            raise IndexError("Position(s) outside %r (length %i)" % (contig, length))
+
+        values = self._data[offset + (positions >> 3)]
+        return (values & (128 >> (positions & 7))) != 0
+
+
+    def close(self):
+        if self._handle is not None:
+            self._data = None
+            self._mmap.close()
+            self._handle.close()
+            self._handle = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, _exc_type, _exc_value, _traceback):
+        self.close()
+
+
+    def _read_index(self):
+        magic, offset = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise MappabilityError("Not a mappability track")
+
+        count, = _INDEX_SIZE.unpack_from(self._mmap, offset)
+        offset += _INDEX_SIZE.size
+        for _ in xrange(count):
+            name_len, = _INDEX_NAME.unpack_from(self._mmap, offset)
+            offset += _INDEX_NAME.size
+            name = self._mmap[offset:offset + name_len]
+            offset += name_len
+            length, data_offset = _INDEX_ENTRY.unpack_from(self._mmap, offset)
+            offset += _INDEX_ENTRY.size
+
+            if data_offset + (length + 7) // 8 > len(self._mmap):
+                raise MappabilityError("Truncated mappability track")
+            self._contigs[name] = (data_offset, length)
+
+
+class _MappabilityWriter:
+    """Writes a track one contig at a time; values are packed as they are
+    added, keeping only the (at most 7) trailing bits in memory."""
+    def __init__(self, filename):
+        self._filename = filename
+        self._handle = open(filename, "wb")
+        self._handle.write(_HEADER.pack(_MAGIC, 0))
+        self._contigs = []
+        self._remaining = numpy.zeros(0, dtype = bool)
+
+
+    def add_contig(self, name):
+        self._flush()
+        if any((name == other) for (other, _, _) in self._contigs):
+            raise MappabilityError("Contig found multiple times: %r" % (name,))
+        self._contigs.append((name, 0, self._handle.tell()))
+
+
+    def add_values(self, values):
+        if not self._contigs:
+            raise MappabilityError("Values found before first contig")
+        name, length, offset = self._contigs[-1]
+        self._contigs[-1] = (name, length + len(values), offset)
+
+        values = numpy.concatenate((self._remaining, values))
+        npacked = len(values) - len(values) % 8
+        self._handle.write(numpy.packbits(values[:npacked]).tostring())
+        self._remaining = values[npacked:]
+
+
+    def close(self):
+        if self._handle is not None:
+            self._flush()
+            index_offset = self._handle.tell()
+            self._handle.write(_INDEX_SIZE.pack(len(self._contigs)))
+            for (name, length, offset) in self._contigs:
+                self._handle.write(_INDEX_NAME.pack(len(name)))
+                self._handle.write(name)
+                self._handle.write(_INDEX_ENTRY.pack(length, offset))
+
+            self._handle.seek(0)
+            self._handle.write(_HEADER.pack(_MAGIC, index_offset))
+            self._handle.close()
+            self._handle = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, _exc_value, _traceback):
+        if exc_type is None:
+            self.close()
+        elif self._handle is not None:
+            # Partial tracks are removed, as these would otherwise appear valid
+            self._handle.close()
+            self._handle = None
+            os.remove(self._filename)
+
+
+    def _flush(self):
+        if len(self._remaining):
+            self._handle.write(numpy.packbits(self._remaining).tostring())
+            self._remaining = numpy.zeros(0, dtype = bool)
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Identification of PCR duplicates among collapsed reads (see the script
+'bam_rmdup_collapsed'). Collapsed reads (names starting with 'M_') that are
+mapped to the same position, strand and with the same alignment length are
+considered duplicates; the read with the most common CIGAR string and the
+highest sum of base qualities is kept, and annotated with the number of
+duplicates (XP tag).
+"""
+
+
+_FILTERED_FLAGS  = 0x1   # PE reads
+_FILTERED_FLAGS |= 0x4   # Unmapped
+_FILTERED_FLAGS |= 0x100 # Secondary alignment
+_FILTERED_FLAGS |= 0x200 # Failed QC
+_FILTERED_FLAGS |= 0x800 # Chimeric alignment
+
+
+def rmdup_collapsed(reads, remove_duplicates = False):
+    """Takes a sequence of (coordinate sorted) reads, and yields the same reads
+    with PCR duplicates of collapsed reads marked (or removed). Reads that
+    are not candidates are yielded as they are read, while candidates are
+    buffered until all reads at the current position have been read."""
+    position = None
+    groups, keys = {}, []
+    for read in reads:
+        if position and ((read.tid, read.pos) != position):
+            for key in keys:
+                for consensus_read in _mark_duplicates(groups[key], remove_duplicates):
+                    yield consensus_read
+            groups, keys = {}, []
+            position = None
+
+        if (read.qual is None) or (read.flag & _FILTERED_FLAGS) or not read.qname.startswith("M_"):
+            yield read
+            continue
+
+        # Reads are grouped by strand and alignment length at each position;
+        # groups are processed in the order in which they were first seen
+        position = (read.tid, read.pos)
+        key = (read.alen << 1) | read.is_reverse
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = []
+            keys.append(key)
+        group.append(read)
+
+    for key in keys:
+        for consensus_read in _mark_duplicates(groups[key], remove_duplicates):
+            yield consensus_read
+
+
+def _mark_duplicates(reads, remove_duplicates):
+    consensus = _select_consensus(reads)
+    if len(reads) == 1:
+        consensus.is_duplicate = False
+        return reads
+
+    result = []
+    for read in reads:
+        read.is_duplicate = (read is not consensus)
+        if not (read.is_duplicate and remove_duplicates):
+            result.append(read)
+    return result
+
+
+def _select_consensus(reads):
+    """Selects the read with the highest sum of base qualities among the
+    reads with the most common CIGAR string; in case of ties, the CIGAR with
+    the shortest representation is used. The selected read is annotated with
+    the number of duplicates, including those recorded in previous runs."""
+    if len(reads) == 1:
+        consensus, candidates = reads[0], reads
+    else:
+        by_cigar = {}
+        for read in reads:
+            cigar = tuple(read.cigar)
+            group = by_cigar.get(cigar)
+            if group is None:
+                group = by_cigar[cigar] = []
+            group.append(read)
+
+        cigar = max(by_cigar, key = lambda cigar: (len(by_cigar[cigar]), -len(str(cigar)), cigar))
+        candidates = by_cigar[cigar]
+        # Qualities are summed by converting the string to an array of bytes
+        consensus = max(candidates, key = lambda read: sum(bytearray(read.qual)))
+
+    count = len(candidates)
+    for read in candidates:
+        for (key, value) in read.tags:
+            if key == "XP":
+                count += value
+
+    if consensus.tags is None:
+        consensus.tags = [("XP", count)]
+    else:
+        consensus.tags = consensus.tags + [("XP", count)]
+
+    return consensus
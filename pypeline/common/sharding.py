@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Functions for genotyping a BAM file one contig at a time, using multiple
+processes, and for merging the results (see 'bam_genotype_sharded').
+
+Contigs are not split into smaller regions, since the results of 'samtools
+mpileup' near the borders of a region may differ from those obtained when
+processing the entire contig (e.g. if the max per-file depth is reached), and
+the merged output is therefore identical to that of genotyping the full file.
+"""
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import multiprocessing.pool
+
+
+def read_contigs(filename):
+    """Returns a list of (name, length) tuples from a FASTA index (.fai)."""
+    contigs = []
+    with open(filename) as handle:
+        for line in handle:
+            if line.strip():
+                fields = line.split("\t")
+                contigs.append((fields[0], int(fields[1])))
+    return contigs
+
+
+def read_bed_contigs(filename):
+    """Returns the set of contigs found in a BED file."""
+    contigs = set()
+    with open(filename) as handle:
+        for line in handle:
+            if line.strip() and not line.startswith(("#", "track", "browser")):
+                contigs.add(line.split(None, 1)[0])
+    return contigs
+
+
+def genotype_contigs(pileup_call, genotype_call, contigs, processes, temp_root, output):
+    """Runs '$pileup_call -r $contig | $genotype_call' for each contig, using up
+    to 'processes' pipelines at once, starting with the longest contigs. The
+    resulting VCFs are written to 'output' in the order of the contigs, using
+    the header of the first VCF only. The region is specified as the first
+    option to 'pileup_call', which is assumed to be a call to mpileup (e.g.
+    'samtools mpileup ...'). Returns true if every pipeline succeeded."""
+    temp_root = tempfile.mkdtemp(prefix = "genotype_", dir = temp_root)
+    try:
+        jobs = []
+        for (index, (contig, length)) in enumerate(contigs):
+            filename = os.path.join(temp_root, "%06i.vcf" % (index,))
+            call = list(pileup_call[:2]) + ["-r", contig] + list(pileup_call[2:])
+            jobs.append((length, call, list(genotype_call), filename))
+        jobs.sort(key = lambda job: -job[0])
+
+        failed = []
+        def _run_job(job):
+            if not failed:
+                if not _run_pipeline(*job[1:]):
+                    failed.append(job)
+
+        pool = multiprocessing.pool.ThreadPool(max(1, min(processes, len(jobs))))
+        try:
+            pool.map(_run_job, jobs, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        if failed:
+            return False
+
+        concatenate_vcfs([os.path.join(temp_root, "%06i.vcf" % (index,))
+                          for index in range(len(contigs))], output)
+        return True
+    finally:
+        shutil.rmtree(temp_root)
+
+
+def concatenate_vcfs(filenames, output):
+    """Writes the header of the first VCF file, followed by the records of
+    each file, to 'output'."""
+    for (index, filename) in enumerate(filenames):
+        with open(filename) as handle:
+            for line in handle:
+                if index and line.startswith("#"):
+                    continue
+                output.write(line)
+
+
+def _run_pipeline(pileup_call, genotype_call, filename):
+    with open(filename, "w") as output:
+        pileup = subprocess.Popen(pileup_call,
+                                  stdout    = subprocess.PIPE,
+                                  close_fds = True)
+        genotype = subprocess.Popen(genotype_call,
+                                    stdin     = pileup.stdout,
+                                    stdout    = output,
+                                    close_fds = True)
+        pileup.stdout.close()
+
+        return_codes = (genotype.wait(), pileup.wait())
+        if any(return_codes):
+            sys.stderr.write("ERROR: Error genotyping region; return-codes were %s:\n" % (return_codes,))
+            sys.stderr.write("\t- Command: %s | %s\n" % (" ".join(pileup_call), " ".join(genotype_call)))
+            return False
+    return True
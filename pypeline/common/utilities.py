@@ -20,11 +20,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import os
 import types
 import pickle
 import cPickle
 import itertools
 import binascii
+import traceback
 
 
 def _safe_coerce(cls):
@@ -171,3 +173,61 @@ def fast_pickle_test(obj):
     except (TypeError, cPickle.PicklingError):
         pickle.dumps(obj)
         assert False # pragma: no coverage
+
+
+def fork_map(func, items, processes):
+    """Returns [func(item) for item in items], with items processed using (at
+    most) 'processes' processes, created using os.fork. Unlike with
+    multiprocessing.Pool, this may be used in daemonic processes, such as
+    those in which nodes are run. Items are distributed round-robin, and the
+    results (which must be picklable) are returned in the original order.
+    Exceptions raised by 'func' in a forked process are re-raised as a
+    RuntimeError, containing the original backtrace."""
+    items = list(items)
+    processes = max(1, min(processes, len(items)))
+    results, children = [None] * len(items), []
+    try:
+        for offset in range(1, processes):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if not pid: # pragma: no coverage
+                os.close(read_fd)
+                _fork_map_child(func, items[offset::processes], write_fd)
+
+            os.close(write_fd)
+            children.append((offset, pid, os.fdopen(read_fd, "rb")))
+
+        results[::processes] = [func(item) for item in items[::processes]]
+    finally:
+        errors = []
+        for (offset, pid, handle) in children:
+            data = handle.read()
+            handle.close()
+            status, result = (False, "Process %i died\n" % (pid,))
+            if data:
+                status, result = cPickle.loads(data)
+            os.waitpid(pid, 0)
+
+            if status:
+                results[offset::processes] = result
+            else:
+                errors.append(result)
+
+    if errors:
+        raise RuntimeError("Error in forked process:\n" + errors[0])
+
+    return results
+
+
+def _fork_map_child(func, items, write_fd): # pragma: no coverage
+    status = 1
+    try:
+        with os.fdopen(write_fd, "wb") as handle:
+            try:
+                result = (True, [func(item) for item in items])
+            except Exception:
+                result = (False, traceback.format_exc())
+            handle.write(cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL))
+        status = 0
+    finally:
+        os._exit(status)
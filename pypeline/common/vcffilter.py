@@ -22,13 +22,26 @@
 #
 from __future__ import with_statement
 
+import os
+import re
 import sys
+import gzip
+import heapq
+import bisect
+import shutil
 import optparse
+import tempfile
+import itertools
 import collections
+import multiprocessing
 
+import numpy
 import pysam
 
 import pypeline.common.vcfwrap as vcfwrap
+from pypeline.common.formats.mappability import \
+     MappabilityTrack, \
+     is_mappability_track
 
 
 _INF = float("inf")
@@ -36,6 +49,13 @@ _INF = float("inf")
 _CHUNK_SIZE = 10000
 # Number of bases to cache when checking mappability
 _MAPPABILITY_CACHE  = 500
+# Start-of-read (with mapping quality) and end-of-read marks in pileups
+_PILEUP_READ_MARKS = re.compile(r"\^.|\$", re.DOTALL)
+# Indels in pileups, e.g. '+2AC' or '-1T'
+_PILEUP_INDEL = re.compile(r"[+-][0-9]+")
+# Properties (INFO fields) used by _filter_by_properties
+_PROPERTIES_REGEXP = re.compile("(?:^|;)(DP|MQ|PV4|DP4)=([^;]*)")
+_Properties = collections.namedtuple("_Properties", ["qual", "depth", "mapq", "pv4", "dp4", "variants"])
 
 
 def add_varfilter_options(parser):
@@ -82,20 +102,81 @@ def add_varfilter_options(parser):
 
 
 def filter_vcfs(options, vcfs):
-    vcfs  = iter(vcfs)
-    chunk = collections.deque()
     with Mappability(options.filter_by_mappability) as mappability:
         filename = options.pileup
         min_freq = options.min_allele_frequency
 
         with AlleleFrequencies(filename, min_freq) as frequencies:
-            while _read_chunk(vcfs, chunk):
-                chunk = _filter_chunk(options, chunk, mappability, frequencies)
-                for vcf in _trim_chunk(options, chunk):
-                    if vcf.filter == ".":
-                        vcf.filter = "PASS"
+            # Each contig is filtered independently of neighbouring contigs,
+            # which allows contigs to be filtered in parallel (see
+            # filter_vcf_file), without affecting the results
+            for (_, contig_vcfs) in itertools.groupby(vcfs, _get_contig):
+                chunk = collections.deque()
+                while _read_chunk(contig_vcfs, chunk):
+                    chunk = _filter_chunk(options, chunk, mappability, frequencies)
+                    for vcf in _trim_chunk(options, chunk):
+                        if vcf.filter == ".":
+                            vcf.filter = "PASS"
+
+                        yield vcf
+
+
+def filter_vcf_file(options, filename, processes, output = sys.stdout, temp_root = None):
+    """Filters a bgzipped and tabix indexed VCF file, writing the header and
+    the filtered records to 'output'. Contigs are filtered using (at most)
+    'processes' processes, and written in the order in which they are found in
+    the file; the output is identical to that produced using filter_vcfs.
+    Filtered contigs are stored in a temporary folder in 'temp_root' (if not
+    set, the default location used by the 'tempfile' module)."""
+    with gzip.open(filename) as handle:
+        for line in handle:
+            if not line.startswith("#"):
+                break
+            output.write(line)
+
+    tabixfile = pysam.Tabixfile(filename)
+    try:
+        contigs = list(tabixfile.contigs)
+    finally:
+        tabixfile.close()
+
+    temp_root = tempfile.mkdtemp(prefix = "vcf_filter_", dir = temp_root)
+    jobs = [(options, filename, contig, os.path.join(temp_root, "%i.vcf" % (index,)))
+            for (index, contig) in enumerate(contigs)]
+
+    pool = multiprocessing.Pool(max(1, min(processes, len(jobs))))
+    try:
+        for temp_filename in pool.imap(_filter_contig, jobs):
+            with open(temp_filename) as handle:
+                shutil.copyfileobj(handle, output)
+            os.remove(temp_filename)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        shutil.rmtree(temp_root)
+
+
+def _filter_contig(args):
+    """Filters the records of a single contig in a tabix indexed VCF file,
+    writing the results to a temporary file; used by filter_vcf_file."""
+    (options, filename, contig, temp_filename) = args
+    tabixfile = pysam.Tabixfile(filename)
+    try:
+        with open(temp_filename, "w") as handle:
+            vcfs = tabixfile.fetch(contig, parser = pysam.asVCF())
+            for vcf in filter_vcfs(options, vcfs):
+                handle.write("%s\n" % (vcf,))
+    finally:
+        tabixfile.close()
+
+    return temp_filename
 
-                    yield vcf
+
+def _get_contig(vcf):
+    return vcf.contig
 
 
 class Mappability:
@@ -105,11 +186,15 @@ class Mappability:
         self._start  = -1
         self._end    = -1
 
-        if filename is not None:
+        if filename is None:
+            self.is_mappable = self._is_always_mappable
+        elif is_mappability_track(filename):
+            self._handle = MappabilityTrack(filename)
+            self.is_mappable = self._handle.is_mappable
+        else:
+            # Tracks created by older versions of 'bam_mappability'
             self._handle = pysam.Fastafile(filename)
             self.is_mappable = self._is_mappable
-        else:
-            self.is_mappable = self._is_always_mappable
 
 
     def _is_always_mappable(self, contig, position):
@@ -150,6 +235,12 @@ class AlleleFrequencies:
         assert min_freq >= 0
         self._min_freq = min_freq
         self._handle   = None
+        # Sequential cursor in the pileup, and counts for the current contig
+        self._contig   = None
+        self._lines    = None
+        self._position = -1
+        self._fields   = None
+        self._cache    = {}
 
         if filename and min_freq:
             self._handle = pysam.Tabixfile(filename)
@@ -196,46 +287,75 @@ class AlleleFrequencies:
         self.close()
 
     def _fetch(self, contig, position):
-        fetched = False
-        for line in self._handle.fetch(contig, position, position + 1):
-            fields, fetched = line.split("\t"), True
+        """Returns allele counts for a (0-based) position. Positions are
+        expected to be (mostly) requested in order, and the pileup is therefore
+        read sequentially, instead of using a tabix lookup for every site."""
+        if contig != self._contig:
+            self._contig = contig
+            self._lines  = None
+            self._cache  = {}
+
+        counts = self._cache.get(position)
+        if counts is None:
+            fields = self._read_fields(contig, position + 1)
+            counts = self._cache[position] = _count_pileup_bases(fields)
+        return counts
+
+    def _read_fields(self, contig, position):
+        if (self._lines is None) or (position < self._position):
+            # Seek to the first record at or after the (1-based) position
+            self._lines    = self._handle.fetch(contig, position - 1)
+            self._position = -1
+
+        while self._position < position:
+            line = next(self._lines, None)
+            if line is None:
+                self._position, self._fields = _INF, None
+                break
+
+            fields = line.split("\t")
             assert len(fields) == 6
-            break
+            if fields[0] != contig:
+                raise RuntimeError("Got wrong record (%s:%i vs %s:%s), is index corrupt?" \
+                                   % (contig, position, fields[0], fields[1]))
+            self._position, self._fields = int(fields[1]), fields
 
-        if not fetched:
+        if self._position != position:
             raise RuntimeError("Pileup did not contain position %s:%i, please rebuild." \
-                               % (contig, position + 1))
-        elif (fields[0] != contig) or (int(fields[1]) != position + 1):
-            raise RuntimeError("Got wrong record (%s:%i vs %s:%s), is index corrupt?" \
-                               % (contig, position + 1, fields[0], fields[1]))
-
-        counts = {}
-        bases  = list(fields[4][::-1].upper())
-        ref    = fields[2]
-        while bases:
-            current = bases.pop()
-            if current in "ACGTN":
-                counts[current] = counts.get(current, 0) + 1
-            elif current in ",.":
-                counts[ref] = counts.get(ref, 0) + 1
-            elif current in "+-":
-                indel_length = [current]
-                while bases[-1].isdigit():
-                    indel_length.append(bases.pop())
-                indel_length = int("".join(indel_length))
-
-                for _ in xrange(abs(indel_length)):
-                    bases.pop()
-
-                counts[indel_length] = counts.get(indel_length, 0) + 1
-            elif current == "*":
-                counts[-1] = counts.get(-1, 0) + 1
-            elif current == "^":
-                bases.pop()
-            elif current != "$":
-                raise RuntimeError("Error parsing pileup (unexpected char '%s'): %s" \
-                                       % (current, repr(line)))
-        return counts
+                               % (contig, position))
+        return self._fields
+
+
+def _count_pileup_bases(fields):
+    """Counts the bases / indels in the base column of a pileup record; indels
+    are counted by their (signed) length, and deletions ('*') as -1."""
+    ref    = fields[2]
+    bases  = _PILEUP_READ_MARKS.sub("", fields[4]).upper()
+    counts = collections.defaultdict(int)
+
+    # Indels are removed first, as their sequences would otherwise be counted
+    remaining, last = [], 0
+    for match in _PILEUP_INDEL.finditer(bases):
+        if match.start() < last:
+            continue # Digits in the sequence of an indel
+
+        remaining.append(bases[last:match.start()])
+        counts[int(match.group())] += 1
+        last = match.end() + abs(int(match.group()))
+    remaining.append(bases[last:])
+    remaining = "".join(remaining)
+
+    for base in "ACGTN":
+        counts[base] += remaining.count(base)
+    counts[ref] += remaining.count(",") + remaining.count(".")
+    counts[-1]  += remaining.count("*")
+
+    unexpected = remaining.translate(None, "ACGTN,.*")
+    if unexpected:
+        raise RuntimeError("Error parsing pileup (unexpected char '%s'): %s" \
+                           % (unexpected[0], repr("\t".join(fields))))
+
+    return dict((key, count) for (key, count) in counts.iteritems() if count)
 
 
 def _read_chunk(vcfs, chunk):
@@ -276,29 +396,67 @@ def _trim_chunk(options, chunk):
 
 
 def _group_indels_near_position(indels, distance):
-    """Returns a dictionary of positions that are either directly covered by, or
-    adjacent to indels, given some arbitrary distance. For each position, a list
-    of adjacent/overlapping indels are provided."""
-    positions = collections.defaultdict(list)
+    """Returns a sorted list of non-overlapping, inclusive (start, end)
+    intervals, covering the positions that are either directly covered by, or
+    adjacent to indels, given some arbitrary distance."""
+    merged = []
     if not distance:
-        return positions
+        return merged
+
+    for (start, end) in sorted(_get_indel_interval(vcf, distance) for vcf in indels):
+        if start > end:
+            continue
+        elif merged and (start <= merged[-1][1] + 1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
 
-    for vcf in indels:
-        # The number of bases covered (excluding the prefix)
-        # For ambigious indels (e.g. in low complexity regions), this ensures
-        # that the entire region is considered. Note that we do not need to
-        # consider the alternative sequence(s)
-        length = len(vcf.ref) - 1
+    return merged
 
-        # Inclusive start/end positions for bases that should be blacklisted
-        # Note that vcf.pos is the base just before the insertion/deletion
-        start = vcf.pos + 1 - distance
-        end   = vcf.pos + 1 + distance + length
 
-        for position in xrange(start, end + 1):
-            positions[position].append(vcf)
+def _get_indel_interval(vcf, distance):
+    """Returns the inclusive start/end positions of bases that should be
+    blacklisted, given a minimum distance to the indel."""
+    # The number of bases covered (excluding the prefix)
+    # For ambigious indels (e.g. in low complexity regions), this ensures
+    # that the entire region is considered. Note that we do not need to
+    # consider the alternative sequence(s)
+    length = len(vcf.ref) - 1
 
-    return positions
+    # Note that vcf.pos is the base just before the insertion/deletion
+    return (vcf.pos + 1 - distance, vcf.pos + 1 + distance + length)
+
+
+def _select_indels_near_indels(indels, distance):
+    """Returns the indels which are within some arbitrary distance of a better
+    indel (see _select_best_indel). Indels are processed in order of position,
+    while keeping a heap of indels that are near the current position; indels
+    which are no longer near the current position are removed from the heap
+    once they are the best candidate."""
+    filtered = []
+    if not distance:
+        return filtered
+
+    intervals = sorted(_get_indel_interval(vcf, distance) + (index,)
+                       for (index, vcf) in enumerate(indels))
+    intervals.reverse()
+
+    candidates = [] # Heap of (-quality, position, index, end)
+    for (index, vcf) in sorted(enumerate(indels), key = lambda pair: pair[1].pos):
+        position = vcf.pos + 1
+        while intervals and (intervals[-1][0] <= position):
+            (start, end, other) = intervals.pop()
+            if start <= end:
+                other_vcf = indels[other]
+                heapq.heappush(candidates, (-float(other_vcf.qual), other_vcf.pos, other, end))
+
+        while candidates and (candidates[0][-1] < position):
+            heapq.heappop(candidates)
+
+        if candidates and (candidates[0][2] != index):
+            filtered.append(vcf)
+
+    return filtered
 
 
 def _select_best_indel(indels):
@@ -321,92 +479,154 @@ def _filter_by_indels(options, chunk):
     no unique highest QUAL score exists, an arbitrary indel is retained
     among those indels with the highest QUAL score. SNPs are filtered
     based on prefiltered Indels."""
-    indels = set([vcf for vcf in chunk if vcfwrap.is_indel(vcf)])
+    indels = [vcf for vcf in chunk if vcfwrap.is_indel(vcf)]
 
     distance_between = options.min_distance_between_indels
-    indel_blacklist  = _group_indels_near_position(indels, distance_between)
-    distance_to      = options.min_distance_to_indels
-    snp_blacklist    = _group_indels_near_position(indels, distance_to)
+    for vcf in _select_indels_near_indels(indels, distance_between):
+        _mark_as_filtered(vcf, "W=%i" % distance_between)
 
+    distance_to   = options.min_distance_to_indels
+    snp_blacklist = _group_indels_near_position(indels, distance_to)
+    starts        = [start for (start, _) in snp_blacklist]
     for vcf in chunk:
-        if vcfwrap.is_indel(vcf):
-            blacklisted = indel_blacklist.get(vcf.pos + 1, [vcf])
-            if vcf is not _select_best_indel(blacklisted):
-                _mark_as_filtered(vcf, "W=%i" % distance_between)
-        elif (vcf.alt != ".") and (vcf.pos in snp_blacklist):
+        if (vcf.alt != ".") and not vcfwrap.is_indel(vcf):
             # TODO: How to handle heterozygous SNPs near
-            _mark_as_filtered(vcf, "w=%i" % distance_to)
+            index = bisect.bisect(starts, vcf.pos) - 1
+            if (index >= 0) and (vcf.pos <= snp_blacklist[index][1]):
+                _mark_as_filtered(vcf, "w=%i" % distance_to)
 
 
 def _filter_by_properties(options, vcfs, mappability, frequencies):
     """Filters a list of SNPs/indels based on the various properties recorded in
     the info column, and others. This mirrors most of the filtering carried out
-    by vcfutils.pl varFilter."""
-    for vcf in vcfs:
-        if float(vcf.qual) < options.min_quality:
-            _mark_as_filtered(vcf, "q=%i" % options.min_quality)
+    by vcfutils.pl varFilter. Properties are parsed into columns for the entire
+    list (see _parse_properties), and thresholds are evaluated for all records
+    at once; filters are then added to each record in a fixed order."""
+    if not vcfs:
+        return
 
-        properties = {}
-        for field in vcf.info.split(";"):
-            if "=" in field:
-                key, value = field.split("=")
+    columns = _parse_properties(vcfs)
+    filters = [] # List of (mask, filter_name)
+    filters.append((columns.qual < options.min_quality,
+                    "q=%i" % options.min_quality))
+
+    too_shallow = options.min_read_depth > columns.depth
+    filters.append((too_shallow, "d=%i" % options.min_read_depth))
+    filters.append((~too_shallow & (options.max_read_depth < columns.depth),
+                    "D=%i" % options.max_read_depth))
+
+    # Missing MQ / PV4 values are NaN, which are never smaller than the cutoffs
+    with numpy.errstate(invalid = "ignore"):
+        filters.append((columns.mapq < options.min_mapping_quality,
+                        "Q=%i" % options.min_mapping_quality))
+        for (index, (name, cutoff)) in enumerate((("1", options.min_strand_bias),
+                                                  ("2", options.min_baseq_bias),
+                                                  ("3", options.min_mapq_bias),
+                                                  ("4", options.min_end_distance_bias))):
+            filters.append((columns.pv4[:, index] < cutoff, "%s=%e" % (name, cutoff)))
+
+    # Only SNPs (non-reference sites) are filtered using the remaining filters;
+    # these require per-record lookups, and are recorded as lists of indices
+    unmappable, ambigious, homozygous, het_ref, het_other = [], [], [], [], []
+    genotypes = {}
+    for index in columns.variants.nonzero()[0]:
+        vcf = vcfs[index]
+        if not mappability.is_mappable(vcf.contig, vcf.pos):
+            unmappable.append(index)
+
+        ml_genotype = genotypes[index] = vcfwrap.get_ml_phenotype(vcf)
+        if ml_genotype[0] != ml_genotype[1]:
+            if vcf.contig in options.homozygous_chromosome:
+                homozygous.append(index)
+
+            if vcf.ref in ml_genotype:
+                het_ref.append(index)
             else:
-                key, value = field, None
-            properties[key] = value
-
-        read_depth = float(properties["DP"])
-        if options.min_read_depth > read_depth:
-            _mark_as_filtered(vcf, "d=%i" % options.min_read_depth)
-        elif options.max_read_depth < read_depth:
-            _mark_as_filtered(vcf, "D=%i" % options.max_read_depth)
-
-        if "MQ" in properties:
-            if float(properties["MQ"]) < options.min_mapping_quality:
-                _mark_as_filtered(vcf, "Q=%i" % options.min_mapping_quality)
-
-        if "PV4" in properties:
-            pv4 = [float(value) for value in properties["PV4"].split(",")]
-            if (pv4[0] < options.min_strand_bias):
-                _mark_as_filtered(vcf, "1=%e" % options.min_strand_bias)
-            if (pv4[1] < options.min_baseq_bias):
-                _mark_as_filtered(vcf, "2=%e" % options.min_baseq_bias)
-            if  (pv4[2] < options.min_mapq_bias):
-                _mark_as_filtered(vcf, "3=%e" % options.min_mapq_bias)
-            if (pv4[3] < options.min_end_distance_bias):
-                _mark_as_filtered(vcf, "4=%e" % options.min_end_distance_bias)
-
-        if vcf.alt != ".":
-            # Only filter SNPs?
-            if not mappability.is_mappable(vcf.contig, vcf.pos):
-                _mark_as_filtered(vcf, "m")
-
-            ref_fw, ref_rev, alt_fw, alt_rev = map(int, properties["DP4"].split(","))
-            if (alt_fw + alt_rev) < options.min_num_alt_bases:
-                _mark_as_filtered(vcf, "a=%i" % options.min_num_alt_bases)
-
-            ml_genotype = vcfwrap.get_ml_phenotype(vcf)
-            if (ml_genotype == ("N", "N")) and not options.keep_ambigious_genotypes:
-                # No most likely genotype
-                _mark_as_filtered(vcf, "k")
-
-            if (ml_genotype[0] != ml_genotype[1]):
-                if vcf.contig in options.homozygous_chromosome:
-                    _mark_as_filtered(vcf, "HET")
-
-                # Filter by frequency of minor allele
-                if vcf.ref in ml_genotype:
-                    n_minor = min(ref_fw + ref_rev, alt_fw + alt_rev)
-                    n_major = max(ref_fw + ref_rev, alt_fw + alt_rev)
-
-                    if (n_minor / float(n_minor + n_major)) < options.min_allele_frequency:
-                        _mark_as_filtered(vcf, "f=%.4f" % options.min_allele_frequency)
-                else:
-                    state = frequencies.frequency_is_valid(vcf.contig, vcf.pos, vcf.ref, *ml_genotype)
-                    if state is frequencies.INVALID:
-                        _mark_as_filtered(vcf, "f=%.4f" % options.min_allele_frequency)
-                    elif state is frequencies.NA:
-                        if _mark_as_filtered(vcf, "F=%.4f" % options.min_allele_frequency):
-                            sys.stderr.write("WARNING: Could not determine allele-counts for SNP at %s:%s, filtering ...\n" % (vcf.contig, vcf.pos + 1))
+                het_other.append(index)
+        elif ml_genotype == ("N", "N"):
+            ambigious.append(index)
+
+    ref_fw, ref_rev, alt_fw, alt_rev = columns.dp4[het_ref].T
+    n_ref, n_alt = ref_fw + ref_rev, alt_fw + alt_rev
+    below_min_freq = numpy.minimum(n_ref, n_alt) < (n_ref + n_alt) * options.min_allele_frequency
+
+    filters.append((unmappable, "m"))
+    filters.append((columns.variants & (columns.dp4[:, 2] + columns.dp4[:, 3] < options.min_num_alt_bases),
+                    "a=%i" % options.min_num_alt_bases))
+    if not options.keep_ambigious_genotypes:
+        # No most likely genotype
+        filters.append((ambigious, "k"))
+    filters.append((homozygous, "HET"))
+
+    # Filter heterozygous sites by frequency of minor allele; for multi-allelic
+    # sites, allele frequencies are determined using the pileup (if any)
+    min_freq_filter = "f=%.4f" % options.min_allele_frequency
+    filters.append((numpy.array(het_ref, dtype = int)[below_min_freq], min_freq_filter))
+    for index in het_other:
+        vcf = vcfs[index]
+        state = frequencies.frequency_is_valid(vcf.contig, vcf.pos, vcf.ref, *genotypes[index])
+        if state is frequencies.INVALID:
+            filters.append(([index], min_freq_filter))
+        elif state is frequencies.NA:
+            filters.append(([index], "F=%.4f" % options.min_allele_frequency))
+
+    _apply_filters(vcfs, filters)
+
+
+def _parse_properties(vcfs):
+    """Returns the properties used by _filter_by_properties as columns (NumPy
+    arrays), with a row per VCF record: QUAL, DP, MQ, PV4 (4 columns), DP4 (4
+    columns), and whether or not the record is a variant (ALT is not '.').
+    Missing MQ and PV4 values are represented as NaN, and DP4 as zeros."""
+    depths, mapqs, pv4s, dp4s = [], [], [], []
+    for vcf in vcfs:
+        properties = dict(_PROPERTIES_REGEXP.findall(vcf.info))
+
+        depths.append(properties["DP"])
+        mapqs.append(properties.get("MQ", "nan"))
+        pv4s.append(properties.get("PV4", "nan,nan,nan,nan"))
+        dp4s.append(properties.get("DP4", "0,0,0,0"))
+
+    return _Properties(qual     = _to_array([vcf.qual for vcf in vcfs], float),
+                       depth    = _to_array(depths, float),
+                       mapq     = _to_array(mapqs, float),
+                       pv4      = _to_array(pv4s, float, 4),
+                       dp4      = _to_array(dp4s, int, 4),
+                       variants = numpy.array([(vcf.alt != ".") for vcf in vcfs], dtype = bool))
+
+
+def _to_array(values, dtype, ncolumns = 1):
+    """Converts a list of strings, each containing 'ncolumns' comma separated
+    values, into an array with a row per string (if ncolumns > 1)."""
+    result = numpy.fromstring(",".join(values), dtype = dtype, sep = ",")
+    if len(result) != len(values) * ncolumns:
+        # Parsing stops silently at invalid values; re-parse to raise ValueError
+        result = numpy.array([dtype(value) for text in values for value in text.split(",")])
+        if len(result) != len(values) * ncolumns:
+            raise ValueError("Expected %i value(s) per record" % (ncolumns,))
+
+    if ncolumns > 1:
+        return result.reshape(-1, ncolumns)
+    return result
+
+
+def _apply_filters(vcfs, filters):
+    """Marks records as filtered, given a list of (mask, filter_name) pairs;
+    masks may be boolean arrays, or sequences of indices. Filters are added to
+    each record in the same order as they are listed."""
+    filtered = collections.defaultdict(list)
+    for (mask, filter_name) in filters:
+        if isinstance(mask, numpy.ndarray) and mask.dtype == bool:
+            mask = mask.nonzero()[0]
+
+        for index in mask:
+            filtered[index].append(filter_name)
+
+    for (index, filter_names) in sorted(filtered.iteritems()):
+        vcf = vcfs[index]
+        for filter_name in filter_names:
+            if _mark_as_filtered(vcf, filter_name) and filter_name.startswith("F="):
+                sys.stderr.write("WARNING: Could not determine allele-counts for SNP at %s:%s, filtering ...\n" % (vcf.contig, vcf.pos + 1))
 
 
 def _filter_chunk(options, chunk, mappability, frequencies):
@@ -106,19 +106,19 @@ def get_ml_phenotype(vcf):
     genotypes.extend(vcf.ref.split(","))
     genotypes.extend(vcf.alt.split(","))
 
-    PL = map(int, get_format(vcf)["PL"].split(","))
+    PL = map(int, _get_format_field(vcf, "PL").split(","))
 
     expected_length = (len(genotypes) * (len(genotypes) + 1)) // 2
     if len(PL) != expected_length:
         raise ValueError("Unexpected number of PL values, expected %i, found %i!" \
                              % (expected_length, len(PL)))
 
-    if PL.count(min(PL)) > 1:
+    min_PL = min(PL)
+    if PL.count(min_PL) > 1:
         # No single most likely genotype
         return ("N", "N")
 
-    most_likely = min(xrange(len(PL)), key=PL.__getitem__)
-    prefix, postfix = _genotype_indices[most_likely]
+    prefix, postfix = _genotype_indices[PL.index(min_PL)]
 
     return (genotypes[prefix], genotypes[postfix])
 
@@ -126,3 +126,18 @@ def get_ml_phenotype(vcf):
 def get_format(vcf, sample = 0):
     return dict(zip(vcf.format.split(":"),
                     vcf[0].split(":")))
+
+
+def _get_format_field(vcf, field):
+    """Equivalent to get_format(vcf)[field], but caches the index of the field
+    for each distinct format string, which are typically shared by all records."""
+    key = (vcf.format, field)
+    index = _format_indices.get(key)
+    try:
+        if index is None:
+            index = _format_indices[key] = vcf.format.split(":").index(field)
+        return vcf[0].split(":")[index]
+    except (ValueError, IndexError):
+        raise KeyError(field)
+
+_format_indices = {}
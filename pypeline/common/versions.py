@@ -20,11 +20,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import os
 import re
 import types
+import cPickle
+import threading
 import subprocess
 import collections
+import multiprocessing.pool
 
+import pypeline.common.fileutils as fileutils
 from pypeline.common.utilities import safe_coerce_to_tuple, try_cast
 
 
@@ -32,6 +37,17 @@ from pypeline.common.utilities import safe_coerce_to_tuple, try_cast
 _CALL_CACHE = {}
 # Cache used to store Requirement object
 _REQUIREMENT_CACHE = {}
+# On-disk cache of the output of cmd-line calls, see _run_cached; set to
+# None to disable. Entries are keyed by the paths and mtimes of the files
+# involved, and are therefore invalidated when executables are updated.
+CACHE_FILENAME = os.path.join(os.path.expanduser("~"), ".pypeline", "versions.cache")
+# Environmental variables which may affect the output of cmd-line calls, and
+# which are therefore included in the keys of the on-disk cache
+_CACHE_ENVIRON = ("PATH", "LD_LIBRARY_PATH", "PYTHONPATH", "JAVA_HOME", "CLASSPATH")
+# Contents of the on-disk cache, loaded on demand
+_DISK_CACHE = None
+# Lock for caches, since calls may be carried out concurrently (see prefetch)
+_CACHE_LOCK = threading.Lock()
 
 
 class VersionRequirementError(RuntimeError):
@@ -94,7 +110,7 @@ class RequirementObj:
     @property
     def version(self):
         if self._version is None:
-            output = _do_call(self._call)
+            output = _do_call(self._call, self._rege.search)
             match = self._rege.search(output)
             if not match:
                 raise VersionRequirementError("Could not determine version of '%s', searching for %s: %s" \
@@ -111,6 +127,24 @@ class RequirementObj:
             self._done = True
 
 
+def prefetch(requirements, threads = 4):
+    """Determines the versions for a set of requirements concurrently, using
+    a pool of threads, in order to avoid waiting for each call in turn. The
+    results are cached, and any errors are raised once a requirement is
+    checked, rather than here. Objects other than RequirementObj are ignored.
+    """
+    requirements = [requirement for requirement in requirements
+                    if isinstance(requirement, RequirementObj)]
+    threads = min(threads, len(requirements))
+    if threads > 1:
+        pool = multiprocessing.pool.ThreadPool(threads)
+        try:
+            pool.map(_try_get_version, requirements)
+        finally:
+            pool.close()
+            pool.join()
+
+
 class _Check:
     def __init__(self, name, *version):
         self._version = tuple(version)
@@ -226,26 +260,107 @@ class Or(_Check):
 
 
 def _run(call):
+    """Returns a tuple containing the output of the call (stdout and stderr),
+    and a boolean which is false if the call could not be carried out."""
     try:
         proc = subprocess.Popen(call,
                                 stdout = subprocess.PIPE,
                                 stderr = subprocess.STDOUT)
 
-        return proc.communicate()[0]
+        return proc.communicate()[0], True
     except (OSError, subprocess.CalledProcessError), error:
-        return str(error)
+        return str(error), False
 
 
-def _do_call(call):
-    try:
-        return _CALL_CACHE[call]
-    except KeyError:
-        if isinstance(call[0], collections.Callable):
-            result = call[0](*call[1:])
-        else:
-            result = _run(call)
+def _do_call(call, is_valid = None):
+    with _CACHE_LOCK:
+        if call in _CALL_CACHE:
+            return _CALL_CACHE[call]
+
+    if isinstance(call[0], collections.Callable):
+        result = call[0](*call[1:])
+    else:
+        result = _run_cached(call, is_valid)
+
+    with _CACHE_LOCK:
         _CALL_CACHE[call] = result
-        return result
+    return result
+
+
+def _run_cached(call, is_valid = None):
+    """Runs a cmd-line call, using the on-disk cache if possible. The output
+    is only saved to the on-disk cache if the call could be carried out, and
+    if 'is_valid(output)' is true (e.g. if the version could be determined),
+    so that transient failures are not cached."""
+    key = _get_cache_key(call)
+    if key is None:
+        return _run(call)[0]
+
+    with _CACHE_LOCK:
+        cache = _load_disk_cache()
+        if key in cache:
+            return cache[key]
+
+    result, success = _run(call)
+    if success and (is_valid is None or is_valid(result)):
+        with _CACHE_LOCK:
+            cache[key] = result
+            _save_disk_cache(cache)
+    return result
+
+
+def _get_cache_key(call):
+    """Returns a key for the on-disk cache, consisting of the call itself, and
+    the path and mtime of the executable and of any arguments that are files
+    (e.g. JAR files), and the values of environmental variables that may
+    affect the call (see _CACHE_ENVIRON). None is returned if the executable
+    cannot be found, or if the on-disk cache has been disabled."""
+    if CACHE_FILENAME is None:
+        return None
+
+    executable = fileutils.find_executable(call[0])
+    if executable is None:
+        return None
+
+    key = [call, tuple((name, os.environ.get(name)) for name in _CACHE_ENVIRON)]
+    for filename in (executable,) + tuple(call[1:]):
+        if os.path.isfile(filename):
+            filename = os.path.realpath(filename)
+            key.append((filename, os.path.getmtime(filename)))
+    return tuple(key)
+
+
+def _load_disk_cache():
+    global _DISK_CACHE # pylint: disable=W0603
+    if _DISK_CACHE is None:
+        try:
+            with open(CACHE_FILENAME, "rb") as handle:
+                _DISK_CACHE = cPickle.load(handle)
+        except Exception: # pylint: disable=W0703
+            # Missing or corrupt cache; not fatal, since it is merely a cache
+            _DISK_CACHE = {}
+    return _DISK_CACHE
+
+
+def _save_disk_cache(cache):
+    """Writes the cache to a temporary file, which is then renamed, in order
+    to avoid corrupting the file when multiple pipelines are run at once."""
+    try:
+        fileutils.make_dirs(os.path.dirname(CACHE_FILENAME))
+        temp_filename = "%s.%i" % (CACHE_FILENAME, os.getpid())
+        with open(temp_filename, "wb") as handle:
+            cPickle.dump(cache, handle, cPickle.HIGHEST_PROTOCOL)
+        os.rename(temp_filename, CACHE_FILENAME)
+    except (IOError, OSError):
+        # Failing to cache results is not fatal
+        pass
+
+
+def _try_get_version(requirement):
+    try:
+        return requirement.version
+    except Exception: # pylint: disable=W0703
+        return None
 
 
 def _pprint(ppr, value):
@@ -0,0 +1,225 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Append-only journal of nodes that have completed successfully.
+
+Each line of the journal is a JSON object describing a node at the time it
+completed: The (absolute) path, size and mtime of every output file, and a
+fingerprint of the paths, sizes and mtimes of the input files.
+
+Optionally, the journal also records checksums of the contents of input
+files. In that case, a node that appears to be outdated, because its input
+files have been touched (e.g. by re-copying a reference sequence), but whose
+contents are unchanged, is still considered to be up to date, and the entry
+is updated to match, so that the files need not be checksummed again.
+Nodes that are done and up to date are never looked up in the journal.
+"""
+import os
+import json
+import errno
+import hashlib
+
+import pypeline.common.fileutils as fileutils
+
+
+class NodeJournal:
+    def __init__(self, filename, checksums = False):
+        """If 'checksums' is true, the MD5 checksums of input files are
+        recorded, and compared if the sizes / mtimes of input files differ
+        from those recorded in the journal (see fileutils.file_checksum)."""
+        self._filename = filename
+        self._checksums = checksums
+        self._entries = {}
+        self._abspaths = {}
+        self._read_journal()
+
+        # Opened here, to catch problems with the journal before running nodes
+        dirname = os.path.dirname(filename)
+        if dirname:
+            fileutils.make_dirs(dirname)
+        self._handle = open(filename, "a")
+
+
+    @property
+    def checksums(self):
+        """True if checksums of input files are recorded in the journal."""
+        return self._checksums
+
+
+    def add(self, node, checksums = None):
+        """Records that a node has completed. Nodes without output files, and
+        nodes with input files modified after the output files (e.g. during
+        the run), are not recorded. If checksums are enabled, 'checksums' may
+        be the result of 'checksum_files(node.input_files)', calculated in the
+        process that ran the node, since checksumming large files may take a
+        long time; otherwise checksums are calculated here."""
+        if not node.output_files:
+            return
+
+        outputs = self._describe_files(node.output_files)
+        inputs  = self._fingerprint_files(node.input_files)
+        if (outputs is None) or (inputs is None):
+            return
+        elif node.input_files and fileutils.modified_after(node.input_files, node.output_files):
+            return
+
+        entry = {"outputs" : outputs, "inputs" : inputs}
+        if self._checksums:
+            if checksums is None:
+                checksums = checksum_files(node.input_files)
+            entry["checksums"] = checksums
+        self._add_entry(entry)
+
+
+    def is_up_to_date(self, node):
+        """Returns true if the node has been recorded in the journal, and if
+        neither input nor output files have changed since then; if checksums
+        are enabled, input files with unchanged contents are not considered
+        to have changed. Used by NodeGraph for nodes that appear outdated.
+        Uses the active FileStatusCache (see NodeGraph.refresh_states), if any."""
+        if not node.output_files:
+            return False
+
+        outputs = self._describe_files(node.output_files)
+        if outputs is None:
+            return False
+
+        entry = self._entries.get(tuple(path for (path, _, _) in outputs))
+        if (entry is None) or (outputs != entry["outputs"]):
+            return False
+
+        inputs = self._fingerprint_files(node.input_files)
+        if inputs is None:
+            return False
+        elif inputs == entry["inputs"]:
+            return True
+        elif not (self._checksums and "checksums" in entry):
+            return False
+        elif entry["checksums"] != checksum_files(node.input_files):
+            return False
+
+        # Input files were touched, but not modified; updated to avoid
+        # having to check the checksums of these files in later runs
+        self._add_entry({"outputs"   : outputs,
+                         "inputs"    : inputs,
+                         "checksums" : entry["checksums"]})
+        return True
+
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+    def _read_journal(self):
+        lines = 0
+        try:
+            with open(self._filename) as handle:
+                for line in handle:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        key = tuple(path for (path, _, _) in entry["outputs"])
+                    except (ValueError, KeyError, TypeError):
+                        # Typically caused by a truncated line, due to a crash
+                        continue
+
+                    if "inputs" in entry:
+                        self._entries[key] = entry
+        except IOError, error:
+            if error.errno != errno.ENOENT:
+                raise
+
+        # Entries are superseded as nodes are re-run; compact if needed
+        if lines > 2 * len(self._entries) + _MIN_COMPACT_LINES:
+            self._compact_journal()
+
+
+    def _compact_journal(self):
+        temp_filename = "%s.%i" % (self._filename, os.getpid())
+        with open(temp_filename, "w") as handle:
+            for entry in self._entries.itervalues():
+                handle.write(_to_line(entry))
+        os.rename(temp_filename, self._filename)
+
+
+    def _describe_files(self, filenames):
+        """Returns a sorted list of [abspath, size, mtime] lists, or None if
+        any of the files do not exist. Files are stat'ed using the paths as
+        given, to make use of the active FileStatusCache, if any."""
+        result = []
+        for filename in filenames:
+            stats = fileutils.try_stat(filename)
+            if stats is None:
+                return None
+            result.append([self._abspath(filename), stats.st_size, stats.st_mtime])
+        result.sort()
+        return result
+
+
+    def _fingerprint_files(self, filenames):
+        """Returns a hash of the paths, sizes, and mtimes of the files, or
+        None if any of the files do not exist."""
+        description = self._describe_files(filenames)
+        if description is None:
+            return None
+        return hashlib.md5(repr(description)).hexdigest()
+
+
+    def _abspath(self, filename):
+        # Paths are shared between nodes (input / output), and are frequently
+        # checked more than once per run, so os.path.abspath calls are cached
+        try:
+            return self._abspaths[filename]
+        except KeyError:
+            abspath = self._abspaths[filename] = os.path.abspath(filename)
+            return abspath
+
+
+    def _add_entry(self, entry):
+        key = tuple(path for (path, _, _) in entry["outputs"])
+        self._entries[key] = entry
+
+        # Entries are written as single lines, to ensure that concurrent
+        # pipelines using the same journal do not garble each others lines
+        self._handle.write(_to_line(entry))
+        self._handle.flush()
+
+
+
+def checksum_files(filenames):
+    """Returns a sorted list of [abspath, checksum] lists, as recorded in the
+    journal (see NodeJournal.add)."""
+    result = []
+    for filename in filenames:
+        result.append([os.path.abspath(filename), fileutils.file_checksum(filename)])
+    result.sort()
+    return result
+
+
+def _to_line(entry):
+    return json.dumps(entry, separators = (",", ":")) + "\n"
+
+
+# Minimum number of (superseded) lines in the journal before compacting
+_MIN_COMPACT_LINES = 1000
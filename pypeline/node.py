@@ -55,8 +55,12 @@ class Node(object):
     def __init__(self, description = None, threads = 1,
                  input_files = (), output_files = (),
                  executables = (), auxiliary_files = (),
-                 requirements = (), subnodes = (), dependencies = ()):
-
+                 requirements = (), subnodes = (), dependencies = (),
+                 memory = 0, io_weight = 0):
+        """In addition to 'threads', nodes may specify the amount of 'memory'
+        (in MB) required to run the node, and an 'io_weight' reflecting how
+        heavily the node uses the disk(s), in arbitrary units. These are used
+        by the Pypeline to limit the number of nodes running at once."""
         if not isinstance(description, _DESC_TYPES):
             raise TypeError("'description' must be None or a string, not %r" \
                             % (description.__class__.__name__,))
@@ -71,6 +75,8 @@ class Node(object):
         self.subnodes        = frozenset()
         self.dependencies    = frozenset()
         self.threads         = self._validate_nthreads(threads)
+        self.memory          = self._validate_resource(memory, "memory")
+        self.io_weight       = self._validate_resource(io_weight, "io_weight")
 
         try:
             # Ensure that the node can be used in a multiprocessing context
@@ -234,12 +240,20 @@ class Node(object):
             raise ValueError("'threads' must be a positive integer, not %i" % (threads,))
         return int(threads)
 
+    @classmethod
+    def _validate_resource(cls, value, name):
+        if not isinstance(value, (types.IntType, types.LongType)):
+            raise TypeError("%r must be a non-negative integer, not %s" % (name, type(value)))
+        elif value < 0:
+            raise ValueError("%r must be a non-negative integer, not %i" % (name, value))
+        return int(value)
+
 
 
 
 class CommandNode(Node):
     def __init__(self, command, description = None, threads = 1,
-                 subnodes = (), dependencies = ()):
+                 subnodes = (), dependencies = (), memory = 0, io_weight = 0):
         Node.__init__(self,
                       description  = description,
                       input_files  = command.input_files,
@@ -249,7 +263,9 @@ class CommandNode(Node):
                       requirements = command.requirements,
                       threads      = threads,
                       subnodes     = subnodes,
-                      dependencies = dependencies)
+                      dependencies = dependencies,
+                      memory       = memory,
+                      io_weight    = io_weight)
 
         self._command = command
 
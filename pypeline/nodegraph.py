@@ -22,17 +22,22 @@
 #
 import os
 import sys
+import heapq
 import collections
 
 import pypeline.common.versions as versions
 import pypeline.ui as ui
 from pypeline.node import MetaNode
-from pypeline.common.fileutils import missing_executables
+from pypeline.common.fileutils import missing_executables, FileStatusCache
 from pypeline.common.utilities import safe_coerce_to_frozenset
 
 
 # Max number of error messages of each type
 _MAX_ERROR_MESSAGES = 10
+# Number of threads used to stat input / output files when refreshing states
+_STAT_THREADS = 8
+# Number of version checks (subprocesses) carried out at once
+_VERSION_THREADS = 4
 
 
 class NodeGraphError(RuntimeError):
@@ -42,20 +47,45 @@ class NodeGraphError(RuntimeError):
 class NodeGraph:
     DONE, RUNNING, RUNABLE, QUEUED, OUTDATED, ERROR = range(6)
 
-    def __init__(self, nodes):
+    def __init__(self, nodes, journal = None, runtimes = None):
+        """Builds the graph of nodes reachable from 'nodes', and calculates the
+        state of every node. If a NodeJournal recording checksums is specified,
+        nodes that appear to be outdated are not considered to be so, if the
+        contents of their input files are unchanged (see NodeJournal).
+
+        If specified, 'runtimes' is a function returning the expected runtime of
+        a node (e.g. RuntimeDatabase.estimate), used to prioritize nodes on the
+        critical path (see pop_runable_node), and to estimate the remaining
+        runtime (see estimate_remaining_time). By default, all nodes are
+        assumed to take equally long."""
         nodes = safe_coerce_to_frozenset(nodes)
-        self._reverse_dependencies = collections.defaultdict(set)
-        self._collect_reverse_dependencies(nodes, self._reverse_dependencies)
-        self._intersections = self._calculate_intersections()
+        self._journal = journal
+        self._reverse_dependencies = self._collect_reverse_dependencies(nodes)
+        self._topological_order = self._calculate_topological_order(self._reverse_dependencies)
+        self._order = dict((node, index) for (index, node) in enumerate(self._topological_order))
         self._top_nodes = [node for (node, rev_deps) in self._reverse_dependencies.iteritems() if not rev_deps]
+        self._runtimes = runtimes
+        self._priorities = {}
 
         ui.print_info("  - Checking file dependencies ...", file = sys.stderr)
-        self._check_file_dependencies(self._reverse_dependencies)
+        self._check_file_dependencies(self._reverse_dependencies, self._order)
         ui.print_info("  - Checking for required executables ...", file = sys.stderr)
         self._check_required_executables(self._reverse_dependencies)
         ui.print_info("", file = sys.stderr)
 
         self._states = {}
+        # Number of subnodes / dependencies in each state, for each node
+        self._dependency_states = {}
+        # Number of (non-Meta) nodes in each state, and the RUNNING nodes
+        self._state_counts = [0] * (NodeGraph.ERROR + 1)
+        self._running = set()
+        # Work remaining, and (lazy) heap of priorities of nodes not DONE
+        self._remaining_work = 0
+        self._remaining_paths = []
+        self._file_status = FileStatusCache(threads = _STAT_THREADS)
+        self._runable_queues = {}
+        self._runable_queued = set()
+        self._runable_counter = 0
         self.refresh_states()
 
 
@@ -63,35 +93,70 @@ class NodeGraph:
         return self._states[node]
 
 
-    def set_node_state(self, node, state):
-        if state not in (NodeGraph.RUNNING, NodeGraph.ERROR, NodeGraph.DONE):
-            raise ValueError("Cannot set states other than RUNNING and ERROR, or DONE.")
-        self._states[node] = state
+    def get_state_counts(self):
+        """Returns a list of the number of nodes (excluding MetaNodes) in
+        each state, indexed by state; kept up to date as states change."""
+        return list(self._state_counts)
+
+
+    def iterrunning(self):
+        """Returns an iterator over nodes in the RUNNING state."""
+        return iter(self._running)
 
-        intersections = dict(self._intersections[node])
 
-        # Not all nodes may need to be updated, but we still need to
-        # traverse the "graph" (using the intersection counts) in order
-        # to ensure that all nodes that need to be updated are updated.
-        requires_update = dict.fromkeys(intersections, False)
-        for dependency in self._reverse_dependencies[node]:
-            requires_update[dependency] = True
+    def pop_runable_node(self, max_threads, max_memory = None, max_io_weight = None):
+        """Removes and returns the RUNABLE node with the highest priority (see
+        _calculate_priorities), among nodes requiring at most 'max_threads'
+        threads, and (if not None) at most 'max_memory' memory and at most
+        'max_io_weight' IO. Ties are broken by selecting the node that has been
+        waiting the longest. Returns None if there are no such nodes. Nodes
+        are queued (in heaps) by the resources they require, so that only the
+        head of each queue needs to be checked, regardless of graph size."""
+        selected = None
+        for ((threads, memory, io_weight), queue) in self._runable_queues.iteritems():
+            if threads > max_threads:
+                continue
+            elif (max_memory is not None) and (memory > max_memory):
+                continue
+            elif (max_io_weight is not None) and (io_weight > max_io_weight):
+                continue
 
-        while any(requires_update.itervalues()):
-            for (node, count) in intersections.items():
-                if not count:
-                    has_changed = False
-                    if requires_update[node]:
-                        old_state = self._states.pop(node)
-                        new_state = self._update_node_state(node)
-                        has_changed = (new_state != old_state)
+            # Nodes are lazily removed once they are no longer runable
+            while queue and (self._states[queue[0][-1]] != NodeGraph.RUNABLE):
+                self._runable_queued.remove(heapq.heappop(queue)[-1])
 
-                    for dependency in self._reverse_dependencies[node]:
-                        intersections[dependency] -= 1
-                        requires_update[dependency] |= has_changed
+            if queue and ((selected is None) or (queue[0] < selected[0])):
+                selected = queue
 
-                    intersections.pop(node)
-                    requires_update.pop(node)
+        if selected is None:
+            return None
+
+        node = heapq.heappop(selected)[-1]
+        self._runable_queued.remove(node)
+        return node
+
+
+    def set_node_state(self, node, state):
+        if state not in (NodeGraph.RUNNING, NodeGraph.ERROR, NodeGraph.DONE):
+            raise ValueError("Cannot set states other than RUNNING and ERROR, or DONE.")
+        old_state = self._states[node]
+        self._set_state(node, state)
+        # Output files may have been (partially) created or removed
+        self._file_status.invalidate(node.output_files)
+
+        # Dependents are updated in topological order, ensuring that each node
+        # is updated at most once, and only after all its dependencies have
+        # been updated. Only dependents of nodes that changed are updated.
+        queue, queued = [], set()
+        self._propagate_state(node, old_state, state, queue, queued)
+        with self._file_status:
+            while queue:
+                (_, node) = heapq.heappop(queue)
+                old_state = self._states[node]
+                new_state = self._calculate_state(node)
+                self._set_state(node, new_state)
+                if new_state != old_state:
+                    self._propagate_state(node, old_state, new_state, queue, queued)
 
 
     def __iter__(self):
@@ -99,55 +164,123 @@ class NodeGraph:
         return iter(self._top_nodes)
 
 
+    def estimate_remaining_time(self, max_threads):
+        """Returns a rough estimate of the time needed to run every node that is
+        not DONE, using at most 'max_threads' threads; this is the longest of
+        the remaining critical path, and of the total remaining work divided
+        by 'max_threads'. Returns None if no 'runtimes' function was given."""
+        if self._runtimes is None:
+            return None
+
+        # Nodes are lazily removed once DONE
+        paths = self._remaining_paths
+        while paths and (self._states[paths[0][-1]] == NodeGraph.DONE):
+            heapq.heappop(paths)
+
+        critical_path = -paths[0][0] if paths else 0
+        return max(critical_path, self._remaining_work / float(max_threads))
+
+
     def iterflat(self):
         return iter(self._reverse_dependencies)
 
 
     def refresh_states(self):
+        """Recalculates the state of every node (except RUNNING nodes and
+        nodes that have failed), stat'ing every input / output file once."""
+        filenames = []
+        for node in self._topological_order:
+            filenames.extend(node.input_files)
+            filenames.extend(node.output_files)
+        self._file_status.clear()
+        self._file_status.prefetch(filenames)
+
         states = {}
         for (node, state) in self._states.iteritems():
             if state in (self.ERROR, self.RUNNING):
                 states[node] = state
-        self._states = states
-        for node in self._reverse_dependencies:
-            self._update_node_state(node)
-
-
-    def _calculate_intersections(self):
-        def count_nodes(node, counts):
-            for node in self._reverse_dependencies[node]:
-                if node in counts:
-                    counts[node] += 1
-                else:
-                    counts[node] = 1
-                    count_nodes(node, counts)
-            return counts
-
-        intersections = {}
-        for node in self._reverse_dependencies:
-            counts = count_nodes(node, {})
-            for dependency in self._reverse_dependencies[node]:
-                counts[dependency] -= 1
-            intersections[node] = counts
-
-        return intersections
-
-
-    def _update_node_state(self, node):
-        if node in self._states:
-            return self._states[node]
-
-        # Update sub-nodes before checking for fixed states
+        self._states = {}
+        self._state_counts = [0] * (NodeGraph.ERROR + 1)
+        self._running = set()
+        self._remaining_work = 0
+        self._remaining_paths = []
+        self._runable_queues = {}
+        self._runable_queued = set()
+        with self._file_status:
+            # Estimated runtimes may depend on the size of input files
+            self._priorities = self._calculate_priorities(self._runtimes or _default_runtime)
+            for (node, state) in states.iteritems():
+                self._set_state(node, state)
+
+            for node in self._topological_order:
+                counts = [0] * (NodeGraph.ERROR + 1)
+                for subnode in (node.subnodes | node.dependencies):
+                    counts[self._states[subnode]] += 1
+                self._dependency_states[node] = counts
+
+                if node not in self._states:
+                    self._set_state(node, self._calculate_state(node))
+
+
+    def _propagate_state(self, node, old_state, new_state, queue, queued):
+        """Updates the state counts of nodes depending on 'node', and adds these
+        to the (heap) queue of nodes to be updated, ordered topologically."""
+        for dependent in self._reverse_dependencies[node]:
+            counts = self._dependency_states[dependent]
+            counts[old_state] -= 1
+            counts[new_state] += 1
+
+            if dependent not in queued:
+                heapq.heappush(queue, (self._order[dependent], dependent))
+                queued.add(dependent)
+
+
+    def _set_state(self, node, state):
+        old_state = self._states.get(node)
+        self._states[node] = state
+        if state != old_state:
+            self._update_state_counts(node, old_state, state)
+        if (state == NodeGraph.RUNABLE) and (node not in self._runable_queued):
+            resources = (node.threads, node.memory, node.io_weight)
+            queue = self._runable_queues.setdefault(resources, [])
+            heapq.heappush(queue, (-self._priorities[node], self._runable_counter, node))
+            self._runable_queued.add(node)
+            self._runable_counter += 1
+
+
+    def _update_state_counts(self, node, old_state, new_state):
+        if not isinstance(node, MetaNode):
+            if old_state is not None:
+                self._state_counts[old_state] -= 1
+            self._state_counts[new_state] += 1
+
+        if new_state == NodeGraph.RUNNING:
+            self._running.add(node)
+        elif old_state == NodeGraph.RUNNING:
+            self._running.discard(node)
+
+        if self._runtimes is not None:
+            if (old_state in (None, NodeGraph.DONE)) and (new_state != NodeGraph.DONE):
+                self._remaining_work += self._get_runtime(node) * node.threads
+                heapq.heappush(self._remaining_paths, (-self._priorities[node], node))
+            elif (old_state not in (None, NodeGraph.DONE)) and (new_state == NodeGraph.DONE):
+                self._remaining_work -= self._get_runtime(node) * node.threads
+
+
+    def _calculate_state(self, node):
+        """Calculates the state of a node, based on the number of subnodes and
+        dependencies in each state, which must therefore be up to date."""
         state = NodeGraph.DONE
-        for subnode in (node.subnodes | node.dependencies):
-            state = max(state, self._update_node_state(subnode))
+        for (dependency_state, count) in enumerate(self._dependency_states[node]):
+            if count:
+                state = dependency_state
 
         try:
             if isinstance(node, MetaNode):
                 if state in (NodeGraph.RUNNING, NodeGraph.RUNABLE):
                     state = NodeGraph.QUEUED
             elif state == NodeGraph.DONE:
-                if not node.is_done or node.is_outdated:
+                if not self._is_up_to_date(node):
                     state = NodeGraph.RUNABLE
             elif state in (NodeGraph.RUNNING, NodeGraph.RUNABLE, NodeGraph.QUEUED):
                 if node.is_done:
@@ -159,11 +292,21 @@ class NodeGraph:
             # 'is_done' to call modified_after on missing files in 'is_outdated'
             ui.print_err("OSError checking state of Node: %s" % error, file = sys.stderr)
             state = NodeGraph.ERROR
-        self._states[node] = state
 
         return state
 
 
+    def _is_up_to_date(self, node):
+        if not node.is_done:
+            return False
+        elif not node.is_outdated:
+            return True
+
+        # Input files may have been touched, but not modified
+        return bool(self._journal and self._journal.checksums) \
+            and self._journal.is_up_to_date(node)
+
+
     @classmethod
     def _check_required_executables(cls, nodes):
         exec_filenames, exec_requirements = set(), set()
@@ -176,6 +319,8 @@ class NodeGraph:
             raise NodeGraphError("Required executables are missing:\n\t%s" \
                                 % ("\n\t".join(sorted(missing_exec))))
 
+        versions.prefetch(exec_requirements, threads = _VERSION_THREADS)
+
         try:
             for requirement in exec_requirements:
                 requirement()
@@ -187,7 +332,7 @@ class NodeGraph:
                                  % (requirement.name, error))
 
     @classmethod
-    def _check_file_dependencies(cls, nodes):
+    def _check_file_dependencies(cls, nodes, order):
         files = ("input_files", "output_files")
         files = dict((key, collections.defaultdict(set)) for key in files)
         # Auxiliary files are treated as input files
@@ -202,7 +347,7 @@ class NodeGraph:
         error_messages = []
         error_messages.extend(zip(max_messages, cls._check_output_files(files["output_files"])))
         error_messages.extend(zip(max_messages, cls._check_input_dependencies(files["input_files"],
-                                                                              files["output_files"], nodes)))
+                                                                              files["output_files"], order)))
 
         if error_messages:
             messages = []
@@ -225,15 +370,13 @@ class NodeGraph:
 
 
     @classmethod
-    def _check_input_dependencies(cls, input_files, output_files, nodes):
-        dependencies = cls._collect_dependencies(nodes, {})
-
+    def _check_input_dependencies(cls, input_files, output_files, order):
         for (filename, nodes) in sorted(input_files.items(), key = lambda v: v[0]):
             if (filename in output_files):
                 producers = output_files[filename]
                 bad_nodes = set()
                 for consumer in nodes:
-                    if not (producers & dependencies[consumer]):
+                    if not cls._depends_on(consumer, producers, order):
                         bad_nodes.add(consumer)
 
                 if bad_nodes:
@@ -250,35 +393,95 @@ class NodeGraph:
 
 
     @classmethod
-    def _collect_dependencies(cls, nodes, dependencies):
-        for node in nodes:
-            if node not in dependencies:
-                subnodes = node.subnodes | node.dependencies
-                if not subnodes:
-                    dependencies[node] = frozenset()
-                    continue
-
-                cls._collect_dependencies(subnodes, dependencies)
-
-                collected = set(subnodes)
-                for subnode in subnodes:
-                    collected.update(dependencies[subnode])
-                dependencies[node] = frozenset(collected)
-
-        return dependencies
+    def _depends_on(cls, consumer, producers, order):
+        """Returns true if 'consumer' depends directly or indirectly (via
+        subnodes / dependencies) on any of the nodes in 'producers'. Since
+        dependencies precede dependents in the topological order, nodes
+        preceding every producer in this order need not be visited."""
+        min_order = min(order[producer] for producer in producers)
+        queue, observed = [consumer], set()
+        while queue:
+            node = queue.pop()
+            for subnode in (node.subnodes | node.dependencies):
+                if subnode in producers:
+                    return True
+                elif (subnode not in observed) and (order[subnode] > min_order):
+                    observed.add(subnode)
+                    queue.append(subnode)
+        return False
 
 
     @classmethod
-    def _collect_reverse_dependencies(cls, lst, rev_dependencies):
-        for node in lst:
-            # Add node to set 
-            rev_dependencies[node] # pylint: disable=W0104
-            # Recursively add both deps and subnodes
+    def _collect_reverse_dependencies(cls, nodes):
+        """Returns a dictionary of node -> set of nodes that have the node as
+        a subnode or as a dependency, for all nodes reachable from 'nodes'."""
+        rev_dependencies = dict((node, set()) for node in nodes)
+        queue = list(rev_dependencies)
+        while queue:
+            node = queue.pop()
             for dependency in (node.dependencies | node.subnodes):
+                if dependency not in rev_dependencies:
+                    rev_dependencies[dependency] = set()
+                    queue.append(dependency)
                 rev_dependencies[dependency].add(node)
-            cls._collect_reverse_dependencies(node.dependencies, rev_dependencies)
-            cls._collect_reverse_dependencies(node.subnodes, rev_dependencies)
 
+        return rev_dependencies
+
+
+    def _calculate_priorities(self, get_runtime):
+        """Returns a dictionary of node -> priority, where the priority is the
+        expected runtime of the longest (critical) path starting at the node,
+        and ending at a node that is not a subnode or dependency of any other
+        node. Running nodes with high priorities first minimizes the risk of
+        long chains of nodes being started late in the run."""
+        priorities = {}
+        for node in reversed(self._topological_order):
+            priority = 0
+            for dependent in self._reverse_dependencies[node]:
+                priority = max(priority, priorities[dependent])
+            priorities[node] = priority + get_runtime(node)
+        return priorities
+
+
+    def _get_runtime(self, node):
+        """Returns the estimated runtime of a node, as used to calculate the
+        priority of the node (see _calculate_priorities)."""
+        downstream = 0
+        for dependent in self._reverse_dependencies[node]:
+            downstream = max(downstream, self._priorities[dependent])
+        return self._priorities[node] - downstream
+
+
+    @classmethod
+    def _calculate_topological_order(cls, rev_dependencies):
+        """Returns a list of all nodes, in which every node is preceded by its
+        subnodes and dependencies; calculated in O(V + E) using counts of the
+        number of (unordered) subnodes / dependencies of each node."""
+        counts, order = {}, []
+        for node in rev_dependencies:
+            count = len(node.dependencies | node.subnodes)
+            if count:
+                counts[node] = count
+            else:
+                order.append(node)
+
+        # Nodes are appended to 'order', as their last dependency is ordered
+        for node in order:
+            for dependent in rev_dependencies[node]:
+                counts[dependent] -= 1
+                if not counts[dependent]:
+                    order.append(dependent)
+
+        if len(order) != len(rev_dependencies):
+            raise NodeGraphError("Cycle detected in the dependency graph")
+
+        return order
+
+
+
+def _default_runtime(node):
+    """MetaNodes do no work, other nodes are assumed to take equally long."""
+    return 0 if isinstance(node, MetaNode) else 1
 
 
 def _summarize_nodes(nodes):
@@ -104,7 +104,9 @@ class SEBWANode(CommandNode):
     def customize(cls, input_file, output_file, reference, prefix, threads = 1, dependencies = ()):
         threads = _get_max_threads(reference, threads)
 
-        aln_in = _build_unicat_command(input_file, "uncompressed_input_aln")
+        # Reads are decompressed once, and written to the FIFOs read by 'aln' and 'samse'
+        unicat = _build_unicat_command(input_file, "uncompressed_input_aln",
+                                       "uncompressed_input_samse")
         aln = _get_bwa_template(("bwa", "aln"), prefix,
                                 TEMP_IN_FILE = "uncompressed_input_aln",
                                 OUT_STDOUT = AtomicCmd.PIPE,
@@ -113,7 +115,6 @@ class SEBWANode(CommandNode):
         aln.add_value("%(TEMP_IN_FILE)s")
         aln.set_option("-t", threads)
 
-        samse_in = _build_unicat_command(input_file, "uncompressed_input_samse")
         samse = _get_bwa_template(("bwa", "samse"), prefix,
                                   IN_STDIN = aln,
                                   TEMP_IN_FILE = "uncompressed_input_samse",
@@ -124,13 +125,12 @@ class SEBWANode(CommandNode):
         samse.add_value("%(TEMP_IN_FILE)s")
 
         order, commands = _process_output(samse, output_file, reference)
-        commands["samse_in"] = samse_in
         commands["samse"]    = samse
-        commands["aln_in"]   = aln_in
+        commands["unicat"]   = unicat
         commands["aln"]      = aln
 
         return {"commands"     : commands,
-                "order"        : ["aln_in", "aln", "samse_in", "samse"] + order,
+                "order"        : ["unicat", "aln", "samse"] + order,
                 "threads"      : threads,
                 "dependencies" : dependencies}
 
@@ -157,24 +157,19 @@ class PEBWANode(CommandNode):
     def customize(cls, input_file_1, input_file_2, output_file, reference, prefix, threads = 2, dependencies = ()):
         threads = _get_max_threads(reference, threads)
 
-        aln_commands, aln_in_commands = \
+        aln_commands, unicat_commands = \
           cls._create_aln_cmds(prefix, input_file_1, input_file_2, threads)
-
-        sampe_in_1 = _build_unicat_command(input_file_1, "uncompressed_input_sampe_1")
-        sampe_in_2 = _build_unicat_command(input_file_2, "uncompressed_input_sampe_2")
         sampe      = cls._create_sampe_cmd(prefix)
 
         order, commands = _process_output(sampe, output_file, reference, run_fixmate = True)
         commands["sampe"] = sampe
-        commands["sampe_in_1"] = sampe_in_1
-        commands["sampe_in_2"] = sampe_in_2
-        commands["aln_in_1"], commands["aln_in_2"] = aln_in_commands
+        commands["unicat_1"], commands["unicat_2"] = unicat_commands
         commands["aln_1"],    commands["aln_2"]    = aln_commands
 
         return {"commands"     : commands,
-                "order"        : ["aln_in_1", "aln_1",
-                                  "aln_in_2", "aln_2",
-                                  "sampe_in_1", "sampe_in_2", "sampe"] + order,
+                "order"        : ["unicat_1", "aln_1",
+                                  "unicat_2", "aln_2",
+                                  "sampe"] + order,
                 # At least one thread per 'aln' process
                 "threads"      : max(2, threads),
                 "dependencies" : dependencies}
@@ -203,9 +198,11 @@ class PEBWANode(CommandNode):
 
     @classmethod
     def _create_aln_cmds(cls, prefix, input_file_1, input_file_2, threads):
-        alns, aln_ins = [], []
+        alns, unicats = [], []
         for (iindex, filename) in enumerate((input_file_1, input_file_2), start = 1):
-            aln_in = _build_unicat_command(filename, "uncompressed_input_aln_%i" % iindex)
+            # Reads are decompressed once, and written to the FIFOs read by 'aln' and 'sampe'
+            unicat = _build_unicat_command(filename, "uncompressed_input_aln_%i" % iindex,
+                                           "uncompressed_input_sampe_%i" % iindex)
             aln = _get_bwa_template(("bwa", "aln"), prefix,
                                     TEMP_IN_FILE = "uncompressed_input_aln_%i" % iindex,
                                     OUT_STDOUT = AtomicCmd.PIPE,
@@ -215,9 +212,9 @@ class PEBWANode(CommandNode):
             aln.set_option("-t", max(1, threads // 2))
             aln.add_value(prefix)
             aln.add_value("%(TEMP_IN_FILE)s")
-            aln_ins.append(aln_in)
+            unicats.append(unicat)
             alns.append(aln)
-        return alns, aln_ins
+        return alns, unicats
 
 
     @classmethod
@@ -369,7 +366,14 @@ def _check_bwa_prefix(prefix):
                                 % (".".join(map(str, bwa_version)), prefix, prefix))
 
 
-def _build_unicat_command(input_file, output_file):
-    return AtomicCmdBuilder(["unicat", "--output", "%(TEMP_OUT_CAT)s", "%(IN_ARCHIVE)s"],
-                        TEMP_OUT_CAT = output_file,
-                        IN_ARCHIVE   = input_file)
+def _build_unicat_command(input_file, *output_files):
+    """Decompresses 'input_file' once, writing the result to each output file
+    (typically FIFOs in the temporary folder)."""
+    params = AtomicCmdBuilder("unicat", IN_ARCHIVE = input_file)
+    for (index, output_file) in enumerate(output_files, start = 1):
+        key = "TEMP_OUT_CAT_%i" % (index,)
+        params.add_option("--output", "%%(%s)s" % (key,))
+        params.set_kwargs(**{key : output_file})
+    params.add_value("%(IN_ARCHIVE)s")
+
+    return params
@@ -21,7 +21,9 @@
 # SOFTWARE.
 #
 import os
+import sys
 import copy
+import bisect
 import datetime
 import collections
 
@@ -30,14 +32,18 @@ import pysam
 from pypeline.node import Node
 from pypeline.common.text import padded_table, parse_padded_table
 from pypeline.common.fileutils import reroot_path, move_file, swap_ext, describe_files
-from pypeline.common.utilities import get_in, set_in
+from pypeline.common.utilities import get_in, set_in, fork_map
 
 
 _MAX_CONTIGS = 100
+# Spans of intervals closer than this are fetched from the BAM as one span
+_MAX_SPAN_GAP = 1000
 
 
 class CoverageNode(Node):
-    def __init__(self, input_file, target_name, output_file = None, intervals_file = None, max_contigs = _MAX_CONTIGS, dependencies = ()):
+    def __init__(self, input_file, target_name, output_file = None, intervals_file = None, max_contigs = _MAX_CONTIGS, threads = 1, dependencies = ()):
+        """If 'threads' is greater than 1, reads are counted in parallel for
+        each contig (or intervals on each contig), using as many processes."""
         self._target_name = target_name
         self._input_file  = input_file
         self._output_file = output_file or swap_ext(input_file, ".coverage")
@@ -50,6 +56,7 @@ class CoverageNode(Node):
                           % (input_file, self._output_file),
                       input_files  = (input_file, swap_ext(input_file, ".bai")),
                       output_files = self._output_file,
+                      threads      = threads,
                       dependencies = dependencies)
 
 
@@ -69,7 +76,16 @@ class CoverageNode(Node):
             readgroups = self._get_readgroups(bamfile)
 
             tables, mapping = self._initialize_tables(self._target_name, intervals, readgroups)
-            self.read_records(bamfile, intervals, mapping)
+            if self.threads == 1:
+                self.read_records(bamfile, intervals, mapping)
+                jobs = ()
+            else:
+                jobs = [(temp_filename, self._target_name, readgroups) + job
+                        for job in self._split_intervals(bamfile, intervals)]
+
+        # Each process opens the (indexed) BAM, and counts reads for a contig
+        for partial_tables in fork_map(_read_records_job, jobs, self.threads):
+            _merge_tables(tables, partial_tables)
 
         tables = self.filter_readgroups(tables)
         _write_table(tables, reroot_path(temp, self._output_file))
@@ -136,48 +152,99 @@ class CoverageNode(Node):
 
 
     @classmethod
-    def read_records(cls, bamfile, intervals, tables):
-        def _get_readgroup(record):
-            for key, value in record.tags:
-                if key == "RG":
-                    return value
-
+    def _split_intervals(cls, bamfile, intervals):
+        """Returns a list of (intervals, genome_contig) tuples, one per contig,
+        in decreasing order of size. Intervals covering the entire genome
+        (see _get_intervals) are split by contig, using 'genome_contig'."""
+        jobs, by_contig = [], {}
         for (name, interval_list) in intervals.iteritems():
             for (contig, start, end) in interval_list:
-                keys = (contig, start, end)
                 if contig is None:
-                    keys = ()
+                    for (reference, length) in zip(bamfile.references, bamfile.lengths):
+                        jobs.append((length, {name : [(contig, start, end)]}, reference))
+                else:
+                    subintervals = by_contig.setdefault(contig, {})
+                    subintervals.setdefault(name, []).append((contig, start, end))
+
+        for subintervals in by_contig.itervalues():
+            size = sum((end - start) for interval_list in subintervals.itervalues()
+                       for (_, start, end) in interval_list)
+            jobs.append((size, subintervals, None))
+
+        jobs.sort(key = lambda job: job[0], reverse = True)
+        return [(subintervals, genome_contig) for (_, subintervals, genome_contig) in jobs]
+
+
+    @classmethod
+    def read_records(cls, bamfile, intervals, tables, genome_contig = None):
+        """Counts reads in each interval; reads overlapping multiple intervals
+        are counted once per interval. Intervals are indexed by contig (see
+        _IntervalIndex), and reads are fetched once per span of overlapping /
+        nearby intervals. Intervals with the contig 'None' cover the entire
+        genome, or just 'genome_contig' if not None."""
+        for (contig, index) in _IntervalIndex.build(intervals).iteritems():
+            last_end = 0
+            spans = index.spans(_MAX_SPAN_GAP)
+            for (span_index, (span_start, span_end)) in enumerate(spans):
+                keys = (contig, span_start, span_end)
+                if contig is None:
+                    keys = (genome_contig,) if genome_contig else ()
+
+                # Reads in a span consisting of a single interval (e.g. an entire
+                # contig) overlap just that interval, unless they reach the next span
+                single = index.overlapping(span_start, span_end)
+                if (len(single) != 1) or (single[0][:2] != (span_start, span_end)):
+                    single = None
+                next_start = spans[span_index + 1][0] if span_index + 1 < len(spans) else sys.maxint
 
                 for record in bamfile.fetch(*keys):
                     if record.is_unmapped or record.is_duplicate:
                         continue
+                    elif record.pos < last_end:
+                        # Overlaps the previous span, and has already been counted
+                        continue
 
-                    readgroup = _get_readgroup(record)
-                    subtable  = tables[readgroup][name]
+                    overlaps = single
+                    if (overlaps is None) or (record.aend > next_start):
+                        overlaps = index.overlapping(record.pos, record.aend or (record.pos + 1))
+                        if not overlaps:
+                            continue
 
                     qname = record.qname
                     if qname.startswith("M_") or qname.startswith("MT_"):
-                        subtable["Collapsed"] += 1
+                        category = "Collapsed"
                     else:
                         flag = record.flag
                         if flag & 0x40: # first of pair
-                            subtable["PE_1"] += 1
+                            category = "PE_1"
                         elif flag & 0x80: # second of pair
-                            subtable["PE_2"] += 1
+                            category = "PE_2"
                         else: # Singleton
-                            subtable["SE"] += 1
-
-                    position = record.pos
-                    for (op, num) in record.cigar:
-                        if op < 3:
-                            left  = min(max(position, start), end - 1)
-                            right = min(max(position + num, start), end - 1)
-                            subtable["MID"[op]] += right - left
-
-                            if op < 2: # M/D
+                            category = "SE"
+
+                    try:
+                        readgroup = record.opt("RG")
+                    except KeyError:
+                        readgroup = None
+
+                    cigar = record.cigar
+                    readgroup_tables = tables[readgroup]
+                    for (start, end, name) in overlaps:
+                        subtable = readgroup_tables[name]
+                        subtable[category] += 1
+
+                        position = record.pos
+                        for (op, num) in cigar:
+                            if op < 3:
+                                left  = min(max(position, start), end - 1)
+                                right = min(max(position + num, start), end - 1)
+                                subtable["MID"[op]] += right - left
+
+                                if op < 2: # M/D
+                                    position += num
+                            elif op == 3: # N
                                 position += num
-                        elif op == 3: # N
-                            position += num
+                last_end = span_end
 
 
     def filter_readgroups(self, table):
@@ -216,6 +283,80 @@ class MergeCoverageNode(Node):
 
 
 
+class _IntervalIndex:
+    """Index of (start, end, name) intervals on a single contig, allowing
+    intervals overlapping a given read to be found using binary search."""
+
+    def __init__(self, intervals):
+        intervals = sorted(intervals)
+        self._starts = [start for (start, _, _) in intervals]
+        self._intervals = intervals
+        # Max end of intervals[0 .. i]; non-decreasing, and hence searchable
+        self._max_ends, max_end = [], 0
+        for (_, end, _) in intervals:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+
+
+    @classmethod
+    def build(cls, intervals):
+        """Returns a dictionary of contig -> _IntervalIndex, given a dictionary
+        of name -> list of (contig, start, end) intervals."""
+        by_contig = collections.defaultdict(list)
+        for (name, interval_list) in intervals.iteritems():
+            for (contig, start, end) in interval_list:
+                by_contig[contig].append((start, end, name))
+
+        return dict((contig, cls(interval_list))
+                    for (contig, interval_list) in by_contig.iteritems())
+
+
+    def spans(self, max_gap):
+        """Returns the sorted list of (start, end) spans covered by intervals,
+        with spans less than 'max_gap' bases apart merged into one span."""
+        spans = []
+        for (start, end, _) in self._intervals:
+            if spans and (start - spans[-1][1] < max_gap):
+                spans[-1][1] = max(spans[-1][1], end)
+            else:
+                spans.append([start, end])
+        return [tuple(span) for span in spans]
+
+
+    def overlapping(self, start, end):
+        """Returns the list of intervals overlapping the range [start, end)."""
+        first = bisect.bisect_right(self._max_ends, start)
+        last = bisect.bisect_left(self._starts, end)
+
+        return [interval for interval in self._intervals[first:last]
+                if interval[1] > start]
+
+
+
+def _read_records_job(args):
+    """Counts reads for a subset of intervals in a BAM file, returning tables
+    to be merged using _merge_tables; called using fork_map."""
+    filename, target_name, readgroups, intervals, genome_contig = args
+    with pysam.Samfile(filename) as bamfile:
+        tables, mapping = CoverageNode._initialize_tables(target_name, intervals, readgroups)
+        CoverageNode.read_records(bamfile, intervals, mapping, genome_contig)
+
+    return tables
+
+
+def _merge_tables(tables, partial_tables):
+    """Adds the counts in 'partial_tables' to 'tables'; sizes are not summed,
+    since these depend only on the (full) set of intervals."""
+    for (name, samples) in partial_tables.iteritems():
+        for (sample, libraries) in samples.iteritems():
+            for (library, contigs) in libraries.iteritems():
+                for (contig, counts) in contigs.iteritems():
+                    subtable = tables[name][sample][library][contig]
+                    for (key, value) in counts.iteritems():
+                        if key != "Size":
+                            subtable[key] += value
+
+
 def _calculate_totals(table):
     for (name, samples) in sorted(table.items()):
         for (sample, libraries) in sorted(samples.items()):
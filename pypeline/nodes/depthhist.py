@@ -22,22 +22,26 @@
 #
 import os
 import sys
+import array
 import datetime
-import subprocess
 
+import numpy
 import pysam
 
-from pypeline.node import Node
-from pypeline.atomiccmd.command import AtomicCmd
+from pypeline.node import Node, NodeError
 from pypeline.common.text import padded_table
 from pypeline.common.fileutils import reroot_path, move_file, swap_ext, describe_files
-from pypeline.common.utilities import get_in, set_in, safe_coerce_to_tuple
+from pypeline.common.utilities import set_in, safe_coerce_to_tuple
 from pypeline.nodes.picard import concatenate_input_bams
 from pypeline.common.timer import BAMTimer
 
 
 _MAX_DEPTH = 200
 _MAX_CONTIGS = 100
+# Max number of reads buffered per _DepthCounter, before depths are calculated
+_MAX_BUFFERED_READS = 2 ** 16
+# Max number of bases for which depths are calculated at once
+_MAX_WINDOW_SIZE = 2 ** 20
 
 
 class DepthHistogramNode(Node):
@@ -56,8 +60,7 @@ class DepthHistogramNode(Node):
         if intervals_file:
             input_files.append(intervals_file)
 
-        executables = ["coverageBed"] if intervals_file else ["genomeCoverageBed"]
-        auxiliary_files = []
+        executables, auxiliary_files = [], []
         for cmd in concatenate_input_bams(config, self._input_files)[0]:
             executables.extend(cmd.executables)
             auxiliary_files.extend(cmd.auxiliary_files)
@@ -74,34 +77,21 @@ class DepthHistogramNode(Node):
 
 
     def _setup(self, config, temp):
-        pipe = os.path.join(temp, "input_file")
-        # Dictionary of named pipes created by the node
-        self._pipes = {"input_file" : pipe}
-        # Dictionary of lists of processes created by the node
-        self._procs = {}
-        # Dictionary of output tables created by the node
-        self._tables = {}
-        # Dictionary of (filename, file-handle) for output tables
-        self._handle = {}
+        self._pipe = os.path.join(temp, "input_file")
+        self._procs = []
 
         if len(self._input_files) == 1:
             filename = iter(self._input_files).next()
-            os.symlink(os.path.abspath(filename), pipe)
+            os.symlink(os.path.abspath(filename), self._pipe)
         else:
-            os.mkfifo(pipe)
-            procs, _ = concatenate_input_bams(config, self._input_files, out = pipe)
-            for proc in procs:
+            os.mkfifo(self._pipe)
+            self._procs, _ = concatenate_input_bams(config, self._input_files, out = self._pipe)
+            for proc in self._procs:
                 proc.run(temp)
-            self._procs["cat"] = procs
 
 
     def _run(self, config, temp):
-        region_names = self._create_tables(config, temp)
-
-        table = {}
-        for (key, (filename, handle)) in self._tables.iteritems():
-            handle.close()
-            self._read_table(key, table, filename)
+        table, region_names = self._create_tables(config, temp)
 
         temp_filename = reroot_path(temp, self._output_file)
         self._write_table(table, temp_filename, region_names)
@@ -110,18 +100,9 @@ class DepthHistogramNode(Node):
     def _teardown(self, config, temp):
         temp_filename = reroot_path(temp, self._output_file)
         move_file(temp_filename, self._output_file)
+        os.remove(self._pipe)
 
-        for filename in self._pipes.itervalues():
-            os.remove(filename)
-
-        for (filename, _) in self._tables.itervalues():
-            os.remove(filename)
-
-        intervals = os.path.join(temp, "intervals.bed")
-        if os.path.exists(intervals):
-            os.remove(intervals)
-
-        for proc in self._procs.get("cat", ()):
+        for proc in self._procs:
             proc.commit(temp)
 
         if not self._print_stats:
@@ -129,37 +110,57 @@ class DepthHistogramNode(Node):
 
 
     def _create_tables(self, config, temp):
-        # Opening pipe/symlink created in _setup()
+        """Calculates depth histograms for every read-group / sample / library
+        in a single pass over the (coordinate sorted) BAM file, and returns a
+        table of {sample : {library : {region : counts}}}, and the sizes of
+        each region. Only the 'pos' and 'aend' of reads are used, so that
+        deletions and skipped bases are counted as covered."""
         out = sys.stderr
         if not self._print_stats:
             out = open(os.path.join(temp, "pipe_coverage_%i.stdout" % id(self)), "w")
 
-        with pysam.Samfile(self._pipes["input_file"]) as samfile:
+        # Opening pipe/symlink created in _setup()
+        with pysam.Samfile(self._pipe) as samfile:
             timer = BAMTimer(samfile, out = out)
-            intervals, region_names = self._get_intervals(temp, samfile)
-            mapping   = self._open_handles(temp, samfile, intervals)
+            regions, region_names, region_sizes = self._get_intervals(samfile)
+            counters, mapping = self._create_counters(samfile, regions)
+
+            last_tid, last_pos = -1, -1
             for read in samfile:
                 if read.is_unmapped or read.is_duplicate:
                     continue
 
-                rg = dict(read.tags).get("RG")
-                for handle in mapping[rg]:
-                    handle.write(read)
+                tid, pos = read.tid, read.pos
+                if (tid < last_tid) or (tid == last_tid and pos < last_pos):
+                    raise NodeError("Input BAM is not sorted by coordinate: %s" \
+                                    % (describe_files(self._input_files),))
+                last_tid, last_pos = tid, pos
+
+                end = read.aend
+                if end is not None:
+                    try:
+                        rg = read.opt("RG")
+                    except KeyError:
+                        rg = None
+
+                    for counter in mapping[rg]:
+                        counter.add(tid, pos, end)
                 timer.increment(read = read)
             timer.finalize()
 
         if not self._print_stats:
             out.close()
 
-        for handle in self._handle.itervalues():
-            handle.close()
+        for proc in self._procs:
+            if proc.wait() != 0:
+                raise RuntimeError("Error while running process: %i" % proc.wait())
 
-        for proclst in self._procs.itervalues():
-            for proc in proclst:
-                if proc.wait() != 0:
-                    raise RuntimeError("Error while running process: %i" % proc.wait())
+        table = {}
+        for (key, counter) in counters.iteritems():
+            for (name, counts) in counter.finalize(region_sizes).iteritems():
+                set_in(table, key + (name,), counts)
 
-        return region_names
+        return table, region_names
 
 
     def _calc_cumfrac(self, counts):
@@ -226,91 +227,61 @@ class DepthHistogramNode(Node):
                 table_file.write("\n")
 
 
-    def _read_table(self, key, table, filename):
-        all_key = "all" if self._intervals else "genome"
-        with open(filename) as handle:
-            for line in handle:
-                fields = line.split("\t")
-                # 'all' is generated by coverageBed, as a catchall group
-                if (fields[0] == all_key) and (len(fields) == 5):
-                    name = None
-                elif self._max_contigs_reached:
-                    continue
-                elif (len(fields) > (3 + 4)):
-                    # Probably a BED6 file, 4 columns are from bedTools
-                    name = fields[3]
-                else:
-                    name = fields[0]
-
-                ckey = key + (name,)
-                if not get_in(table, ckey, None):
-                    set_in(table, ckey, [0] * (_MAX_DEPTH + 1))
-
-                depth = min(_MAX_DEPTH, int(fields[-4]))
-                get_in(table, ckey)[depth] += int(fields[-3])
-
-
-    def _open_handles(self, temp, samfile, intervals):
-        mapping    = {}
-        readgroups = self._get_readgroups(samfile)
-        for (rg_id, rg) in readgroups.iteritems():
-            mapping[rg_id] = set([self._create_handle(temp, samfile, intervals, None,     None),
-                                  self._create_handle(temp, samfile, intervals, rg["SM"], None),
-                                  self._create_handle(temp, samfile, intervals, rg["SM"], rg["LB"])])
-
-        return mapping
-
-
-    def _create_handle(self, temp, samfile, intervals, *key):
-        key = tuple(key)
-        if key not in self._handle:
-            input_file  = os.path.join(temp, "input_pipe_%02i" % len(self._pipes))
-            output_file = os.path.join(temp, "output_table_%02i.txt" % len(self._handle))
-            os.mkfifo(input_file)
-
-            self._pipes[key]  = input_file
-            self._tables[key] = (output_file, open(output_file, "w"))
-            if self._intervals:
-                call = ("coverageBed", "-hist", "-abam", input_file, "-b", intervals)
-            else:
-                call = ("genomeCoverageBed", "-max", str(_MAX_DEPTH), "-ibam", input_file, "-g", intervals)
-
-            self._procs[key]  = [subprocess.Popen(call,
-                                                  stdout    = self._tables[key][-1],
-                                                  preexec_fn = os.setsid,
-                                                  close_fds = True)]
-
-            self._handle[key] = pysam.Samfile(input_file, "wbu", template = samfile)
-        return self._handle[key]
-
-
-    def _get_intervals(self, temp, samfile):
-        region_names = {}
-        intervals = os.path.join(temp, "intervals.bed")
-        with open(intervals, "w") as handle:
-            if self._intervals:
-                with open(self._intervals) as source:
-                    for line in source:
-                        fields = line.rstrip("\r\n").split("\t")[:6]
-                        if len(fields) < 4:
-                            assert len(fields) == 3
-                            fields.extend((fields[0] + "*", "0", "+"))
-                        handle.write("\t".join(fields) + "\n")
-
-                        name   = fields[3]
-                        length = int(fields[2]) - int(fields[1])
-                        region_names[name] = region_names.get(name, 0) + length
-            else:
-                for seq in samfile.header["SQ"]:
-                    handle.write("{SN}\t{LN}\n".format(**seq))
-                    region_names[seq["SN"]] = seq["LN"]
-
-                if len(region_names) > self._max_contigs:
-                    self._max_contigs_reached = True
-                    region_names = {}
-            region_names[None] = sum(region_names.itervalues())
-
-            return intervals, region_names
+    def _create_counters(self, samfile, regions):
+        """Returns a dictionary of (sample, library) -> _DepthCounter, and a
+        dictionary of read-group -> list of counters for that read-group."""
+        counters, mapping = {}, {}
+        for (rg_id, rg) in self._get_readgroups(samfile).iteritems():
+            keys = ((None, None), (rg["SM"], None), (rg["SM"], rg["LB"]))
+            for key in keys:
+                if key not in counters:
+                    counters[key] = _DepthCounter(regions)
+            mapping[rg_id] = [counters[key] for key in keys]
+
+        return counters, mapping
+
+
+    def _get_intervals(self, samfile):
+        """Returns a dictionary of tid -> sorted list of (start, end, name)
+        intervals, the region names / sizes written to the table, and the
+        sizes of every region (by name) for which counts are collected."""
+        regions, region_names = {}, {}
+        tids = dict((name, tid) for (tid, name) in enumerate(samfile.references))
+        if self._intervals:
+            with open(self._intervals) as source:
+                for line in source:
+                    fields = line.rstrip("\r\n").split("\t")[:6]
+                    if len(fields) < 4:
+                        assert len(fields) == 3
+                        fields.append(fields[0] + "*")
+
+                    name, start, end = fields[3], int(fields[1]), int(fields[2])
+                    region_names[name] = region_names.get(name, 0) + (end - start)
+
+                    # Intervals on unknown contigs are not covered by any reads
+                    if fields[0] in tids:
+                        regions.setdefault(tids[fields[0]], []).append((start, end, name))
+        else:
+            for (tid, length) in enumerate(samfile.lengths):
+                name = samfile.references[tid]
+                regions[tid] = [(0, length, name)]
+                region_names[name] = length
+
+        region_sizes = dict(region_names)
+        region_sizes[None] = sum(region_names.itervalues())
+
+        if not self._intervals and (len(region_names) > self._max_contigs):
+            # Only the total is counted, but is listed with a size of 0
+            self._max_contigs_reached = True
+            region_names = {}
+            for (tid, intervals) in regions.iteritems():
+                regions[tid] = [(start, end, None) for (start, end, _) in intervals]
+        region_names[None] = sum(region_names.itervalues())
+
+        for intervals in regions.itervalues():
+            intervals.sort()
+
+        return regions, region_names, region_sizes
 
 
     @classmethod
@@ -322,6 +293,129 @@ class DepthHistogramNode(Node):
         return readgroups
 
 
+
+class _DepthCounter:
+    """Calculates histograms of read depths for a set of named regions, given
+    the (start, end) coordinates of reads in coordinate sorted order.
+
+    Coordinates are buffered (at most _MAX_BUFFERED_READS at a time), and
+    depths are calculated for windows of at most _MAX_WINDOW_SIZE bases using
+    difference arrays, for positions that cannot be covered by reads not yet
+    seen. Histograms are only created for regions covered by reads; sites not
+    covered by any reads are added to histograms when 'finalize' is called."""
+
+    def __init__(self, regions):
+        self._regions = regions
+        self._histograms = {}
+        self._tid = None
+        self._lo = 0
+        self._intervals = ()
+        self._next_interval = 0
+        self._active = []
+        self._starts = array.array("i")
+        self._ends = array.array("i")
+        self._flush_at = _MAX_BUFFERED_READS
+
+
+    def add(self, tid, start, end):
+        if tid != self._tid:
+            self._finish_contig()
+            self._tid = tid
+            self._intervals = self._regions.get(tid, ())
+
+        self._starts.append(start)
+        self._ends.append(end)
+        if len(self._starts) >= self._flush_at:
+            # Positions before 'start' will not be covered by later reads
+            self._advance(start)
+            # Avoids repeated flushes at sites covered by very many reads
+            self._flush_at = len(self._starts) + _MAX_BUFFERED_READS
+
+
+    def finalize(self, region_sizes):
+        """Returns a dictionary of region name -> list of counts, where the
+        last value is the number of sites covered by _MAX_DEPTH or more reads.
+        'region_sizes' is used to count sites not covered by any reads."""
+        self._finish_contig()
+
+        result = {}
+        for (name, counts) in self._histograms.iteritems():
+            counts[0] += region_sizes[name] - counts.sum()
+            result[name] = counts.tolist()
+
+        if None not in result:
+            result[None] = [region_sizes[None]] + [0] * _MAX_DEPTH
+        return result
+
+
+    def _finish_contig(self):
+        if self._intervals:
+            self._advance(max(end for (_, end, _) in self._intervals))
+
+        self._lo = 0
+        self._intervals = ()
+        self._next_interval = 0
+        self._active = []
+        self._starts = array.array("i")
+        self._ends = array.array("i")
+        self._flush_at = _MAX_BUFFERED_READS
+
+
+    def _advance(self, position):
+        """Counts the depths of sites in regions before 'position'."""
+        intervals = self._intervals
+        starts = numpy.frombuffer(self._starts, dtype = numpy.intc)
+        ends = numpy.frombuffer(self._ends, dtype = numpy.intc)
+
+        while self._lo < position:
+            lo, hi = self._lo, min(position, self._lo + _MAX_WINDOW_SIZE)
+            while (self._next_interval < len(intervals)) and (intervals[self._next_interval][0] < hi):
+                self._active.append(intervals[self._next_interval])
+                self._next_interval += 1
+
+            if not self._active:
+                # Skip to the next interval; sites outside intervals are ignored
+                if self._next_interval < len(intervals):
+                    self._lo = min(position, intervals[self._next_interval][0])
+                else:
+                    self._lo = position
+                continue
+
+            depths = None
+            if len(starts):
+                width = hi - lo
+                diff = numpy.bincount(starts.clip(lo, hi) - lo, minlength = width + 1) \
+                    - numpy.bincount(ends.clip(lo, hi) - lo, minlength = width + 1)
+                depths = numpy.cumsum(diff[:width]).clip(0, _MAX_DEPTH)
+
+            if (depths is not None) and depths.any():
+                for (start, end, name) in self._active:
+                    start, end = max(start, lo), min(end, hi)
+                    if start < end:
+                        counts = numpy.bincount(depths[start - lo:end - lo], minlength = _MAX_DEPTH + 1)
+                        self._add_counts(name, counts)
+                        if name is not None:
+                            self._add_counts(None, counts)
+
+            self._active = [interval for interval in self._active if interval[1] > hi]
+            self._lo = hi
+
+        # Reads ending before 'position' no longer contribute to depths
+        if len(ends):
+            keep = ends > position
+            if not keep.all():
+                self._starts = array.array("i", starts[keep].tostring())
+                self._ends = array.array("i", ends[keep].tostring())
+
+
+    def _add_counts(self, name, counts):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            self._histograms[name] = counts.astype(numpy.int64)
+        else:
+            histogram += counts
+
+
 _HEADER = \
 """# Timestamp: %s
 #
@@ -25,7 +25,7 @@ import os
 import pypeline.common.fileutils as fileutils
 from pypeline.node import CommandNode, MetaNode
 from pypeline.atomiccmd.command import AtomicCmd
-from pypeline.atomiccmd.builder import AtomicJavaCmdBuilder
+from pypeline.atomiccmd.builder import AtomicJavaCmdBuilder, JAVA_MAX_HEAP_SIZE
 from pypeline.atomiccmd.sets import ParallelCmds
 from pypeline.common.fileutils import swap_ext
 from pypeline.common.utilities import safe_coerce_to_tuple
@@ -50,6 +50,7 @@ class _IndelTrainerNode(CommandNode):
         CommandNode.__init__(self,
                              description  = description,
                              command      = command.finalize(),
+                             memory       = JAVA_MAX_HEAP_SIZE,
                              dependencies = dependencies)
 
 
@@ -87,6 +88,7 @@ class _IndelRealignerNode(CommandNode):
                              description  = description,
                              command      = ParallelCmds([command.finalize(),
                                                           calmd]),
+                             memory       = JAVA_MAX_HEAP_SIZE,
                              dependencies = dependencies)
 
 
@@ -25,9 +25,12 @@ import os
 from pypeline.node import CommandNode
 from pypeline.atomiccmd.command import AtomicCmd
 from pypeline.atomiccmd.builder import \
+     AtomicCmdBuilder, \
      AtomicJavaCmdBuilder, \
+     JAVA_MAX_HEAP_SIZE, \
      create_customizable_cli_parameters, \
      use_customizable_cli_parameters
+from pypeline.nodes.bwa import PYSAM_VERSION
 from pypeline.common.fileutils import swap_ext, describe_files
 from pypeline.common.utilities import safe_coerce_to_tuple
 import pypeline.common.versions as versions
@@ -65,6 +68,7 @@ class ValidateBAMNode(CommandNode):
         CommandNode.__init__(self,
                              command      = parameters.command.finalize(),
                              description  = "<Validate BAM: '%s'>" % (parameters.input_bam,),
+                             memory       = JAVA_MAX_HEAP_SIZE,
                              dependencies = parameters.dependencies)
 
 
@@ -91,6 +95,7 @@ class BuildSequenceDictNode(CommandNode):
         CommandNode.__init__(self,
                              command      = parameters.command.finalize(),
                              description  = "<SequenceDictionary: '%s'>" % (parameters.reference,),
+                             memory       = JAVA_MAX_HEAP_SIZE,
                              dependencies = parameters.dependencies)
 
 
@@ -131,6 +136,8 @@ class MarkDuplicatesNode(CommandNode):
         CommandNode.__init__(self,
                              command      = parameters.command.finalize(),
                              description  = description,
+                             memory       = JAVA_MAX_HEAP_SIZE,
+                             io_weight    = 1,
                              dependencies = parameters.dependencies)
 
 
@@ -165,42 +172,39 @@ class MergeSamFilesNode(CommandNode):
         CommandNode.__init__(self,
                              command      = parameters.command.finalize(),
                              description  = description,
+                             memory       = JAVA_MAX_HEAP_SIZE,
+                             io_weight    = 1,
                              dependencies = parameters.dependencies)
 
 
 
 
-def concatenate_input_bams(config, input_bams, out = AtomicCmd.PIPE):
+def concatenate_input_bams(_config, input_bams, out = AtomicCmd.PIPE):
     """Transparent concatenation of input BAMs.
 
     Return a tuple containing a list of nodes (0 or 1), and an
     object which may be passed to the IN_STDIN of an AtomicCmd
     (either an AtomicCmd, or a filename). This allows transparent
     concatenation when multiple files are specified, while
-    avoiding needless overhead when there is only 1 input file."""
+    avoiding needless overhead when there is only 1 input file.
+
+    BAMs are merged using 'bam_merge' (pysam), rather than Picard
+    MergeSamFiles, to avoid starting a JVM for every such node."""
 
     input_bams = safe_coerce_to_tuple(input_bams)
     if len(input_bams) == 1:
         return [], input_bams[0]
 
-    jar_file = os.path.join(config.jar_root, "MergeSamFiles.jar")
-    params = AtomicJavaCmdBuilder(config, jar_file)
-    params.set_kwargs(CHECK_JAR  = _picard_version(jar_file))
-
+    params = AtomicCmdBuilder("bam_merge",
+                              CHECK_PYSAM = PYSAM_VERSION)
     if out == AtomicCmd.PIPE:
         params.set_kwargs(OUT_STDOUT = out)
-        params.set_option("OUTPUT", "/dev/stdout", sep = "=")
     else:
-        params.set_option("OUTPUT", out, sep = "=")
+        params.set_option("--output", out)
 
-    params.set_option("CREATE_INDEX", "False", sep = "=")
-    params.set_option("COMPRESSION_LEVEL",  0, sep = "=")
-
-    for (index, filename) in enumerate(safe_coerce_to_tuple(input_bams), start = 1):
-        params.add_option("I", "%%(IN_BAM_%02i)s" % index, sep = "=")
+    for (index, filename) in enumerate(input_bams, start = 1):
+        params.add_value("%%(IN_BAM_%02i)s" % index)
         params.set_kwargs(**{"IN_BAM_%02i" % index : filename})
 
-    params.set_option("SO", "coordinate", sep = "=", fixed = False)
-
     cmd = params.finalize()
     return [cmd], cmd
@@ -41,7 +41,10 @@ SAMTOOLS_VERSION = versions.Requirement(call   = ("samtools",),
 
 class GenotypeNode(CommandNode):
     @create_customizable_cli_parameters
-    def customize(cls, reference, infile, outfile, regions = None, dependencies = ()):
+    def customize(cls, reference, infile, outfile, regions = None, threads = 1, dependencies = ()):
+        """If 'threads' is greater than one, contigs are genotyped in parallel
+        (see 'bam_genotype_sharded'), using the FASTA index of the reference;
+        this requires that 'infile' has been indexed (see BAMIndexNode)."""
         assert outfile.lower().endswith(".vcf.bgz")
 
         pileup = AtomicCmdBuilder(["samtools", "mpileup"],
@@ -63,7 +66,6 @@ class GenotypeNode(CommandNode):
         genotype.add_value("-")
 
         bgzip    = AtomicCmdBuilder(["bgzip"],
-                                IN_STDIN     = genotype,
                                 OUT_STDOUT   = outfile)
 
         return {"commands" : {"pileup"   : pileup,
@@ -73,15 +75,47 @@ class GenotypeNode(CommandNode):
 
     @use_customizable_cli_parameters
     def __init__(self, parameters):
-        commands = [parameters.commands[key].finalize() for key in ("pileup", "genotype", "bgzip")]
+        if parameters.threads > 1:
+            commands = [self._build_sharded_command(parameters)]
+        else:
+            commands = [parameters.commands[key].finalize() for key in ("pileup", "genotype")]
+
+        bgzip = parameters.commands["bgzip"]
+        bgzip.set_kwargs(IN_STDIN = commands[-1])
+        commands.append(bgzip.finalize())
+
         description = "<Genotyper: '%s' -> '%s'>" % (parameters.infile,
                                                      parameters.outfile)
         CommandNode.__init__(self,
                              description  = description,
                              command      = ParallelCmds(commands),
+                             threads      = parameters.threads,
                              dependencies = parameters.dependencies)
 
 
+    @classmethod
+    def _build_sharded_command(cls, parameters):
+        """Wraps the (customized) pileup and genotype calls in a call to
+        'bam_genotype_sharded', which runs these for each contig."""
+        pileup = parameters.commands["pileup"]
+        call = ["bam_genotype_sharded",
+                "--processes", parameters.threads,
+                "--fai", "%(IN_FAI)s",
+                "--temp-dir", "%(TEMP_DIR)s"]
+        if parameters.regions:
+            call.extend(("--regions", "%(IN_REGIONS)s"))
+        call.extend(pileup.call)
+        call.append("|")
+        call.extend(parameters.commands["genotype"].call)
+
+        return AtomicCmd(call,
+                         IN_FAI        = parameters.reference + ".fai",
+                         IN_BAI        = swap_ext(parameters.infile, ".bai"),
+                         EXEC_SAMTOOLS = "samtools",
+                         EXEC_BCFTOOLS = "bcftools",
+                         **pileup.kwargs)
+
+
 class MPileupNode(CommandNode):
     pileup_args = "-EA"
 
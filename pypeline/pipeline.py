@@ -20,13 +20,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+import os
 import sys
-import time
+import errno
+import Queue
+import select
 import signal
+import functools
 import multiprocessing
 
 import pypeline.ui as ui
+import pypeline.runtimes as runtimes
 from pypeline.node import Node
+from pypeline.journal import NodeJournal, checksum_files
+from pypeline.runtimes import RuntimeDatabase
 from pypeline.nodegraph import NodeGraph, NodeGraphError
 from pypeline.common.utilities import safe_coerce_to_tuple
 
@@ -47,53 +54,78 @@ class Pypeline:
                 self._nodes.append(node)
 
 
-    def run(self, max_running = 6, dry_run = False, collapse = True, verbose = True):
+    def run(self, max_running = 6, dry_run = False, collapse = True, verbose = True, journal = None, checksums = False,
+            max_memory = None, max_io_weight = None, database = None):
+        """Runs all nodes, using at most 'max_running' threads, and (if not None)
+        at most 'max_memory' memory (in MB) and 'max_io_weight' IO, as specified
+        by the 'memory' and 'io_weight' properties of nodes. If a filename is
+        given for 'journal', nodes that complete are recorded in that file. If
+        'checksums' is also true, the checksums of input files are recorded,
+        and nodes whose input files have been touched, but whose contents are
+        unchanged, are not considered to be outdated (see NodeJournal).
+        If a filename is given for 'database', the resources used by nodes are
+        recorded in that file (see RuntimeDatabase), and used to prioritize
+        nodes and to estimate the remaining runtime in later runs."""
+        if journal is not None:
+            journal = NodeJournal(journal, checksums = checksums)
+        if database is not None:
+            database = RuntimeDatabase(database)
+
+        estimates = None
+        if (database is not None) and len(database):
+            estimates = database.estimate
+
         try:
-            nodegraph = NodeGraph(self._nodes)
+            nodegraph = NodeGraph(self._nodes, journal = journal, runtimes = estimates)
         except NodeGraphError, error:
             ui.print_err(error, file = sys.stderr)
             return False
 
-        # calculate remaining nodes
-        remaining = set(nodegraph.iterflat())
-        for node in remaining:
-            if node.threads > max_running:
-                ui.print_err("Node requires more threads than the maximum allowed:\n\t%s" \
-                             % str(node), file = sys.stderr)
-                return False
+        limits = (max_running, max_memory, max_io_weight)
+        for node in nodegraph.iterflat():
+            for (name, required, limit) in zip(_RESOURCE_NAMES, _get_resources(node), limits):
+                if (limit is not None) and (required > limit):
+                    ui.print_err("Node requires more %s than the maximum allowed:\n\t%s" \
+                                 % (name, str(node)), file = sys.stderr)
+                    return False
 
         if dry_run:
-            ui.print_node_tree(nodegraph, collapse)
+            ui.print_node_tree(nodegraph, collapse, limits = limits)
             ui.print_info("Dry run done ...", file = sys.stderr)
             return True
 
         running = {}
         interrupted_once = errors = has_refreshed = has_started_any = False
+        completed = _CompletionQueue()
         pool = multiprocessing.Pool(max_running, _init_worker)
         # Run node commands
-        while running or remaining:
+        while True:
             try:
-                errors |= not self._poll_running_nodes(running, nodegraph)
                 if not interrupted_once: # Prevent starting of new nodes
-                    if self._start_new_tasks(remaining, running, nodegraph, max_running, pool):
+                    if self._start_new_tasks(running, nodegraph, limits, pool, completed, journal):
                         has_started_any = True
                         has_refreshed = False
-                    elif has_started_any and not has_refreshed:
+                    elif has_started_any and not (running or has_refreshed):
                         # Double-check that everything is in order
-                        remaining = set(nodegraph.iterflat())
                         nodegraph.refresh_states()
                         has_refreshed = True
+                        continue
+
+                if not running:
+                    break
 
-                if running:
-                    ui.print_node_tree(nodegraph, collapse, verbose)
+                ui.print_node_tree(nodegraph, collapse, verbose, limits)
+                errors |= not self._wait_for_running_nodes(running, nodegraph, completed, journal, database)
             except KeyboardInterrupt:
                 if interrupted_once:
                     ui.print_err("\nTerminating now!\n", file = sys.stderr)
                     pool.terminate()
                     pool.join()
+                    completed.close()
+                    _close_all(journal, database)
                     return False
 
-                remaining, interrupted_once = set(), True
+                interrupted_once = True
                 ui.print_err("\nKeyboard interrupt detected, waiting for current tasks to complete ...",
                              file = sys.stderr)
                 ui.print_err("\t- Press CTRL-C again to force termination.\n",
@@ -102,6 +134,8 @@ class Pypeline:
         ui.print_node_tree(nodegraph, collapse)
         pool.close()
         pool.join()
+        completed.close()
+        _close_all(journal, database)
 
         if errors:
             ui.print_err("Errors were detected ...", file = sys.stderr)
@@ -109,55 +143,50 @@ class Pypeline:
         return not errors
 
 
-    def _start_new_tasks(self, remaining, running, nodegraph, max_threads, pool):
-        started_nodes  = []
-        idle_processes = max_threads - sum(node.threads for node in running)
-        for node in remaining:
-            if (idle_processes >= node.threads):
-                state = nodegraph.get_node_state(node)
-                if (state == nodegraph.RUNABLE):
-                    started_nodes.append(node)
-                    running[node] = pool.apply_async(_call_run, args = (node, self._config))
-                    nodegraph.set_node_state(node, nodegraph.RUNNING)
-                    idle_processes -= node.threads
-                elif (state in (nodegraph.DONE, nodegraph.ERROR)):
-                    started_nodes.append(node)
-            elif not idle_processes:
+    def _start_new_tasks(self, running, nodegraph, limits, pool, completed, journal = None):
+        """Starts runable nodes until either all threads are in use, or until no
+        more nodes can be started within the (threads, memory, io_weight) limits.
+        Returns true if any nodes were started."""
+        checksums = (journal is not None) and journal.checksums
+        started_any = False
+        while True:
+            idle = _get_idle_resources(running, limits)
+            if idle[0] <= 0:
                 break
 
-        for node in started_nodes:
-            remaining.remove(node)
+            node = nodegraph.pop_runable_node(*idle)
+            if node is None:
+                break
+
+            running[node] = pool.apply_async(_call_run,
+                                             args     = (node, self._config, checksums),
+                                             callback = functools.partial(completed.put, node))
+            nodegraph.set_node_state(node, nodegraph.RUNNING)
+            started_any = True
 
-        return bool(remaining)
+        return started_any
 
 
     @classmethod
-    def _poll_running_nodes(cls, running, nodegraph):
-        sleep_time = 0.05
-        changes = errors = False
-        while running and not (errors or changes):
-            for (node, proc) in running.items():
-                if not proc.ready():
-                    continue
-                changes = True
-
-                try:
-                    proc.get()
-                except (KeyboardInterrupt, SystemExit):
-                    raise
-                except Exception, errors:
-                    nodegraph.set_node_state(node, nodegraph.ERROR)
-                    running.pop(node)
-                    ui.print_err("%s: Error occurred running command:\n%s\n" \
-                                     % (node, "\n".join(("\t" + line) for line in str(errors).strip().split("\n"))),
-                                 file = sys.stderr)
-                    continue
+    def _wait_for_running_nodes(cls, running, nodegraph, completed, journal, database):
+        """Blocks until one or more running nodes have finished, and updates
+        the states of those nodes. Returns false if any errors occured."""
+        errors = False
+        for (node, (error, usage, checksums)) in completed.get():
+            running.pop(node)
+            if error is None:
+                if journal is not None:
+                    journal.add(node, checksums)
+                if database is not None:
+                    database.add(node, usage)
                 nodegraph.set_node_state(node, nodegraph.DONE)
-                running.pop(node)
+                continue
 
-            if not (errors or changes):
-                time.sleep(sleep_time)
-                sleep_time = min(1, sleep_time * 2)
+            errors = True
+            nodegraph.set_node_state(node, nodegraph.ERROR)
+            ui.print_err("%s: Error occurred running command:\n%s\n" \
+                             % (node, "\n".join(("\t" + line) for line in str(error).strip().split("\n"))),
+                         file = sys.stderr)
 
         return not errors
 
@@ -167,14 +196,105 @@ class Pypeline:
 
 
 
+def _get_resources(node):
+    """Returns the (threads, memory, io_weight) required to run a node."""
+    return (node.threads, node.memory, node.io_weight)
+
+
+def _get_idle_resources(running, limits):
+    """Returns the (threads, memory, io_weight) not used by running nodes;
+    resources without limits (None) are returned as None."""
+    used = [0] * len(limits)
+    for node in running:
+        for (index, value) in enumerate(_get_resources(node)):
+            used[index] += value
+
+    return tuple((None if limit is None else limit - value)
+                 for (limit, value) in zip(limits, used))
+
+
 def _init_worker():
     """Init function for subprocesses created by multiprocessing.Pool: Ensures that KeyboardInterrupts
     only occur in the main process, allowing us to do proper cleanup."""
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
-def _call_run(node, config):
+def _call_run(node, config, checksums = False):
     """Wrapper function, required in order to call Node.run()
     in subprocesses, since it is not possible to pickle
-    bound functions (e.g. self.run)"""
-    return node.run(config)
+    bound functions (e.g. self.run). Errors are returned rather
+    than raised, since Pool.apply_async (Python v2.x) does not
+    call the callback function for tasks that raise exceptions.
+
+    Returns a tuple of the error (if any), of the resources
+    used by the node (see runtimes.usage_since), and (if
+    'checksums' is true) of the checksums of the input files
+    of the node, for use by the journal (see checksum_files).
+    These are calculated here, to avoid blocking the main
+    process while large files are read."""
+    before = runtimes.get_usage()
+    try:
+        node.run(config)
+    except Exception, error: # pylint: disable=W0703
+        return (error, None, None)
+    usage = runtimes.usage_since(before)
+
+    input_checksums = None
+    if checksums:
+        try:
+            input_checksums = checksum_files(node.input_files)
+        except (IOError, OSError):
+            # Missing input files are handled by NodeJournal.add
+            pass
+    return (None, usage, input_checksums)
+
+
+def _close_all(*handles):
+    """Closes journals / databases, ignoring None values."""
+    for handle in handles:
+        if handle is not None:
+            handle.close()
+
+
+
+class _CompletionQueue:
+    """Queue of (node, result) tuples for nodes that have finished running;
+    'put' is called by the result-handler thread of a multiprocessing.Pool.
+
+    A pipe is used to signal the main thread, since a blocking Queue.get can
+    not be interrupted by CTRL-C (Python v2.x), and since Queue.get with a
+    timeout is implemented by polling. Waiting on the pipe using 'select'
+    allows the main loop to wake up as soon as a node has finished."""
+    def __init__(self):
+        self._queue = Queue.Queue()
+        self._read_fd, self._write_fd = os.pipe()
+
+    def put(self, node, result):
+        self._queue.put((node, result))
+        os.write(self._write_fd, "x")
+
+    def get(self):
+        """Blocks until at least one item is available (or a signal is
+        recieved), and returns all queued (node, result) tuples."""
+        try:
+            select.select([self._read_fd], [], [])
+        except select.error, error:
+            if error.args[0] != errno.EINTR:
+                raise
+            return []
+        os.read(self._read_fd, 4096)
+
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except Queue.Empty:
+                return items
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+# Names of the resources returned by _get_resources, used in error messages
+_RESOURCE_NAMES = ("threads", "memory", "IO")
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Database of the resources used by nodes in previous runs.
+
+Each line of the database is a JSON object describing a single (successful)
+run of a node: The class of the node, the total size of its input files, and
+the wall-clock time, CPU time, and peak RSS used by the node. These records
+are used to estimate the runtime of nodes in later runs, which in turn is
+used to prioritize nodes (see NodeGraph) and to estimate the remaining
+runtime of the pipeline.
+"""
+import os
+import json
+import time
+import errno
+import resource
+import collections
+
+import pypeline.common.fileutils as fileutils
+from pypeline.node import MetaNode
+
+
+class RuntimeDatabase:
+    def __init__(self, filename):
+        self._filename = filename
+        self._records = {}
+        self._estimates = {}
+        self._lines = 0
+        self._read_database()
+
+        # Opened here, to catch problems with the database before running nodes
+        dirname = os.path.dirname(filename)
+        if dirname:
+            fileutils.make_dirs(dirname)
+        self._handle = open(filename, "a")
+
+
+    def add(self, node, usage):
+        """Records the resources used by a node, as returned by 'usage_since'.
+        Must be called once the node has completed, since the size of input
+        files may change while the node is running."""
+        size = _get_input_size(node)
+        if (usage is None) or (size is None):
+            return
+
+        record = dict(usage)
+        record["key"]  = _get_key(node)
+        record["size"] = size
+        self._add_record(record)
+
+        self._handle.write(_to_line(record))
+        self._handle.flush()
+        self._lines += 1
+
+
+    def estimate(self, node):
+        """Returns the expected wall-clock time (in seconds) for running a node,
+        based on previous runs of nodes of the same class. If the total size of
+        the input files is known (uses the active FileStatusCache, if any), the
+        expected runtime is scaled by the size of the input files. For classes
+        without any records, the median runtime of all classes is returned."""
+        if isinstance(node, MetaNode):
+            return 0
+
+        estimates = self._get_estimates(_get_key(node))
+        if estimates is None:
+            return self._get_default_estimate()
+
+        (seconds, seconds_per_byte) = estimates
+        if seconds_per_byte is not None:
+            size = _get_input_size(node)
+            if size:
+                return seconds_per_byte * size
+        return seconds
+
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.itervalues())
+
+
+    def _add_record(self, record):
+        records = self._records.get(record["key"])
+        if records is None:
+            records = self._records[record["key"]] = collections.deque(maxlen = _MAX_RECORDS)
+        records.append(record)
+
+        # Estimates are calculated on demand
+        self._estimates.pop(record["key"], None)
+        self._estimates.pop(None, None)
+
+
+    def _get_estimates(self, key):
+        """Returns a tuple of median (wall-clock) seconds and median seconds per
+        byte of input, for the records matching 'key', or None if there are no
+        such records."""
+        try:
+            return self._estimates[key]
+        except KeyError:
+            records = self._records.get(key)
+            if not records:
+                return None
+
+            seconds = _median([record["wall"] for record in records])
+            rates = [record["wall"] / record["size"] for record in records if record["size"]]
+            estimates = self._estimates[key] = (seconds, _median(rates) if rates else None)
+            return estimates
+
+
+    def _get_default_estimate(self):
+        if None not in self._estimates:
+            seconds = [self._get_estimates(key)[0] for key in self._records]
+            self._estimates[None] = _median(seconds) if seconds else 1
+        return self._estimates[None]
+
+
+    def _read_database(self):
+        try:
+            with open(self._filename) as handle:
+                for line in handle:
+                    self._lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Typically caused by a truncated line, due to a crash
+                        continue
+
+                    if _is_valid_record(record):
+                        self._add_record(record)
+        except IOError, error:
+            if error.errno != errno.ENOENT:
+                raise
+
+        # Only the most recent records are kept for each class; compact if needed
+        if self._lines > 2 * len(self) + _MIN_COMPACT_LINES:
+            self._compact_database()
+
+
+    def _compact_database(self):
+        temp_filename = "%s.%i" % (self._filename, os.getpid())
+        with open(temp_filename, "w") as handle:
+            for records in self._records.itervalues():
+                for record in records:
+                    handle.write(_to_line(record))
+        os.rename(temp_filename, self._filename)
+        self._lines = len(self)
+
+
+
+def get_usage():
+    """Returns a snapshot of the resources used so far by the current process
+    and by its (terminated) child processes; see 'usage_since'."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    return (time.time(), cpu_time, own.ru_maxrss, children.ru_maxrss)
+
+
+def usage_since(before):
+    """Returns a dictionary containing the wall-clock time ("wall"), CPU time
+    ("cpu"), both in seconds, and the peak RSS in KB ("rss") used since the
+    snapshot 'before' was taken using 'get_usage'. Since getrusage only
+    reports the peak RSS of a process (and of the largest child process)
+    over its entire lifetime, the peak RSS is only known if it exceeds that
+    of any previous task; otherwise it is None."""
+    after = get_usage()
+
+    peaks = [rss_after for (rss_before, rss_after) in zip(before[2:], after[2:])
+             if rss_after > rss_before]
+
+    return {"wall" : after[0] - before[0],
+            "cpu"  : after[1] - before[1],
+            "rss"  : max(peaks) if peaks else None}
+
+
+def _get_key(node):
+    return "%s.%s" % (node.__class__.__module__, node.__class__.__name__)
+
+
+def _get_input_size(node):
+    """Returns the total size of input files in bytes, or None if any of the
+    input files do not exist. Uses the active FileStatusCache, if any."""
+    size = 0
+    for filename in node.input_files:
+        stats = fileutils.try_stat(filename)
+        if stats is None:
+            return None
+        size += stats.st_size
+    return size
+
+
+def _is_valid_record(record):
+    try:
+        return isinstance(record["key"], basestring) \
+            and (float(record["wall"]) >= 0) \
+            and (int(record["size"]) >= 0)
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def _to_line(record):
+    return json.dumps(record, separators = (",", ":")) + "\n"
+
+
+# Number of records kept for each class of nodes
+_MAX_RECORDS = 50
+# Minimum number of (superseded) lines in the database before compacting
+_MIN_COMPACT_LINES = 1000
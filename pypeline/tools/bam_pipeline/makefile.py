@@ -92,6 +92,10 @@ _DEFAULTS = {
                 "MinQuality"  : 0,
             },
         },
+        # Split trimmed reads into N chunks, aligned independently and merged
+        "SplitReadsIntoChunks" : 1,
+        # Remove chunks of reads and the per-chunk BAMs once merged
+        "RemoveChunks" : False,
 
         # Contains PCR duplicates, filter if true
         "PCRDuplicates"    : True,
@@ -149,6 +153,10 @@ _VALIDATION = {
                                           Or(IsStr, IsInt, IsFloat, IsNone)),
             },
         },
+        # Split trimmed reads into N chunks, aligned independently and merged
+        "SplitReadsIntoChunks" : And(IsInt, IsInRange(1, float("Inf"))),
+        # Remove chunks of reads and the per-chunk BAMs once merged
+        "RemoveChunks" : IsBoolean,
 
         # Contains PCR duplicates, filter if true
         "PCRDuplicates"     : IsBoolean,
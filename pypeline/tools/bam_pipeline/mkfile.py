@@ -91,6 +91,15 @@ _TEMPLATE_BAM_OPTIONS = \
 #       - CN:SequencingCenterNameHere
 #       - DS:DescriptionOfReadGroup
 
+  # Split the trimmed reads of each lane into this number of chunks, which are
+  # aligned independently (in parallel), and then merged; useful for large lanes.
+  # Note that this is the number of chunks, not the number of reads per chunk.
+  SplitReadsIntoChunks: 1
+  # Remove the chunks of reads and the per-chunk BAMs once merged, to save disk
+  # space. Removed chunks are re-created and re-aligned if the pipeline is run
+  # again, which in turn causes the merged BAM (and later steps) to be re-built.
+  RemoveChunks: no
+
   # Filter PCR duplicates
   # Collapsed reads are filtered using Martin Kirchers FilterUnique,
   # while other reads are filtered using Picard MarkDuplicates.
@@ -21,15 +21,20 @@
 # SOFTWARE.
 #
 import os
+import gzip
+import itertools
 
-from pypeline.node import CommandNode, MetaNode
+from pypeline.node import Node, CommandNode, MetaNode
 from pypeline.atomiccmd.command import AtomicCmd
 from pypeline.atomiccmd.sets import ParallelCmds, SequentialCmds
-from pypeline.atomiccmd.builder import AtomicJavaCmdBuilder
 
-from pypeline.nodes.picard import ValidateBAMNode, concatenate_input_bams
+from pypeline.nodes.picard import ValidateBAMNode, MergeSamFilesNode, \
+     concatenate_input_bams
 from pypeline.nodes.samtools import BAMIndexNode
-from pypeline.common.fileutils import describe_files
+from pypeline.nodes.bwa import PYSAM_VERSION
+from pypeline.common.fileutils import describe_files, open_ro, \
+     reroot_path, move_file, try_remove
+from pypeline.common.formats.fastq import split_fastq
 
 import pypeline.common.versions as versions
 
@@ -109,9 +114,12 @@ class MapDamageRescaleNode(CommandNode):
 
 
 class FilterCollapsedBAMNode(CommandNode):
-    def __init__(self, config, input_bams, output_bam, dependencies = ()):
+    def __init__(self, config, input_bams, output_bam, threads = 1, dependencies = ()):
+        """If 'threads' is greater than one, the output is compressed using
+        multiple threads (see 'bam_rmdup_collapsed --max-threads')."""
         cat_cmds, cat_obj = concatenate_input_bams(config, input_bams)
-        filteruniq = AtomicCmd(["bam_rmdup_collapsed", "--remove-duplicates"],
+        filteruniq = AtomicCmd(["bam_rmdup_collapsed", "--remove-duplicates",
+                                "--max-threads", threads],
                                IN_STDIN   = cat_obj,
                                OUT_STDOUT = output_bam)
 
@@ -120,6 +128,7 @@ class FilterCollapsedBAMNode(CommandNode):
         CommandNode.__init__(self,
                              command      = command,
                              description  = description,
+                             threads      = threads,
                              dependencies = dependencies)
 
 
@@ -174,38 +183,93 @@ class IndexAndValidateBAMNode(MetaNode):
 
 
 class CleanupBAMNode(CommandNode):
-    def __init__(self, config, reference, input_bam, output_bam, tags, min_mapq = 0, dependencies = ()):
-        flt = AtomicCmd(["samtools", "view", "-bu", "-F0x4", "-q%i" % min_mapq, "%(IN_BAM)s"],
-                        IN_BAM  = input_bam,
-                        OUT_STDOUT = AtomicCmd.PIPE)
-
-        jar_file = os.path.join(config.jar_root, "AddOrReplaceReadGroups.jar")
-        params = AtomicJavaCmdBuilder(config, jar_file)
-        params.set_option("INPUT", "/dev/stdin", sep = "=")
-        params.set_option("OUTPUT", "/dev/stdout", sep = "=")
-        params.set_option("QUIET", "true", sep = "=")
-        params.set_option("COMPRESSION_LEVEL", "0", sep = "=")
+    def __init__(self, config, reference, input_bam, output_bam, tags, min_mapq = 0, threads = 1, dependencies = ()):
+        """Filters unmapped / low quality reads, replaces read-groups, and
+        recalculates MD / NM tags in a single pass (see 'bam_cleanup')."""
+        call = ["bam_cleanup",
+                "--reference", "%(IN_REF)s",
+                "--min-quality", min_mapq,
+                "--max-threads", threads,
+                "--rg-id", tags["ID"]]
 
         for (tag, value) in sorted(tags.iteritems()):
-            if tag not in ("PG", "Target", "PU_src", "PU_cur"):
-                params.set_option(tag, value, sep = "=")
+            if tag not in ("ID", "PG", "Target", "PU_src", "PU_cur"):
+                call.extend(("--rg", "%s:%s" % (tag, value)))
             elif tag == "PU_src":
-                params.set_option("PU", value, sep = "=")
+                call.extend(("--rg", "PU:%s" % (value,)))
+        call.append("%(IN_BAM)s")
 
-        params.set_kwargs(IN_STDIN   = flt,
-                         OUT_STDOUT = AtomicCmd.PIPE)
-        annotate = params.finalize()
-
-        calmd = AtomicCmd(["samtools", "calmd", "-b", "-", "%(IN_REF)s"],
-                          IN_REF   = reference,
-                          IN_STDIN = annotate,
-                          OUT_STDOUT = output_bam)
+        cleanup = AtomicCmd(call,
+                            IN_BAM      = input_bam,
+                            IN_REF      = reference,
+                            IN_REF_FAI  = reference + ".fai",
+                            OUT_STDOUT  = output_bam,
+                            CHECK_PYSAM = PYSAM_VERSION)
 
         description =  "<Cleanup BAM: %s -> '%s'>" \
             % (input_bam, output_bam)
         CommandNode.__init__(self,
-                             command      = ParallelCmds([flt, annotate, calmd]),
+                             command      = cleanup,
                              description  = description,
+                             threads      = threads,
                              dependencies = dependencies)
 
 
+
+class SplitFASTQNode(Node):
+    def __init__(self, input_files, output_files, dependencies = ()):
+        """Splits one or more FASTQ files (e.g. the two mates of a set of PE
+        reads) into N chunks, using 'split_fastq'. 'output_files' contains a
+        list of N (GZip compressed) filenames for each input file."""
+        assert len(input_files) == len(output_files)
+        self._input_files = tuple(input_files)
+        self._output_files = [tuple(filenames) for filenames in output_files]
+
+        description = "<SplitFASTQ: %s -> %i chunks>" \
+            % (describe_files(self._input_files), len(self._output_files[0]))
+        Node.__init__(self,
+                      description  = description,
+                      input_files  = self._input_files,
+                      output_files = list(itertools.chain(*self._output_files)),
+                      dependencies = dependencies)
+
+
+    def _run(self, _config, temp):
+        handles, outputs = [], []
+        try:
+            for filename in self._input_files:
+                handles.append(open_ro(filename))
+            for filenames in self._output_files:
+                # Chunks are read once, so speed is preferred over compression
+                outputs.append([gzip.open(reroot_path(temp, filename), "wb", 1)
+                                for filename in filenames])
+
+            split_fastq(handles, outputs)
+        finally:
+            for handle in itertools.chain(handles, *outputs):
+                handle.close()
+
+        for filename in itertools.chain(*self._output_files):
+            move_file(reroot_path(temp, filename), filename)
+
+
+
+class MergeChunksNode(MergeSamFilesNode):
+    def __init__(self, config, input_bams, output_bam, intermediate_files = (), dependencies = ()):
+        """Merges the BAMs produced by aligning each chunk of a lane. Once the
+        merged BAM has been created, the 'intermediate_files' (e.g. the chunk
+        BAMs and the chunks of reads), if any, are removed. Note that removed
+        files are re-created when the pipeline is re-run, as the nodes that
+        produced them are no longer done."""
+        self._intermediate_files = tuple(intermediate_files)
+        MergeSamFilesNode.__init__(self,
+                                   config       = config,
+                                   input_bams   = input_bams,
+                                   output_bam   = output_bam,
+                                   dependencies = dependencies)
+
+
+    def _teardown(self, config, temp):
+        MergeSamFilesNode._teardown(self, config, temp)
+        for filename in self._intermediate_files:
+            try_remove(filename)
@@ -25,16 +25,21 @@ import copy
 
 from pypeline.nodes.bwa import BWANode
 from pypeline.nodes.bowtie2 import Bowtie2Node
+from pypeline.common.fileutils import swap_ext
 from pypeline.common.utilities import safe_coerce_to_tuple
 
 import pypeline.tools.bam_pipeline.paths as paths
 from pypeline.tools.bam_pipeline.parts import Reads
 from pypeline.tools.bam_pipeline.nodes import CleanupBAMNode, \
-                                              IndexAndValidateBAMNode
+                                              IndexAndValidateBAMNode, \
+                                              SplitFASTQNode, \
+                                              MergeChunksNode
 from pypeline.atomiccmd.builder import apply_options
 
 #
 _TRIMMED_READS_CACHE = {}
+# Chunks of trimmed reads are shared between prefixes, unless removed once merged
+_SPLIT_READS_CACHE = {}
 
 
 class Lane:
@@ -66,6 +71,7 @@ class Lane:
                               input_bam    = input_filename,
                               output_bam   = output_filename,
                               tags         = self.tags,
+                              threads      = config.cleanup_max_threads,
                               dependencies = prefix["Node"])
 
         validated_node = IndexAndValidateBAMNode(config, prefix, node)
@@ -93,12 +99,79 @@ class Lane:
                           "reference"    : prefix["Reference"],
                           "dependencies" : self.reads.nodes + (prefix["Node"],)}
 
-            alignment_node = aln_func(config, parameters, input_filename, self.tags, record["Options"])
+            if record["Options"]["SplitReadsIntoChunks"] > 1:
+                alignment_node = self._build_chunked_alignment_node(config, parameters, aln_func,
+                                                                    key, input_filename,
+                                                                    record["Options"])
+            else:
+                alignment_node = aln_func(config, parameters, input_filename, self.tags, record["Options"])
             validated_node = IndexAndValidateBAMNode(config, prefix, alignment_node)
 
             self.bams[key] = {output_filename : validated_node}
 
 
+    def _build_chunked_alignment_node(self, config, parameters, aln_func, key, input_filename, options):
+        """Aligns each chunk of the trimmed reads (see SplitFASTQNode) as a
+        separate node, and merges the resulting BAMs into the final output
+        file, allowing large lanes to be aligned in parallel. If the option
+        'RemoveChunks' is set, the chunks are removed once merged."""
+        output_filename = parameters["output_file"]
+        split_node, chunks = self._build_split_reads_node(key, input_filename, output_filename, options)
+
+        input_bams, nodes = [], []
+        for (index, chunk_filename) in enumerate(chunks):
+            chunk_parameters = dict(parameters)
+            chunk_parameters["output_file"] = swap_ext(output_filename, ".chunk%03i.bam" % (index,))
+            chunk_parameters["dependencies"] = (split_node,) + parameters["dependencies"]
+
+            nodes.append(aln_func(config, chunk_parameters, chunk_filename, self.tags, options))
+            input_bams.append(chunk_parameters["output_file"])
+
+        intermediate_files = ()
+        if options["RemoveChunks"]:
+            intermediate_files = tuple(input_bams) + tuple(split_node.output_files)
+
+        return MergeChunksNode(config             = config,
+                               input_bams         = input_bams,
+                               output_bam         = output_filename,
+                               intermediate_files = intermediate_files,
+                               dependencies       = nodes)
+
+
+    def _build_split_reads_node(self, key, input_filename, output_filename, options):
+        """The number of chunks is fixed, rather than the number of reads per
+        chunk, since the number of reads is not known until the reads have
+        been trimmed, after the graph of nodes has been built."""
+        num_chunks = options["SplitReadsIntoChunks"]
+        if options["RemoveChunks"]:
+            # Kept per prefix, as the merge for one prefix removes the chunks
+            return self._build_split_reads_node_in(swap_ext(output_filename, ""), input_filename, num_chunks)
+
+        cache_key = (input_filename, num_chunks)
+        if cache_key not in _SPLIT_READS_CACHE:
+            prefix = os.path.join(self.reads.folder, "chunks", key.lower())
+            _SPLIT_READS_CACHE[cache_key] = self._build_split_reads_node_in(prefix, input_filename, num_chunks)
+        return _SPLIT_READS_CACHE[cache_key]
+
+
+    def _build_split_reads_node_in(self, prefix, input_filename, num_chunks):
+        template = "%s.chunk%03i.fastq.gz"
+        if paths.is_paired_end(input_filename):
+            template = "%s.chunk%03i.pair{Pair}.fastq.gz"
+        chunks = [template % (prefix, index) for index in range(num_chunks)]
+
+        input_files = [input_filename]
+        if paths.is_paired_end(input_filename):
+            input_files = [input_filename.format(Pair = pair) for pair in (1, 2)]
+        output_files = [[chunk.format(Pair = pair) for chunk in chunks]
+                        for pair in range(1, len(input_files) + 1)]
+
+        node = SplitFASTQNode(input_files  = input_files,
+                              output_files = output_files,
+                              dependencies = self.reads.nodes)
+        return node, chunks
+
+
 def _select_aligner(options):
     key  = options["Aligners"]["Program"]
     if key == "BWA":
@@ -68,6 +68,8 @@ class Library:
     def _remove_pcr_duplicates(self, config, prefix, bams):
         rmdup_cls = {"collapsed"  : FilterCollapsedBAMNode,
                      "normal"     : MarkDuplicatesNode}
+        rmdup_kwargs = {"collapsed" : {"threads" : config.rmdup_collapsed_max_threads},
+                        "normal"    : {}}
 
         results = {}
         for (key, files_and_nodes) in bams.items():
@@ -75,7 +77,8 @@ class Library:
             node = rmdup_cls[key](config       = config,
                                   input_bams   = files_and_nodes.keys(),
                                   output_bam   = output_filename,
-                                  dependencies = files_and_nodes.values())
+                                  dependencies = files_and_nodes.values(),
+                                  **rmdup_kwargs[key])
             validated_node = IndexAndValidateBAMNode(config, prefix, node)
 
             results[key] = {output_filename : validated_node}
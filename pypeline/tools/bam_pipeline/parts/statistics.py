@@ -90,7 +90,7 @@ def _aggregate_for_prefix(cov, prefix, aoi_name = None, into = None):
 
 def _build_coverage(config, makefile, target, make_summary):
     merged_nodes = []
-    coverage = _build_coverage_nodes(target)
+    coverage = _build_coverage_nodes(config, target)
     for prefix in target.prefixes:
         for (aoi_name, aoi_filename) in _get_aoi(prefix):
             label = _get_prefix_label(prefix.label, aoi_name)
@@ -121,7 +121,7 @@ def _build_coverage(config, makefile, target, make_summary):
     return coverage
 
 
-def _build_coverage_nodes(target):
+def _build_coverage_nodes(config, target):
     coverage = {"Lanes"     : collections.defaultdict(dict),
                 "Libraries" : collections.defaultdict(dict)}
 
@@ -136,15 +136,15 @@ def _build_coverage_nodes(target):
 
                     for lane in library.lanes:
                         for bams in lane.bams.values():
-                            bams = _build_coverage_nodes_cached(bams, target.name, aoi_name, aoi_filename, cache)
+                            bams = _build_coverage_nodes_cached(config, bams, target.name, aoi_name, aoi_filename, cache)
                             coverage["Lanes"][key].update(bams)
 
-                    bams = _build_coverage_nodes_cached(library.bams, target.name, aoi_name, aoi_filename, cache)
+                    bams = _build_coverage_nodes_cached(config, library.bams, target.name, aoi_name, aoi_filename, cache)
                     coverage["Libraries"][key].update(bams)
     return coverage
 
 
-def _build_coverage_nodes_cached(files_and_nodes, target_name, aoi_name, aoi_filename, cache):
+def _build_coverage_nodes_cached(config, files_and_nodes, target_name, aoi_name, aoi_filename, cache):
     output_ext = ".coverage"
     if aoi_name:
         output_ext = ".%s.coverage" % aoi_name
@@ -159,6 +159,7 @@ def _build_coverage_nodes_cached(files_and_nodes, target_name, aoi_name, aoi_fil
                                             output_file    = output_filename,
                                             target_name    = target_name,
                                             intervals_file = aoi_filename,
+                                            threads        = config.coverage_max_threads,
                                             dependencies   = node)
 
         coverages[output_filename] = cache[cache_key]
@@ -35,6 +35,7 @@ import pypeline.ui as ui
 from pypeline.node import MetaNode
 from pypeline.nodes.picard import BuildSequenceDictNode
 from pypeline.nodes.samtools import FastaIndexNode, BAMIndexNode
+from pypeline.atomiccmd.builder import JAVA_MAX_HEAP_SIZE
 
 from pypeline.common.fileutils import swap_ext, add_postfix
 
@@ -225,10 +226,39 @@ def parse_config(argv):
                      help = "Maximum number of threads to use per BWA instance [%default]")
     group.add_option("--bwa-max-threads", type = int, default = defaults.get("bwa_max_threads", 4),
                      help = "Maximum number of threads to use per BWA instance [%default]")
+    group.add_option("--coverage-max-threads", type = int, default = defaults.get("coverage_max_threads", 4),
+                     help = "Maximum number of threads to use per coverage calculation; reads on " \
+                            "different contigs are counted in parallel [%default]")
+    group.add_option("--cleanup-max-threads", type = int, default = defaults.get("cleanup_max_threads", 2),
+                     help = "Maximum number of threads to use when compressing the output of " \
+                            "'bam_cleanup', when processing pre-aligned BAMs [%default]")
+    group.add_option("--rmdup-collapsed-max-threads", type = int,
+                     default = defaults.get("rmdup_collapsed_max_threads", 2),
+                     help = "Maximum number of threads to use when compressing the output of " \
+                            "'bam_rmdup_collapsed' [%default]")
     group.add_option("--max-threads", type = int, default = defaults.get("max_threads", 14),
                      help = "Maximum number of threads to use in total [%default]")
+    group.add_option("--max-memory", type = int, default = defaults.get("max_memory"),
+                     help = "Maximum amount of memory (in MB) used by running tasks in total; tasks running " \
+                            "Picard / GATK are assumed to use %i MB. Not limited by default [%%default]" \
+                            % (JAVA_MAX_HEAP_SIZE,))
+    group.add_option("--max-io", type = int, default = defaults.get("max_io"),
+                     help = "Maximum number of IO intensive tasks (e.g. MergeSamFiles) to run at the same " \
+                            "time. Not limited by default [%default]")
     group.add_option("--dry-run", action = "store_true", default = False,
                      help = "If passed, only a dry-run in performed, the dependency tree is printed, and no tasks are executed.")
+    group.add_option("--journal", default = defaults.get("journal"),
+                     help = "Journal of completed tasks, used with --journal-checksums to avoid re-running " \
+                            "tasks whose input files have been touched, but not modified. Not used by " \
+                            "default [%default]")
+    group.add_option("--journal-checksums", action = "store_true", default = defaults.get("journal_checksums", False),
+                     help = "If set, the journal records checksums of input files, and tasks are not re-run if " \
+                            "input files have been touched (e.g. re-copied), but their contents are unchanged. " \
+                            "Files are only read once, unless modified [%default]")
+    group.add_option("--runtimes", default = defaults.get("runtimes"),
+                     help = "Database of the runtimes of previously completed tasks, used to prioritize " \
+                            "tasks on the critical path, and to estimate the remaining runtime " \
+                            "[%s]" % (os.path.join("<temp-root>", "bam_pipeline.runtimes"),))
     parser.add_option_group(group)
 
     group  = optparse.OptionGroup(parser, "Required paths")
@@ -272,6 +302,11 @@ def parse_config(argv):
         ui.print_err("ERROR: Both --list-output-files and --list-orphan-files set!", file = sys.stderr)
         return None
 
+    if config.journal_checksums and not config.journal:
+        ui.print_err("ERROR: --journal-checksums requires that a journal is specified using --journal!",
+                     file = sys.stderr)
+        return None
+
     if not os.path.exists(config.temp_root):
         try:
             os.makedirs(config.temp_root)
@@ -283,6 +318,9 @@ def parse_config(argv):
         ui.print_err("ERROR: Insufficient permissions for temp root: '%s'" % config.temp_root, file = sys.stderr)
         return None
 
+    if config.runtimes is None:
+        config.runtimes = os.path.join(config.temp_root, "bam_pipeline.runtimes")
+
     return config, args
 
 
@@ -411,9 +449,14 @@ def main(argv):
         return 0
 
     ui.print_info("Running BAM pipeline ...", file = sys.stderr)
-    if not pipeline.run(dry_run     = config.dry_run,
-                        max_running = config.max_threads,
-                        verbose     = config.verbose):
+    if not pipeline.run(dry_run       = config.dry_run,
+                        max_running   = config.max_threads,
+                        max_memory    = config.max_memory,
+                        max_io_weight = config.max_io,
+                        verbose       = config.verbose,
+                        journal       = config.journal,
+                        checksums     = config.journal_checksums,
+                        database      = config.runtimes):
         return 1
 
     return 0
@@ -33,6 +33,8 @@ def parse_options(argv, parser = None):
     parser.add_option("--verbose",            default = False, action="store_true")
     parser.add_option("--expand-nodes",       default = False, action="store_true")
     parser.add_option("--max-threads",        default = 12, type = int)
+    parser.add_option("--genotyping-max-threads", default = 1, type = int,
+                      help = "Max number of contigs to genotype in parallel per sample [%default]")
     parser.add_option("--temp-root",          default = "./temp")
     parser.add_option("--samples-root",       default = "./data/samples")
     parser.add_option("--intervals-root",     default = "./data/intervals")
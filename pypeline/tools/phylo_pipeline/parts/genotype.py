@@ -36,7 +36,7 @@ from pypeline.atomiccmd.builder import \
      use_customizable_cli_parameters, \
      AtomicCmdBuilder, \
      apply_options
-from pypeline.nodes.samtools import GenotypeNode, TabixIndexNode, FastaIndexNode, MPileupNode
+from pypeline.nodes.samtools import GenotypeNode, TabixIndexNode, FastaIndexNode, BAMIndexNode, MPileupNode
 from pypeline.nodes.bedtools import SlopBedNode
 
 
@@ -245,11 +245,19 @@ def build_genotyping_nodes(options, genotyping, taxa, interval, dependencies):
     padding = genotyping["Padding"]
     infile  = os.path.join(options.samples_root, "%s.%s.bam" % (taxa["Name"], interval["Genome"]))
     slop, node =  build_interval_nodes(options, taxa, interval, padding, dependencies)
+    threads, nodes = options.genotyping_max_threads, [node]
+    if threads > 1:
+        # Contigs genotyped in parallel are read from the FASTA index, and
+        # the regions of each contig are fetched using the BAM index
+        nodes.append(_build_fasta_index_node(reference, dependencies))
+        nodes.append(_build_bam_index_node(infile, dependencies))
+
     genotype = GenotypeNode.customize(reference          = reference,
                                       regions            = slop,
                                       infile             = infile,
                                       outfile            = calls,
-                                      dependencies       = node)
+                                      threads            = threads,
+                                      dependencies       = nodes)
 
     apply_options(genotype.commands["pileup"], genotyping.get("MPileup", {}))
     apply_options(genotype.commands["genotype"], genotyping.get("BCFTools", {}))
@@ -327,17 +335,28 @@ def build_reference_nodes(options, taxa, interval, dependencies):
     destination = os.path.join(options.destination, "genotypes", "%s.%s.fasta" % (taxa["Name"], prefix))
     intervals = os.path.join(options.intervals_root, prefix + ".bed")
 
-    if reference not in _FAI_CACHE:
-        _FAI_CACHE[reference] = FastaIndexNode(infile       = reference,
-                                               dependencies = dependencies)
-
     node  = ExtractReference(reference          = reference,
                              intervals          = intervals,
                              outfile            = destination,
-                             dependencies       = _FAI_CACHE[reference])
+                             dependencies       = _build_fasta_index_node(reference, dependencies))
     return (node,)
 
 
+def _build_fasta_index_node(reference, dependencies):
+    if reference not in _FAI_CACHE:
+        _FAI_CACHE[reference] = FastaIndexNode(infile       = reference,
+                                               dependencies = dependencies)
+    return _FAI_CACHE[reference]
+
+
+_BAI_CACHE = {}
+def _build_bam_index_node(infile, dependencies):
+    if infile not in _BAI_CACHE:
+        _BAI_CACHE[infile] = BAMIndexNode(infile       = infile,
+                                          dependencies = dependencies)
+    return _BAI_CACHE[infile]
+
+
 def build_taxa_nodes(options, genotyping, intervals, taxa, dependencies = ()):
     nodes = []
     for interval in intervals.itervalues():
@@ -30,6 +30,7 @@ from pypeline.atomiccmd.builder import AtomicJavaCmdBuilder,AtomicJava7CmdBuilde
 from pypeline.atomiccmd.sets import ParallelCmds
 from pypeline.atomiccmd.builder import \
      AtomicCmdBuilder, \
+     JAVA_MAX_HEAP_SIZE, \
      use_customizable_cli_parameters, \
      create_customizable_cli_parameters
 
@@ -115,6 +116,7 @@ class ApplyRecalibrationNode(CommandNode):
         CommandNode.__init__(self,
             description = description,
             command = ParallelCmds(commands),
+            memory = JAVA_MAX_HEAP_SIZE,
             dependencies = parameters.dependencies
         )
 
@@ -222,6 +224,7 @@ class VariantRecalibratorNode(CommandNode):
         CommandNode.__init__(self,
             description = description,
             command = ParallelCmds(commands),
+            memory = JAVA_MAX_HEAP_SIZE,
             dependencies = parameters.dependencies)
 
 class UnifiedGenotyperNode(CommandNode):
@@ -262,6 +265,7 @@ class UnifiedGenotyperNode(CommandNode):
         CommandNode.__init__(self,
                              description = description,
                              command = ParallelCmds(commands),
+                             memory = JAVA_MAX_HEAP_SIZE,
                              dependencies = parameters.dependencies)
 
 class VariantMergeNode(CommandNode):
@@ -293,6 +297,7 @@ class VariantMergeNode(CommandNode):
         CommandNode.__init__(self,
                              description  = description,
                              command      = ParallelCmds(commands),
+                             memory       = JAVA_MAX_HEAP_SIZE,
                              dependencies = parameters.dependencies)
 
 #class VariantAnnotateNode(CommandNode):
@@ -25,7 +25,6 @@ from __future__ import print_function
 
 import sys
 import datetime
-import collections
 
 from pypeline.node import MetaNode
 
@@ -68,9 +67,19 @@ def print_disabled(*vargs, **kwargs):
 
 
 
-def print_node_tree(graph, collapse = True, verbose = True):
+def print_node_tree(graph, collapse = True, verbose = True, limits = None):
+    """Prints the state of the pipeline. If 'limits' is specified, this is
+    expected to be a tuple of (threads, memory, io_weight) limits (see
+    Pypeline.run), and the resources used by running nodes are printed,
+    along with the estimated remaining runtime, if available."""
     print_msg(datetime.datetime.now().strftime("%F %T"))
-    print_msg("Pipeline%s" % _describe_nodes(graph, graph.iterflat()))
+    print_msg("Pipeline%s" % _describe_states(graph, graph.get_state_counts()))
+    if limits is not None:
+        print_msg("Resources: %s" % _describe_resources(graph, limits))
+
+        remaining = graph.estimate_remaining_time(limits[0])
+        if remaining is not None:
+            print_msg("Estimated time remaining: %s" % _describe_duration(remaining))
 
     if verbose:
         _print_sub_nodes(graph, graph, collapse, "  ")
@@ -79,12 +88,7 @@ def print_node_tree(graph, collapse = True, verbose = True):
 
 
 def _print_running_nodes(graph):
-    running = []
-    for node in graph.iterflat():
-        if graph.get_node_state(node) is graph.RUNNING:
-            running.append(node)
-
-    for node in sorted(running, key = str):
+    for node in sorted(graph.iterrunning(), key = str):
         print_info("  - %s" % node)
     print_info()
 
@@ -143,11 +147,17 @@ def _count_dependencies(dependencies):
 
 
 def _describe_nodes(graph, nodes):
-    states = collections.defaultdict(int)
+    states = [0] * (graph.ERROR + 1)
     for node in nodes:
         if not isinstance(node, MetaNode):
             states[graph.get_node_state(node)] += 1
 
+    return _describe_states(graph, states)
+
+
+def _describe_states(graph, states):
+    """Describes the number of nodes in each state, given a list of counts
+    indexed by state (see NodeGraph.get_state_counts)."""
     fields = [("running",  states[graph.RUNNING]),
               ("outdated", states[graph.OUTDATED]),
               ("failed",   states[graph.ERROR])]
@@ -159,11 +169,36 @@ def _describe_nodes(graph, nodes):
 
     line.append("%i done of %i tasks" \
                     % (states[graph.DONE],
-                       sum(states.values())))
+                       sum(states)))
 
     return ", ".join(line)
 
 
+def _describe_resources(graph, limits):
+    used = [0, 0, 0]
+    for node in graph.iterrunning():
+        used[0] += node.threads
+        used[1] += node.memory
+        used[2] += node.io_weight
+
+    fields = []
+    for (name, value, limit) in zip(("threads", "MB memory", "IO"), used, limits):
+        if limit is None:
+            fields.append("%i %s" % (value, name))
+        else:
+            fields.append("%i/%i %s" % (value, limit, name))
+
+    return ", ".join(fields)
+
+
+def _describe_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return "%ih %02im" % (hours, minutes)
+    return "%im %02is" % (minutes, seconds)
+
+
 def _collapse_node(graph, dependencies):
     """Returns true if a node may be collapsed in the dependency graph."""
     if all((graph.get_node_state(node) == graph.DONE) for node in dependencies):
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of 'bam_cleanup', which replaced the pipeline used by
+CleanupBAMNode ('samtools view | AddOrReplaceReadGroups | samtools calmd').
+A reference sequence and a BAM file are simulated, and cleaned up using
+'bam_cleanup' (using 1 and --max-threads threads for compression) and, if
+the location of the Picard JARs is given, using the previous pipeline. The
+throughput of each is reported, and the read-groups and MD / NM tags of the
+resulting reads are compared.
+Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/bamcleanup.py --reads 1000000 \\
+        --jar-root ~/install/jar_root
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import optparse
+import tempfile
+import subprocess
+
+import pysam
+
+import pypeline.ui as ui
+
+
+_BAM_CLEANUP = os.path.join(os.path.dirname(__file__), "..", "..", "bin", "bam_cleanup")
+_CONTIGS = (("chr1", 2000000), ("chr2", 1000000))
+_READ_LENGTH = 75
+_MIN_QUALITY = 25
+
+
+def write_reference(rng, root):
+    filename = os.path.join(root, "reference.fasta")
+    sequences = {}
+    with open(filename, "w") as fasta:
+        with open(filename + ".fai", "w") as fai:
+            for (name, length) in _CONTIGS:
+                sequence = "".join(rng.choice("ACGT") for _ in xrange(length))
+                fasta.write(">%s\n" % (name,))
+                fai.write("%s\t%i\t%i\t60\t61\n" % (name, length, fasta.tell()))
+                for start in xrange(0, length, 60):
+                    fasta.write(sequence[start:start + 60] + "\n")
+                sequences[name] = sequence
+    return filename, sequences
+
+
+def write_bam(rng, root, sequences, nreads):
+    header = {"HD" : {"VN" : "1.0", "SO" : "coordinate"},
+              "SQ" : [{"SN" : name, "LN" : length} for (name, length) in _CONTIGS],
+              "RG" : [{"ID" : "old", "SM" : "old"}]}
+    positions = sorted((rng.randint(0, len(_CONTIGS) - 1), rng.randint(0, 900000))
+                       for _ in xrange(nreads))
+
+    filename = os.path.join(root, "input.bam")
+    with pysam.Samfile(filename, "wb", header = header) as handle:
+        for (index, (tid, pos)) in enumerate(positions):
+            sequence = list(sequences[_CONTIGS[tid][0]][pos:pos + _READ_LENGTH])
+            for _ in xrange(rng.randint(0, 3)):
+                sequence[rng.randint(0, _READ_LENGTH - 1)] = rng.choice("ACGT")
+            cigar = [(0, _READ_LENGTH)]
+            if rng.random() < 0.05:
+                cigar = [(0, 30), (2, 2), (0, _READ_LENGTH - 30)]
+
+            read = pysam.AlignedRead()
+            read.qname = "read_%i" % (index,)
+            read.seq = "".join(sequence)
+            read.qual = "I" * _READ_LENGTH
+            read.flag = 0x4 if rng.random() < 0.05 else 0
+            read.tid = tid
+            read.pos = pos
+            read.mapq = rng.randint(0, 60)
+            read.cigar = cigar
+            read.tags = [("RG", "old")]
+            handle.write(read)
+    return filename
+
+
+def read_tags(filename):
+    with pysam.Samfile(filename) as handle:
+        return [(read.qname, read.opt("RG"), read.opt("MD"), read.opt("NM")) for read in handle]
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--reads", default = 500000, type = int,
+                      help = "Number of simulated reads [%default]")
+    parser.add_option("--max-threads", default = 4, type = int,
+                      help = "Max number of threads used for compression [%default]")
+    parser.add_option("--jar-root", default = None,
+                      help = "Folder containing Picard JARs; if not set, only 'bam_cleanup' "
+                             "is benchmarked.")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    rng = random.Random(config.seed)
+    root = tempfile.mkdtemp()
+    try:
+        reference, sequences = write_reference(rng, root)
+        input_file = write_bam(rng, root, sequences, config.reads)
+
+        commands = []
+        for threads in sorted(set((1, config.max_threads))):
+            commands.append(("bam_cleanup (%i thread(s))" % (threads,),
+                             "%s %s --reference %s --min-quality %i --max-threads %i "
+                             "--rg-id new --rg SM:sample %s"
+                             % (sys.executable, _BAM_CLEANUP, reference, _MIN_QUALITY,
+                                threads, input_file)))
+        if config.jar_root:
+            # Same commands as used by previous versions of CleanupBAMNode
+            commands.append(("Previous",
+                             "samtools view -bu -F0x4 -q%i %s | java -server -Xmx4g "
+                             "-XX:+UseSerialGC -jar %s INPUT=/dev/stdin OUTPUT=/dev/stdout "
+                             "QUIET=true COMPRESSION_LEVEL=0 ID=new SM=sample | "
+                             "samtools calmd -b - %s 2> /dev/null"
+                             % (_MIN_QUALITY, input_file,
+                                os.path.join(config.jar_root, "AddOrReplaceReadGroups.jar"),
+                                reference)))
+
+        results = []
+        for (index, (label, command)) in enumerate(commands):
+            output_file = os.path.join(root, "output_%i.bam" % (index,))
+            start = time.time()
+            if subprocess.call("%s > %s" % (command, output_file), shell = True):
+                ui.print_err("Error running command: %s" % (command,))
+                return 1
+            runtime = time.time() - start
+            ui.print_msg("%-26s %6.1fs, %10.0f records/s"
+                         % (label, runtime, config.reads / runtime))
+            results.append(read_tags(output_file))
+
+        for result in results[1:]:
+            if result != results[0]:
+                ui.print_err("Output differs between commands!")
+                return 1
+    finally:
+        shutil.rmtree(root)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of 'bam_merge', which replaced Picard MergeSamFiles for the
+merging of BAMs streamed into DepthHistogramNode, MapDamageNode, etc. (see
+pypeline.nodes.picard.concatenate_input_bams). A number of sorted BAMs are
+simulated, and merged (uncompressed) using 'bam_merge' and, if the location
+of the Picard JARs is given, using MergeSamFiles as previously done. Wall-
+clock time, throughput, and max RSS of each command is reported, and the
+merged reads are compared.
+Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/bammerge.py --reads 1000000 \\
+        --jar-root ~/install/jar_root
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import optparse
+import tempfile
+import subprocess
+
+import pysam
+
+import pypeline.ui as ui
+
+
+_BAM_MERGE = os.path.join(os.path.dirname(__file__), "..", "..", "bin", "bam_merge")
+_CONTIGS = (("chr1", 10000000), ("chr2", 5000000))
+
+
+def write_bams(rng, root, nfiles, nreads):
+    filenames = []
+    for index in xrange(nfiles):
+        header = {"HD" : {"VN" : "1.0", "SO" : "coordinate"},
+                  "SQ" : [{"SN" : name, "LN" : length} for (name, length) in _CONTIGS],
+                  "RG" : [{"ID" : "library_%i" % (index,), "SM" : "sample"}]}
+
+        positions = sorted((rng.randint(0, len(_CONTIGS) - 1), rng.randint(0, 4000000))
+                           for _ in xrange(nreads // nfiles))
+
+        filename = os.path.join(root, "input_%i.bam" % (index,))
+        with pysam.Samfile(filename, "wb", header = header) as handle:
+            for (read_index, (tid, pos)) in enumerate(positions):
+                read = pysam.AlignedRead()
+                read.qname = "read_%i_%i" % (index, read_index)
+                read.seq = "".join(rng.choice("ACGT") for _ in xrange(50))
+                read.qual = "I" * 50
+                read.flag = 0x10 if rng.random() < 0.5 else 0
+                read.tid = tid
+                read.pos = pos
+                read.mapq = 37
+                read.cigar = [(0, 50)]
+                read.tags = [("RG", "library_%i" % (index,)), ("NM", 0)]
+                handle.write(read)
+        filenames.append(filename)
+    return filenames
+
+
+def run_command(call):
+    """Returns the wall-clock time and the max RSS (in MB) of a command."""
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        proc = subprocess.Popen(call, stdout = devnull, stderr = devnull)
+        _, status, rusage = os.wait4(proc.pid, 0)
+    if status:
+        raise RuntimeError("Error running command %r" % (call,))
+    return time.time() - start, rusage.ru_maxrss / 1024.0
+
+
+def read_positions(filename):
+    with pysam.Samfile(filename) as handle:
+        return [(read.tid, read.pos, read.qname) for read in handle]
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--reads", default = 1000000, type = int,
+                      help = "Total number of simulated reads [%default]")
+    parser.add_option("--files", default = 4, type = int,
+                      help = "Number of BAMs to merge [%default]")
+    parser.add_option("--jar-root", default = None,
+                      help = "Folder containing Picard JARs; if not set, only 'bam_merge' "
+                             "is benchmarked.")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp()
+    try:
+        input_files = write_bams(random.Random(config.seed), root, config.files, config.reads)
+
+        output_file = os.path.join(root, "bam_merge.bam")
+        commands = [("bam_merge", output_file,
+                     [sys.executable, _BAM_MERGE, "--output", output_file] + input_files)]
+        if config.jar_root:
+            # Same JVM options as used by AtomicJavaCmdBuilder
+            output_file = os.path.join(root, "picard.bam")
+            call = ["java", "-server", "-Xmx4g", "-XX:+UseSerialGC",
+                    "-Djava.io.tmpdir=%s" % (root,), "-Djava.awt.headless=true",
+                    "-jar", os.path.join(config.jar_root, "MergeSamFiles.jar"),
+                    "OUTPUT=%s" % (output_file,), "CREATE_INDEX=False",
+                    "COMPRESSION_LEVEL=0", "SO=coordinate"]
+            call.extend("I=%s" % (filename,) for filename in input_files)
+            commands.append(("Picard", output_file, call))
+
+        results = []
+        for (label, output_file, call) in commands:
+            runtime, max_rss = run_command(call)
+            ui.print_msg("%-10s %6.1fs, %10.0f reads/s, max RSS %7.1f MB"
+                         % (label, runtime, config.reads / runtime, max_rss))
+            results.append(read_positions(output_file))
+
+        expected = sorted(read for filename in input_files for read in read_positions(filename))
+        for positions in results:
+            # Order of reads at the same position may differ between tools
+            in_order = ([position[:2] for position in positions]
+                        == [position[:2] for position in expected])
+            if not (in_order and sorted(positions) == expected):
+                ui.print_err("Merged reads differ from input reads!")
+                return 1
+    finally:
+        shutil.rmtree(root)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Micro-benchmark of the counting of reads / bases in CoverageNode, using
+simulated records (no BAM file is read), in order to measure only the cost of
+the accounting, and not that of decoding reads. CoverageNode.read_records is
+compared with the implementation used in previous versions (one fetch per
+interval, and read-groups found by scanning all tags of each read), and the
+resulting tables are compared. Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/coverage.py --reads 1000000
+"""
+import sys
+import time
+import bisect
+import random
+import optparse
+
+import pypeline.ui as ui
+from pypeline.nodes.coverage import CoverageNode
+
+
+_CIGARS = [[(0, 100)]] * 16 \
+    + [[(4, 5), (0, 95)]] * 2 \
+    + [[(0, 50), (1, 2), (0, 48)],
+       [(0, 40), (2, 3), (0, 60)]]
+
+
+class _Record(object): # pylint: disable=R0902
+    __slots__ = ("pos", "aend", "cigar", "flag", "qname",
+                 "is_unmapped", "is_duplicate", "_readgroup", "_tags")
+
+    def __init__(self, rng, pos, readgroups):
+        self.pos = pos
+        self.cigar = rng.choice(_CIGARS)
+        self.aend = pos + sum(num for (op, num) in self.cigar if op in (0, 2, 3))
+        self.flag = rng.choice((0, 0x40, 0x80))
+        self.qname = rng.choice(("read", "read", "read", "M_read"))
+        self.is_unmapped = False
+        self.is_duplicate = False
+        self._readgroup = rng.choice(readgroups)
+        self._tags = (("XT", "U"), ("NM", 0), ("SM", 37), ("AM", 37), ("X0", 1),
+                      ("X1", 0), ("XM", 0), ("XO", 0), ("XG", 0), ("MD", "100"),
+                      ("RG", self._readgroup))
+
+    @property
+    def tags(self):
+        # Creating a new list is cheaper than decoding tags (as done by pysam),
+        # and the cost of using 'tags' is therefore underestimated
+        return list(self._tags)
+
+    def opt(self, key):
+        assert key == "RG"
+        return self._readgroup
+
+
+class _BAMFile(object):
+    """Mimics an indexed BAM file, containing reads of at most 200 bp."""
+    def __init__(self, records):
+        self._records = records
+        self._positions = [record.pos for record in records]
+
+    def fetch(self, _contig = None, start = None, end = None):
+        if start is None:
+            return iter(self._records)
+
+        first = bisect.bisect_left(self._positions, start - 200)
+        last = bisect.bisect_left(self._positions, end)
+        return (record for record in self._records[first:last]
+                if record.aend > start)
+
+
+def read_records_previous(bamfile, intervals, tables):
+    """Counts reads as done by previous versions of CoverageNode."""
+    for (name, interval_list) in intervals.iteritems():
+        for (contig, start, end) in interval_list:
+            for record in bamfile.fetch(contig, start, end):
+                if record.is_unmapped or record.is_duplicate:
+                    continue
+
+                for (key, readgroup) in record.tags:
+                    if key == "RG":
+                        break
+
+                subtable = tables[readgroup][name]
+                qname = record.qname
+                if qname.startswith("M_") or qname.startswith("MT_"):
+                    subtable["Collapsed"] += 1
+                elif record.flag & 0x40:
+                    subtable["PE_1"] += 1
+                elif record.flag & 0x80:
+                    subtable["PE_2"] += 1
+                else:
+                    subtable["SE"] += 1
+
+                position = record.pos
+                for (op, num) in record.cigar:
+                    if op < 3:
+                        left  = min(max(position, start), end - 1)
+                        right = min(max(position + num, start), end - 1)
+                        subtable["MID"[op]] += right - left
+
+                        if op < 2:
+                            position += num
+                    elif op == 3:
+                        position += num
+
+
+def build_dataset(rng, nreads, ntargets, contig_length):
+    readgroups = {None : {"ID" : None, "SM" : "<NA>", "LB" : "<NA>"}}
+    for index in range(4):
+        readgroups["rg_%i" % (index,)] = {"ID" : "rg_%i" % (index,), "SM" : "sample",
+                                          "LB" : "library_%i" % (index % 2,)}
+
+    positions = sorted(rng.randint(0, contig_length - 200) for _ in xrange(nreads))
+    records = [_Record(rng, pos, sorted(readgroups)[1:]) for pos in positions]
+
+    intervals = {}
+    if ntargets:
+        for index in range(ntargets):
+            start = rng.randint(0, contig_length - 200)
+            intervals.setdefault("target_%i" % (index % 100), []) \
+                .append(("contig", start, start + rng.randint(50, 200)))
+    else:
+        intervals["contig"] = [("contig", 0, contig_length)]
+
+    return readgroups, records, intervals
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--reads", default = 500000, type = int,
+                      help = "Number of simulated reads [%default]")
+    parser.add_option("--targets", default = 0, type = int,
+                      help = "Number of targets; if 0, the entire contig is used [%default]")
+    parser.add_option("--contig-length", default = 10000000, type = int,
+                      help = "Length of the simulated contig [%default]")
+    parser.add_option("--repeats", default = 3, type = int,
+                      help = "Number of repeats, of which the fastest is reported [%default]")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    rng = random.Random(config.seed)
+    readgroups, records, intervals = build_dataset(rng, config.reads, config.targets,
+                                                   config.contig_length)
+    bamfile = _BAMFile(records)
+
+    results = {}
+    for (label, func) in (("Previous", read_records_previous),
+                          ("Current", CoverageNode.read_records)):
+        runtimes = []
+        for _ in range(config.repeats):
+            tables, mapping = CoverageNode._initialize_tables("benchmark", intervals, readgroups) # pylint: disable=W0212
+            runtimes.append(timed(func, bamfile, intervals, mapping))
+        results[label] = tables
+        ui.print_msg("%-10s %10.0f reads/s" % (label, config.reads / min(runtimes)))
+
+    if results["Previous"] != results["Current"]:
+        ui.print_err("Tables differ between implementations!")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
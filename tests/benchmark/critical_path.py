@@ -0,0 +1,153 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Simulation of running a pipeline with a limited number of threads, in
+order to compare the makespan (total wall-clock time) obtained when nodes
+are started in the order in which they became runable, with the makespan
+obtained when nodes are prioritized by the length of the critical path
+(see NodeGraph.pop_runable_node).
+
+Graphs are modelled after those generated by the BAM and phylo pipelines:
+Each sample consists of a number of lanes (trimming and mapping), which are
+merged and realigned, followed by genotyping, and a long running phylogenetic
+inference per sample. Runtimes are randomly drawn (using a fixed seed), and
+nodes are not actually run. Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/critical_path.py --threads 16
+"""
+import os
+import sys
+import heapq
+import random
+import optparse
+
+import pypeline.ui as ui
+from pypeline.node import Node, MetaNode
+from pypeline.nodegraph import NodeGraph
+
+
+class _Config: # pylint: disable=W0232
+    counter = 0
+
+
+def _node(runtimes, runtime, threads = 1, dependencies = ()):
+    """Returns a node with a missing output-file, which therefore
+    becomes runable once all its dependencies are done."""
+    _Config.counter += 1
+    node = Node(output_files = "/benchmark/missing/%i" % (_Config.counter,),
+                threads      = threads,
+                dependencies = dependencies)
+    runtimes[node] = runtime
+    return node
+
+
+def build_nodes(rng, samples, threads):
+    runtimes, top_nodes = {}, []
+    reference = _node(runtimes, 30)
+    for _ in range(samples):
+        lanes = []
+        for _ in range(rng.randint(1, 8)):
+            trimmed = _node(runtimes, rng.uniform(5, 20))
+            mapped  = _node(runtimes, rng.uniform(20, 120), min(4, threads),
+                            dependencies = (trimmed, reference))
+            lanes.append(mapped)
+
+        merged    = _node(runtimes, rng.uniform(10, 30), dependencies = lanes)
+        realigned = _node(runtimes, rng.uniform(30, 90), dependencies = merged)
+        genotyped = _node(runtimes, rng.uniform(30, 90), dependencies = realigned)
+        if rng.random() < 0.25:
+            genotyped = _node(runtimes, rng.uniform(300, 900), min(2, threads),
+                              dependencies = genotyped)
+        top_nodes.append(genotyped)
+
+    return MetaNode(dependencies = top_nodes), runtimes
+
+
+def simulate(top_node, runtimes, max_threads, priorities):
+    """Simulates running the pipeline, and returns the makespan. If
+    'priorities' is false, all nodes are given the same priority, and
+    nodes are therefore started in the order they became runable."""
+    if priorities:
+        estimates = lambda node: runtimes.get(node, 0)
+    else:
+        estimates = lambda _node: 0
+    nodegraph = NodeGraph([top_node], runtimes = estimates)
+
+    now, idle_threads, running = 0.0, max_threads, []
+    while True:
+        while idle_threads > 0:
+            node = nodegraph.pop_runable_node(idle_threads)
+            if node is None:
+                break
+            nodegraph.set_node_state(node, nodegraph.RUNNING)
+            heapq.heappush(running, (now + runtimes[node], node))
+            idle_threads -= node.threads
+
+        if not running:
+            break
+
+        now, node = heapq.heappop(running)
+        nodegraph.set_node_state(node, nodegraph.DONE)
+        idle_threads += node.threads
+
+    return now
+
+
+def lower_bound(top_node, runtimes, max_threads):
+    """Returns max(length of critical path, total CPU time / threads)."""
+    nodegraph = NodeGraph([top_node], runtimes = lambda node: runtimes.get(node, 0))
+    critical_path = nodegraph._priorities[top_node] # pylint: disable=W0212
+    cpu_time = sum(runtimes[node] * node.threads for node in runtimes)
+    return max(critical_path, cpu_time / max_threads)
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--samples", default = 50, type = int,
+                      help = "Number of samples in the simulated pipeline [%default]")
+    parser.add_option("--threads", default = "4,16,64",
+                      help = "Comma separated list of thread counts [%default]")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to draw runtimes [%default]")
+    config, _ = parser.parse_args(argv)
+
+    ui.print_msg("%8s %12s %12s %12s %12s" \
+                 % ("Threads", "FIFO", "Critical", "Change", "Lower bound"))
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    try:
+        for threads in map(int, config.threads.split(",")):
+            rng = random.Random(config.seed)
+            top_node, runtimes = build_nodes(rng, config.samples, threads)
+
+            fifo     = simulate(top_node, runtimes, threads, priorities = False)
+            critical = simulate(top_node, runtimes, threads, priorities = True)
+            bound    = lower_bound(top_node, runtimes, threads)
+            ui.print_msg("%8i %12.0f %12.0f %11.1f%% %12.0f" \
+                         % (threads, fifo, critical, 100.0 * (critical - fifo) / fifo, bound))
+    finally:
+        sys.stderr = stderr
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
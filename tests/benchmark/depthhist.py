@@ -0,0 +1,174 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of DepthHistogramNode, comparing the runtime of the in-process
+calculation of depth histograms with that of the previous implementation, in
+which reads were split into a BAM per sample / library / total, each of which
+was piped through 'genomeCoverageBed' (BEDTools). The histograms produced are
+compared, and differences are reported. A (sorted) BAM with simulated reads is
+generated using pysam. Requires that 'genomeCoverageBed' is in the PATH:
+
+    $ PYTHONPATH=. python tests/benchmark/depthhist.py --reads 1000000
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import optparse
+import tempfile
+import subprocess
+
+import pysam
+
+import pypeline.ui as ui
+from pypeline.nodes.depthhist import DepthHistogramNode, _MAX_DEPTH
+
+
+def build_bam(filename, rng, contigs, contig_length, libraries, reads):
+    header = {"HD" : {"VN" : "1.0", "SO" : "coordinate"},
+              "SQ" : [{"SN" : "contig_%i" % (index,), "LN" : contig_length}
+                      for index in range(contigs)],
+              "RG" : [{"ID" : "rg_%i" % (index,), "SM" : "sample_%i" % (index % 2,),
+                       "LB" : "library_%i" % (index,)}
+                      for index in range(libraries)]}
+
+    positions = sorted((rng.randint(0, contigs - 1), rng.randint(0, contig_length - 100))
+                       for _ in xrange(reads))
+    with pysam.Samfile(filename, "wb", header = header) as handle:
+        for (index, (tid, pos)) in enumerate(positions):
+            read = pysam.AlignedRead()
+            read.qname = "read_%i" % (index,)
+            read.tid, read.pos, read.mapq = tid, pos, 30
+            read.seq = "A" * 100
+            read.qual = "I" * 100
+            read.cigar = [(0, 100)]
+            read.tags = [("RG", "rg_%i" % (rng.randint(0, libraries - 1),))]
+            handle.write(read)
+    pysam.index(filename)
+
+
+def run_node(filename, root):
+    """Returns {sample : {library : {region : counts}}} for the BAM."""
+    temp = tempfile.mkdtemp(dir = root)
+    node = DepthHistogramNode(config      = None,
+                              target_name = "benchmark",
+                              input_files = filename,
+                              output_file = os.path.join(root, "benchmark.txt"))
+    node._setup(None, temp) # pylint: disable=W0212
+    table, _ = node._create_tables(None, temp) # pylint: disable=W0212
+    shutil.rmtree(temp)
+    return table
+
+
+def run_bedtools(filename, root):
+    """Splits reads by sample / library, and runs genomeCoverageBed on each
+    BAM, returning the genome-wide histograms in the same format as above."""
+    genome = os.path.join(root, "genome.txt")
+    with pysam.Samfile(filename) as samfile:
+        with open(genome, "w") as handle:
+            for (name, length) in zip(samfile.references, samfile.lengths):
+                handle.write("%s\t%i\n" % (name, length))
+
+        keys = {None : ((None, None), ("<NA>", None), ("<NA>", "<NA>"))}
+        for readgroup in samfile.header.get("RG", ()):
+            keys[readgroup["ID"]] = ((None, None), (readgroup["SM"], None),
+                                     (readgroup["SM"], readgroup["LB"]))
+
+        handles, procs = {}, {}
+        for key in set(sum(keys.values(), ())):
+            fifo = os.path.join(root, "pipe_%i" % (len(handles),))
+            os.mkfifo(fifo)
+            call = ("genomeCoverageBed", "-max", str(_MAX_DEPTH), "-ibam", fifo, "-g", genome)
+            procs[key] = subprocess.Popen(call, stdout = subprocess.PIPE, close_fds = True)
+            handles[key] = pysam.Samfile(fifo, "wbu", template = samfile)
+
+        for read in samfile:
+            if read.is_unmapped or read.is_duplicate:
+                continue
+            for key in keys[dict(read.tags).get("RG")]:
+                handles[key].write(read)
+
+    for handle in handles.itervalues():
+        handle.close()
+
+    table = {}
+    for (key, proc) in procs.iteritems():
+        counts = [0] * (_MAX_DEPTH + 1)
+        for line in proc.stdout:
+            fields = line.split("\t")
+            if fields[0] == "genome":
+                counts[min(_MAX_DEPTH, int(fields[1]))] += int(fields[2])
+        proc.wait()
+        table.setdefault(key[0], {}).setdefault(key[1], {})[None] = counts
+
+    return table
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--contigs", default = 10, type = int,
+                      help = "Number of contigs in the simulated BAM [%default]")
+    parser.add_option("--contig-length", default = 1000000, type = int,
+                      help = "Length of each contig [%default]")
+    parser.add_option("--libraries", default = 20, type = int,
+                      help = "Number of libraries (read-groups), split between 2 samples [%default]")
+    parser.add_option("--reads", default = 1000000, type = int,
+                      help = "Number of (100bp) reads in the simulated BAM [%default]")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp()
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    try:
+        filename = os.path.join(root, "benchmark.bam")
+        build_bam(filename, random.Random(config.seed), config.contigs,
+                  config.contig_length, config.libraries, config.reads)
+
+        start = time.time()
+        expected = run_bedtools(filename, root)
+        bedtools_time = time.time() - start
+
+        start = time.time()
+        observed = run_node(filename, root)
+        node_time = time.time() - start
+    finally:
+        sys.stderr = stderr
+        shutil.rmtree(root)
+
+    differences = 0
+    for (sample, libraries) in expected.iteritems():
+        for (library, regions) in libraries.iteritems():
+            if observed[sample][library][None] != regions[None]:
+                ui.print_err("Histograms differ for %s / %s" % (sample, library))
+                differences += 1
+
+    ui.print_msg("%12s %12s %12s" % ("BEDTools", "In-process", "Speedup"))
+    ui.print_msg("%11.2fs %11.2fs %11.1fx" \
+                 % (bedtools_time, node_time, bedtools_time / max(node_time, 1e-6)))
+
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
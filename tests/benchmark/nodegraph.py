@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of the construction of NodeGraph objects, and of propagating
+state changes through the graph (see NodeGraph.set_node_state).
+
+Graphs are modelled after those generated by the BAM pipeline: Each lane is
+a short chain of nodes, every mapping node depends on a shared reference
+node, and lanes are merged per library, per sample and per target. Each
+graph size is benchmarked in a separate process, in order to report the
+peak RSS for that size alone. Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/nodegraph.py --nodes 10000,100000
+"""
+import os
+import sys
+import time
+import optparse
+import resource
+import subprocess
+
+import pypeline.ui as ui
+from pypeline.node import Node, MetaNode
+from pypeline.nodegraph import NodeGraph
+
+
+class _Config: # pylint: disable=W0232
+    counter = 0
+
+
+def _node(dependencies = ()):
+    """Returns a node with a missing output-file, which therefore
+    becomes runable once all its dependencies are done."""
+    _Config.counter += 1
+    return Node(output_files = "/benchmark/missing/%i" % (_Config.counter,),
+                dependencies = dependencies)
+
+
+def build_nodes(nodes):
+    reference = _node()
+    targets, samples, libraries, lanes = [], [], [], []
+    for _ in range(0, nodes, 4):
+        trimmed = _node()
+        mapped  = _node(dependencies = (trimmed, reference))
+        lanes.append(_node(dependencies = mapped))
+
+        if len(lanes) == 10:
+            libraries.append(_node(dependencies = lanes))
+            lanes = []
+        if len(libraries) == 10:
+            samples.append(MetaNode(dependencies = libraries))
+            libraries = []
+        if len(samples) == 10:
+            targets.append(MetaNode(dependencies = samples))
+            samples = []
+
+    return targets + samples + libraries + lanes
+
+
+def run_nodes(nodegraph):
+    """Simulates running every node in the graph, one at a time."""
+    while True:
+        node = nodegraph.pop_runable_node(1)
+        if node is None:
+            break
+        nodegraph.set_node_state(node, nodegraph.RUNNING)
+        nodegraph.set_node_state(node, nodegraph.DONE)
+
+
+def benchmark(nodes):
+    top_nodes = build_nodes(nodes)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    try:
+        start = time.time()
+        nodegraph = NodeGraph(top_nodes)
+        construction_time = time.time() - start
+
+        start = time.time()
+        run_nodes(nodegraph)
+        running_time = time.time() - start
+    finally:
+        sys.stderr = stderr
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "%10i %15.2fs %15.1fMB %15.2fs" \
+        % (nodes, construction_time, (rss_after - rss_before) / 1024.0, running_time)
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", default = "10000,100000,1000000",
+                      help = "Comma separated list of graph sizes [%default]")
+    parser.add_option("--single", action = "store_true", default = False,
+                      help = "Benchmark a single graph size in this process")
+    config, _ = parser.parse_args(argv)
+
+    if config.single:
+        benchmark(int(config.nodes))
+        return 0
+
+    ui.print_msg("%10s %16s %17s %16s" % ("Nodes", "Construction", "Peak RSS (+)", "Run all"))
+    for nodes in config.nodes.split(","):
+        if subprocess.call([sys.executable, __file__, "--single", "--nodes", nodes]):
+            ui.print_err("Failed to run benchmark for %s nodes" % (nodes,), file = sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of checking the state of a graph in which every node is done,
+i.e. the cost of a no-op re-run of a pipeline, with and without the use of
+a NodeJournal (which should add no overhead, since nodes that are done and
+up to date are never looked up in the journal). Each node reads the output of the previous node in a chain,
+as well as a single file shared between all nodes (e.g. a reference). Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/rerun.py --nodes 20000
+"""
+import os
+import sys
+import time
+import shutil
+import optparse
+import tempfile
+
+import pypeline.ui as ui
+from pypeline.node import Node
+from pypeline.journal import NodeJournal
+from pypeline.nodegraph import NodeGraph
+
+
+def build_nodes(root, nodes, chain_length):
+    shared = os.path.join(root, "shared")
+    open(shared, "w").close()
+    os.utime(shared, (1, 1))
+
+    top_nodes = []
+    for chain_idx in range(0, nodes, chain_length):
+        node, input_file = None, shared
+        for node_idx in range(chain_idx, min(nodes, chain_idx + chain_length)):
+            output_file = os.path.join(root, "%08i" % (node_idx,))
+            open(output_file, "w").close()
+            os.utime(output_file, (node_idx + 2, node_idx + 2))
+
+            node = Node(input_files  = (input_file, shared),
+                        output_files = output_file,
+                        dependencies = filter(None, [node]))
+            input_file = output_file
+        top_nodes.append(node)
+
+    return top_nodes
+
+
+def timed_nodegraph(nodes, journal):
+    stderr, sys.stderr = sys.stderr, open(os.devnull, "w")
+    try:
+        start = time.time()
+        nodegraph = NodeGraph(nodes, journal = journal)
+        runtime = time.time() - start
+    finally:
+        sys.stderr = stderr
+
+    for node in nodegraph.iterflat():
+        assert nodegraph.get_node_state(node) == nodegraph.DONE
+    return runtime
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", type = int, default = 20000,
+                      help = "Number of nodes in the graph [%default]")
+    parser.add_option("--chain-length", type = int, default = 5,
+                      help = "Length of chains of nodes depending on the previous node [%default]")
+    config, _ = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp()
+    try:
+        nodes = build_nodes(root, config.nodes, config.chain_length)
+
+        journal = NodeJournal(os.path.join(root, "journal"))
+        for node in NodeGraph(nodes).iterflat():
+            journal.add(node)
+        journal.close()
+
+        without_journal = timed_nodegraph(nodes, None)
+        with_journal = timed_nodegraph(nodes, NodeJournal(os.path.join(root, "journal")))
+    finally:
+        shutil.rmtree(root)
+
+    ui.print_msg("Nodes:            %i" % (config.nodes,))
+    ui.print_msg("Without journal:  %.2fs" % (without_journal,))
+    ui.print_msg("With journal:     %.2fs" % (with_journal,))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of bam_rmdup_collapsed, using simulated collapsed reads (no BAM
+file is read or written). rmdup.rmdup_collapsed is compared with the
+implementation used in previous versions of the script, and the resulting
+reads, flags and tags are compared. Finally, the throughput of the BGZF
+compression of output is measured using different numbers of threads.
+Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/rmdup_collapsed.py --reads 1000000
+"""
+import sys
+import time
+import random
+import optparse
+import StringIO
+
+import pypeline.ui as ui
+from pypeline.common.bgzf import BGZFWriter
+from pypeline.common.rmdup import rmdup_collapsed, _FILTERED_FLAGS
+
+
+_CIGARS = [((0, 60),)] * 8 + [((0, 30), (1, 1), (0, 29)), ((0, 20), (2, 2), (0, 40))]
+
+
+class _Read(object): # pylint: disable=R0902
+    __slots__ = ("qname", "tid", "pos", "qual", "cigar", "alen", "is_reverse",
+                 "flag", "tags", "is_duplicate")
+
+    def __init__(self, rng, index, tid, pos):
+        self.qname = ("M_read_%i" if rng.random() < 0.8 else "read_%i") % (index,)
+        self.tid = tid
+        self.pos = pos
+        self.qual = "".join(chr(rng.randint(35, 73)) for _ in xrange(60))
+        self.cigar = list(rng.choice(_CIGARS))
+        self.alen = sum(num for (op, num) in self.cigar if op in (0, 2, 3))
+        self.is_reverse = rng.random() < 0.5
+        self.flag = 0x10 if self.is_reverse else 0
+        self.tags = [("NM", 0), ("MD", "60"), ("RG", "library")]
+        if rng.random() < 0.05:
+            self.tags.append(("XP", rng.randint(1, 3)))
+        self.is_duplicate = False
+
+    def copy(self):
+        other = _Read.__new__(_Read)
+        for key in _Read.__slots__:
+            setattr(other, key, getattr(self, key))
+        other.cigar, other.tags = list(self.cigar), list(self.tags)
+        return other
+
+
+def rmdup_collapsed_previous(reads, remove_duplicates):
+    """Marks duplicates as done by previous versions of bam_rmdup_collapsed."""
+    def calc_consensus(reads):
+        count = len(reads)
+        outread = None
+        maxsumqual = 0
+        for read in reads:
+            nsum = sum(map(ord, read.qual))
+            if nsum  > maxsumqual:
+                outread = read
+                maxsumqual = nsum
+            for key, value in read.tags:
+                if key == "XP":
+                    count += value
+
+        outread.tags = outread.tags + [("XP", count)]
+        return outread
+
+    def get_consensus_se(reads):
+        by_cigar = {}
+        cigar_count = {}
+        for read in reads:
+            tcigar = tuple(read.cigar)
+            if tcigar in by_cigar:
+                cigar_count[tcigar] += 1
+                by_cigar[tcigar].append(read)
+            else:
+                cigar_count[tcigar] = 1
+                by_cigar[tcigar] = [read]
+        to_sort = [(y, -len(str(x)), x) for (x, y) in cigar_count.iteritems()]
+        to_sort.sort()
+        return calc_consensus(by_cigar[to_sort[-1][-1]])
+
+    def flush_buffer(curvariants):
+        for value in curvariants.itervalues():
+            consensus = get_consensus_se(value[0])
+            for read in value[0]:
+                read.is_duplicate = (read is not consensus)
+                if not (read.is_duplicate and remove_duplicates):
+                    yield read
+        curvariants.clear()
+
+    curpos = None
+    curvariants = {}
+    for read in reads:
+        if curpos and ((read.tid, read.pos) != curpos):
+            for flushed in flush_buffer(curvariants):
+                yield flushed
+            curpos = None
+
+        if (read.qual is None) or (read.flag & _FILTERED_FLAGS) or not read.qname.startswith("M_"):
+            yield read
+            continue
+
+        curpos = (read.tid, read.pos)
+        nkey = (read.is_reverse, curpos[1], read.alen)
+        if nkey in curvariants:
+            curvariants[nkey][0].append(read)
+            curvariants[nkey][1] += 1
+        else:
+            curvariants[nkey] = [[read], 1]
+
+    for flushed in flush_buffer(curvariants):
+        yield flushed
+
+
+def build_reads(rng, nreads, coverage):
+    reads, position = [], 0
+    for index in xrange(nreads):
+        if rng.random() < 1.0 / coverage:
+            position += rng.randint(1, 10)
+        reads.append(_Read(rng, index, 0, position))
+    return reads
+
+
+def _summarize(reads):
+    # Groups at the same position are no longer written in (arbitrary) dict order
+    return sorted((read.pos, read.qname, read.is_duplicate, tuple(read.tags)) for read in reads)
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--reads", default = 200000, type = int,
+                      help = "Number of simulated reads [%default]")
+    parser.add_option("--coverage", default = 4.0, type = float,
+                      help = "Mean number of reads per position [%default]")
+    parser.add_option("--max-threads", default = 4, type = int,
+                      help = "Max number of threads used for compression [%default]")
+    parser.add_option("--remove-duplicates", default = False, action = "store_true")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    reads = build_reads(random.Random(config.seed), config.reads, config.coverage)
+    results = {}
+    for (label, func) in (("Previous", rmdup_collapsed_previous),
+                          ("Current", rmdup_collapsed)):
+        copies = [read.copy() for read in reads]
+        start = time.time()
+        results[label] = list(func(copies, config.remove_duplicates))
+        runtime = time.time() - start
+        ui.print_msg("%-10s %10.0f reads/s" % (label, config.reads / runtime))
+
+    if _summarize(results["Previous"]) != _summarize(results["Current"]):
+        ui.print_err("Output differs between implementations!")
+        return 1
+
+    # Roughly 250 bytes per uncompressed BAM record
+    data = "".join(read.qname + read.qual * 3 + "".join(map(str, read.tags)) for read in reads)
+    for threads in xrange(1, config.max_threads + 1):
+        start = time.time()
+        with BGZFWriter(StringIO.StringIO(), threads) as writer:
+            for offset in xrange(0, len(data), 250):
+                writer.write(data[offset:offset + 250])
+        runtime = time.time() - start
+        ui.print_msg("BGZF, %i thread(s): %6.1f MB/s" % (threads, len(data) / runtime / 1e6))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
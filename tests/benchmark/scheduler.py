@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of the scheduling overhead of Pypeline.run.
+
+A synthetic graph of no-op nodes is run (each node touching a single output
+file), and the wall-time per node is reported. Since the nodes themselves do
+no work, this approximates the latency between a node finishing and the next
+node being started. As the cost of scheduling should not depend on the size
+of the graph, the time per node should be (roughly) the same for different
+values of --nodes. Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/scheduler.py --nodes 50000
+"""
+import os
+import sys
+import time
+import shutil
+import optparse
+import tempfile
+
+from pypeline.node import Node, MetaNode
+from pypeline.pipeline import Pypeline
+
+
+class _NoopNode(Node):
+    def __init__(self, output_file, dependencies = ()):
+        Node.__init__(self,
+                      description  = "<NoopNode: %r>" % (output_file,),
+                      output_files = output_file,
+                      dependencies = dependencies)
+
+    def _run(self, _config, _temp):
+        open(iter(self.output_files).next(), "w").close()
+
+
+class _Config: # pylint: disable=W0232
+    temp_root = None
+
+
+def build_nodes(root, nodes, width):
+    """Builds a graph of 'nodes' no-op nodes, arranged in chains of length
+    width; each node in a chain depends on the previous node."""
+    chains = []
+    for chain_idx in range(0, nodes, width):
+        node = None
+        for node_idx in range(chain_idx, min(nodes, chain_idx + width)):
+            filename = os.path.join(root, "%08i" % (node_idx,))
+            node = _NoopNode(filename, dependencies = filter(None, [node]))
+        chains.append(node)
+
+    return MetaNode(description  = "Benchmark",
+                    dependencies = chains)
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--nodes", type = int, default = 50000,
+                      help = "Number of no-op nodes in the graph [%default]")
+    parser.add_option("--chain-length", type = int, default = 1,
+                      help = "Length of chains of nodes depending on the previous node [%default]")
+    parser.add_option("--max-threads", type = int, default = 4,
+                      help = "Maximum number of nodes to run at once [%default]")
+    config, _ = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp()
+    try:
+        _Config.temp_root = os.path.join(root, "temp")
+        output_root = os.path.join(root, "output")
+        os.makedirs(_Config.temp_root)
+        os.makedirs(output_root)
+
+        start = time.time()
+        pipeline = Pypeline(_Config)
+        pipeline.add_nodes(build_nodes(output_root, config.nodes, config.chain_length))
+
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            pipeline.run(max_running = config.max_threads, verbose = False)
+        finally:
+            sys.stdout = stdout
+        runtime = time.time() - start
+    finally:
+        shutil.rmtree(root)
+
+    print "Nodes:          %i" % (config.nodes,)
+    print "Total time:     %.2fs" % (runtime,)
+    print "Time per node:  %.3fms" % (runtime * 1000.0 / config.nodes,)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
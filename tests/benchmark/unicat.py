@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of 'unicat' as used by the BWA nodes, where each FASTQ file is
+read by two processes ('bwa aln' and 'bwa samse' / 'bwa sampe'). Previously,
+the file was decompressed once per process; now it is decompressed once, and
+written to both outputs. The CPU time (user + sys) of the two approaches is
+compared for simulated BZip2 and GZip compressed reads, and the outputs are
+checked against the original (uncompressed) reads.
+Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/unicat.py --reads 1000000
+"""
+import os
+import sys
+import random
+import shutil
+import optparse
+import tempfile
+import subprocess
+
+import pypeline.ui as ui
+
+
+_UNICAT = os.path.join(os.path.dirname(__file__), "..", "..", "bin", "unicat")
+
+
+def build_reads(rng, nreads, length):
+    lines = []
+    for index in xrange(nreads):
+        lines.append("@read_%i\n" % (index,))
+        lines.append("".join(rng.choice("ACGT") for _ in xrange(length)) + "\n")
+        lines.append("+\n")
+        lines.append("".join(chr(rng.randint(35, 73)) for _ in xrange(length)) + "\n")
+    return "".join(lines)
+
+
+def run_unicat(input_file, *output_files):
+    """Returns the CPU time used by a call to unicat, and any subprocesses."""
+    call = [sys.executable, _UNICAT]
+    for filename in output_files:
+        call.extend(("--output", filename))
+    call.append(input_file)
+
+    before = os.times()
+    if subprocess.call(call):
+        raise RuntimeError("Error running %r" % (call,))
+    after = os.times()
+
+    return (after[2] - before[2]) + (after[3] - before[3])
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--reads", default = 200000, type = int,
+                      help = "Number of simulated reads [%default]")
+    parser.add_option("--length", default = 100, type = int,
+                      help = "Length of simulated reads [%default]")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate reads [%default]")
+    config, _ = parser.parse_args(argv)
+
+    data = build_reads(random.Random(config.seed), config.reads, config.length)
+    root = tempfile.mkdtemp()
+    try:
+        uncompressed = os.path.join(root, "reads.fastq")
+        with open(uncompressed, "w") as handle:
+            handle.write(data)
+
+        for compressor in ("bzip2", "gzip"):
+            if subprocess.call([compressor, "-k", "-f", uncompressed]):
+                ui.print_err("Error compressing reads using %r" % (compressor,))
+                return 1
+            input_file = uncompressed + (".bz2" if compressor == "bzip2" else ".gz")
+            outputs = [os.path.join(root, "output_%i" % (index,)) for index in (1, 2)]
+
+            previous = sum(run_unicat(input_file, filename) for filename in outputs)
+            current = run_unicat(input_file, *outputs)
+
+            for filename in outputs:
+                with open(filename) as handle:
+                    if handle.read() != data:
+                        ui.print_err("Output differs from input reads!")
+                        return 1
+
+            ui.print_msg("%-6s Previous: %6.2fs CPU, Current: %6.2fs CPU; "
+                         "%.2fs CPU saved per 1M reads"
+                         % (compressor, previous, current,
+                            (previous - current) * 1e6 / config.reads))
+    finally:
+        shutil.rmtree(root)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""Benchmark of the filtering of SNPs and indels near indels in vcf_filter,
+using simulated records. vcffilter._filter_by_indels is compared with the
+implementation used in previous versions (a dict of lists of indels for every
+position near an indel), and the resulting FILTER columns are compared; the
+peak memory usage is reported for both. Usage:
+
+    $ PYTHONPATH=. python tests/benchmark/vcffilter.py --records 1000000
+"""
+import sys
+import time
+import random
+import optparse
+import resource
+import collections
+
+import pypeline.ui as ui
+import pypeline.common.vcfwrap as vcfwrap
+import pypeline.common.vcffilter as vcffilter
+
+
+class _Record(object):
+    __slots__ = ("contig", "pos", "ref", "alt", "qual", "info", "filter")
+
+    def __init__(self, contig, pos, ref, alt, qual, info):
+        self.contig = contig
+        self.pos = pos
+        self.ref = ref
+        self.alt = alt
+        self.qual = qual
+        self.info = info
+        self.filter = "."
+
+
+def group_indels_near_position_previous(indels, distance):
+    """Blacklist of positions near indels, as built by previous versions."""
+    positions = collections.defaultdict(list)
+    if not distance:
+        return positions
+
+    for vcf in indels:
+        length = len(vcf.ref) - 1
+        start = vcf.pos + 1 - distance
+        end   = vcf.pos + 1 + distance + length
+
+        for position in xrange(start, end + 1):
+            positions[position].append(vcf)
+
+    return positions
+
+
+def filter_by_indels_previous(options, chunk):
+    """Filters SNPs and indels near indels, as done by previous versions."""
+    indels = set([vcf for vcf in chunk if vcfwrap.is_indel(vcf)])
+
+    distance_between = options.min_distance_between_indels
+    indel_blacklist  = group_indels_near_position_previous(indels, distance_between)
+    distance_to      = options.min_distance_to_indels
+    snp_blacklist    = group_indels_near_position_previous(indels, distance_to)
+
+    for vcf in chunk:
+        if vcfwrap.is_indel(vcf):
+            blacklisted = indel_blacklist.get(vcf.pos + 1, [vcf])
+            if vcf is not vcffilter._select_best_indel(blacklisted): # pylint: disable=W0212
+                vcffilter._mark_as_filtered(vcf, "W=%i" % distance_between) # pylint: disable=W0212
+        elif (vcf.alt != ".") and (vcf.pos in snp_blacklist):
+            vcffilter._mark_as_filtered(vcf, "w=%i" % distance_to) # pylint: disable=W0212
+
+
+def build_records(rng, nrecords, indel_rate):
+    records = []
+    for contig in ("chr1", "chr2"):
+        position = 0
+        for _ in xrange(nrecords // 2):
+            position += rng.randint(1, 50)
+            ref = rng.choice("ACGT")
+            if rng.random() < indel_rate:
+                alt = ref + "".join(rng.choice("ACGT") for _ in range(rng.randint(1, 5)))
+                if rng.random() < 0.5:
+                    ref, alt = alt, ref
+                info = "INDEL;DP=10"
+            else:
+                alt = rng.choice(".ACGT".replace(ref, ""))
+                info = "DP=10"
+
+            # Random qualities, so that the (arbitrary) choice between
+            # equally good indels does not affect the comparison
+            qual = "%.6f" % (rng.random() * 100,)
+            records.append(_Record(contig, position, ref, alt, qual, info))
+    return records
+
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main(argv):
+    parser = optparse.OptionParser()
+    parser.add_option("--records", default = 200000, type = int,
+                      help = "Number of simulated records [%default]")
+    parser.add_option("--indel-rate", default = 0.2, type = float,
+                      help = "Fraction of records that are indels [%default]")
+    parser.add_option("--min-distance-to-indels", default = 5, type = int,
+                      help = "Min distance between SNPs and indels [%default]")
+    parser.add_option("--min-distance-between-indels", default = 500, type = int,
+                      help = "Min distance between indels [%default]")
+    parser.add_option("--seed", default = 1234, type = int,
+                      help = "Seed used to simulate records [%default]")
+    config, _ = parser.parse_args(argv)
+
+    rng = random.Random(config.seed)
+    results = {}
+    # The current implementation is run first, as the peak memory usage
+    # reported by 'getrusage' can only increase
+    for (label, func) in (("Current", vcffilter._filter_by_indels), # pylint: disable=W0212
+                          ("Previous", filter_by_indels_previous)):
+        records = build_records(random.Random(config.seed), config.records, config.indel_rate)
+        start = time.time()
+        func(config, records)
+        runtime = time.time() - start
+
+        results[label] = [record.filter for record in records]
+        ui.print_msg("%-10s %10.0f records/s, peak memory %.1f MB"
+                     % (label, config.records / runtime, peak_memory_mb()))
+
+    if results["Previous"] != results["Current"]:
+        ui.print_err("FILTER columns differ between implementations!")
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -337,7 +337,7 @@ JAVA_CFG = flexmock(temp_root = "/disk/tmp")
 
 def test_java_builder__defaults__call():
     builder = AtomicJavaCmdBuilder(JAVA_CFG, "/path/Foo.jar")
-    assert_equal(builder.call, ["java", "-server", "-Xmx4g",
+    assert_equal(builder.call, ["java", "-server", "-Xmx4096m",
                                 "-Djava.io.tmpdir=/disk/tmp",
                                 "-Djava.awt.headless=true",
                                 "-XX:+UseSerialGC",
@@ -349,12 +349,17 @@ def test_java_builder__defaults__kwargs():
 
 def test_java_builder__multithreaded_gc():
     builder = AtomicJavaCmdBuilder(JAVA_CFG, "/path/Foo.jar", gc_threads = 3)
-    assert_equal(builder.call, ["java", "-server", "-Xmx4g",
+    assert_equal(builder.call, ["java", "-server", "-Xmx4096m",
                                 "-Djava.io.tmpdir=/disk/tmp",
                                 "-Djava.awt.headless=true",
                                 "-XX:ParallelGCThreads=3",
                                 "-jar", "%(AUX_JAR)s"])
 
+def test_java_builder__max_heap_size():
+    with Monkeypatch("pypeline.atomiccmd.builder.JAVA_MAX_HEAP_SIZE", 1024):
+        builder = AtomicJavaCmdBuilder(JAVA_CFG, "/path/Foo.jar")
+    assert_equal(builder.call[2], "-Xmx1024m")
+
 def test_java_builder__multithreaded_gc__zero_or_negative_threads():
     assert_raises(ValueError, AtomicJavaCmdBuilder, JAVA_CFG, "/path/Foo.jar", gc_threads = 0)
     assert_raises(ValueError, AtomicJavaCmdBuilder, JAVA_CFG, "/path/Foo.jar", gc_threads = -1)
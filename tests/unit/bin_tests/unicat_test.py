@@ -0,0 +1,164 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+import os
+import time
+import gzip
+import StringIO
+import threading
+
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     Monkeypatch, \
+     with_temp_folder, \
+     set_file_contents, \
+     get_file_contents
+
+
+# 'unicat' is a script, and is therefore loaded without writing bytecode
+_UNICAT = {"__name__" : "unicat"}
+execfile(os.path.join(os.path.dirname(__file__), "..", "..", "..", "bin", "unicat"), _UNICAT)
+
+# Spans multiple blocks, the last of which is partial
+_DATA = "".join("%i\n" % (index,) for index in xrange(100000))
+
+
+@with_temp_folder
+def test_tee__single_output(temp_folder):
+    filename = os.path.join(temp_folder, "out")
+    assert_equal(_UNICAT["tee"](StringIO.StringIO(_DATA), [filename]), [])
+    assert_equal(get_file_contents(filename), _DATA)
+
+
+@with_temp_folder
+def test_tee__multiple_outputs(temp_folder):
+    filenames = [os.path.join(temp_folder, "out_%i" % (index,)) for index in range(3)]
+    assert_equal(_UNICAT["tee"](StringIO.StringIO(_DATA), filenames), [])
+    for filename in filenames:
+        assert_equal(get_file_contents(filename), _DATA)
+
+
+@with_temp_folder
+def test_tee__empty_input(temp_folder):
+    filenames = [os.path.join(temp_folder, "out_%i" % (index,)) for index in range(2)]
+    assert_equal(_UNICAT["tee"](StringIO.StringIO(""), filenames), [])
+    for filename in filenames:
+        assert_equal(get_file_contents(filename), "")
+
+
+@with_temp_folder
+def test_tee__failing_output(temp_folder):
+    good_filename = os.path.join(temp_folder, "out")
+    bad_filename = os.path.join(temp_folder, "missing", "out")
+
+    errors = _UNICAT["tee"](StringIO.StringIO(_DATA), [good_filename, bad_filename])
+    assert_equal([filename for (filename, _) in errors], [bad_filename])
+    assert isinstance(errors[0][1], IOError)
+
+
+class _CountingSource:
+    def __init__(self, data):
+        self._handle = StringIO.StringIO(data)
+        self.consumed = 0
+
+    def read(self, size):
+        block = self._handle.read(size)
+        self.consumed += len(block)
+        return block
+
+
+@with_temp_folder
+def test_tee__queued_bytes_bounded_by_fastest_reader(temp_folder):
+    max_queued = 256 * 1024
+    data = "".join("%i\n" % (index,) for index in xrange(1000000))
+    # Readers of both FIFOs are stalled
+    fifo_1, fifo_2 = os.path.join(temp_folder, "fifo_1"), os.path.join(temp_folder, "fifo_2")
+    os.mkfifo(fifo_1)
+    os.mkfifo(fifo_2)
+
+    source, results = _CountingSource(data), []
+    thread = threading.Thread(target = lambda: results.append(_UNICAT["tee"](source, [fifo_1, fifo_2], max_queued)))
+    thread.daemon = True
+    thread.start()
+
+    time.sleep(0.5)
+    # Reading stops once every reader lags by more than 'max_queued'
+    assert source.consumed <= max_queued + 2 * _UNICAT["_BLOCK_SIZE"], source.consumed
+
+    with open(fifo_1) as handle_1:
+        assert_equal(handle_1.read(), data)
+    with open(fifo_2) as handle_2:
+        assert_equal(handle_2.read(), data)
+    thread.join(10)
+    assert_equal(results, [[]])
+
+
+@with_temp_folder
+def test_tee__queue_not_bounded_by_slowest_reader(temp_folder):
+    # Readers may lag arbitrarily far behind the fastest reader, e.g. 'samse'
+    # behind 'aln', which would otherwise deadlock
+    data = "".join("%i\n" % (index,) for index in xrange(100000))
+    fifo_1, fifo_2 = os.path.join(temp_folder, "fifo_1"), os.path.join(temp_folder, "fifo_2")
+    os.mkfifo(fifo_1)
+    os.mkfifo(fifo_2)
+
+    results = []
+    thread = threading.Thread(target = lambda: results.append(_UNICAT["tee"](StringIO.StringIO(data), [fifo_1, fifo_2], 1024)))
+    thread.daemon = True
+    thread.start()
+
+    with open(fifo_1) as handle_1:
+        assert_equal(handle_1.read(), data)
+    with open(fifo_2) as handle_2:
+        assert_equal(handle_2.read(), data)
+    thread.join(10)
+    assert_equal(results, [[]])
+
+
+@with_temp_folder
+def test_call__multiple_outputs(temp_folder):
+    input_filename = os.path.join(temp_folder, "in.gz")
+    handle = gzip.open(input_filename, "wb")
+    handle.write(_DATA)
+    handle.close()
+
+    filenames = [os.path.join(temp_folder, "out_%i" % (index,)) for index in range(2)]
+    assert_equal(_UNICAT["call"]([input_filename], filenames), 0)
+    for filename in filenames:
+        assert_equal(get_file_contents(filename), _DATA)
+
+
+@with_temp_folder
+def test_call__failing_output(temp_folder):
+    input_filename = os.path.join(temp_folder, "in")
+    # Fits in the pipe buffer, so that 'cat' does not fail on a closed pipe
+    set_file_contents(input_filename, _DATA[:1024])
+    good_filename = os.path.join(temp_folder, "out")
+    bad_filename = os.path.join(temp_folder, "missing", "out")
+
+    stderr = StringIO.StringIO()
+    with Monkeypatch("sys.stderr", stderr):
+        assert_equal(_UNICAT["call"]([input_filename], [good_filename, bad_filename]), 1)
+    assert bad_filename in stderr.getvalue()
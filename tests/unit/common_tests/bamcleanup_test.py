@@ -0,0 +1,178 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import os
+
+import nose.tools
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     set_file_contents
+
+from pypeline.common.bamcleanup import \
+     Reference, \
+     calculate_md_nm, \
+     cleanup_header, \
+     cleanup_reads
+
+
+class _Read(object):
+    def __init__(self, name, tid, pos, cigar, seq, mapq = 30, is_unmapped = False, tags = ()):
+        self.qname = name
+        self.tid = tid
+        self.pos = pos
+        self.cigar = cigar
+        self.seq = seq
+        self.mapq = mapq
+        self.is_unmapped = is_unmapped
+        self.tags = list(tags)
+        if cigar:
+            self.alen = sum(num for (op, num) in cigar if op in (0, 2, 3, 7, 8))
+
+
+class _Reference(object):
+    def __init__(self, sequences):
+        self._sequences = sequences
+
+    def fetch(self, contig, start, end):
+        return self._sequences[contig][start:end]
+
+
+def _write_fasta(temp_folder, line_width, sequences):
+    filename = os.path.join(temp_folder, "reference.fasta")
+    fasta, index = [], []
+    for (name, sequence) in sequences:
+        fasta.append(">%s\n" % (name,))
+        offset = len("".join(fasta))
+        for start in range(0, len(sequence), line_width):
+            fasta.append(sequence[start:start + line_width] + "\n")
+        index.append("%s\t%i\t%i\t%i\t%i\n" % (name, len(sequence), offset,
+                                                line_width, line_width + 1))
+
+    set_file_contents(filename, "".join(fasta))
+    set_file_contents(filename + ".fai", "".join(index))
+    return filename
+
+
+################################################################################
+################################################################################
+## Tests for 'Reference'
+
+_SEQUENCES = (("chr1", "ACGTacgtNNAACCGGTT"), ("chr2", "GATTACA"))
+
+@with_temp_folder
+def test_reference__fetch(temp_folder):
+    for line_width in (1, 4, 7, 60):
+        with Reference(_write_fasta(temp_folder, line_width, _SEQUENCES)) as reference:
+            for (name, sequence) in _SEQUENCES:
+                for start in range(len(sequence)):
+                    for end in range(start, len(sequence) + 1):
+                        assert_equal(reference.fetch(name, start, end), sequence[start:end].upper())
+
+@with_temp_folder
+def test_reference__fetch_clipped(temp_folder):
+    with Reference(_write_fasta(temp_folder, 4, _SEQUENCES)) as reference:
+        assert_equal(reference.fetch("chr2", 4, 100), "ACA")
+        assert_equal(reference.fetch("chr2", -2, 2), "GA")
+        assert_equal(reference.fetch("chr2", 7, 10), "")
+
+@with_temp_folder
+@nose.tools.raises(KeyError)
+def test_reference__unknown_contig(temp_folder):
+    with Reference(_write_fasta(temp_folder, 4, _SEQUENCES)) as reference:
+        reference.fetch("chr3", 0, 1)
+
+
+################################################################################
+################################################################################
+## Tests for 'calculate_md_nm'
+
+def test_calculate_md_nm__match():
+    assert_equal(calculate_md_nm([(0, 4)], "ACGT", "ACGT"), ("4", 0))
+
+def test_calculate_md_nm__lowercase_read():
+    assert_equal(calculate_md_nm([(0, 4)], "acgt", "ACGT"), ("4", 0))
+
+def test_calculate_md_nm__mismatches():
+    assert_equal(calculate_md_nm([(0, 4)], "TCTT", "ACGT"), ("0A1G1", 2))
+
+def test_calculate_md_nm__n_is_mismatch():
+    assert_equal(calculate_md_nm([(0, 4)], "ANGT", "ANGT"), ("1N2", 1))
+
+def test_calculate_md_nm__insertion():
+    assert_equal(calculate_md_nm([(0, 2), (1, 2), (0, 2)], "ACTTGT", "ACGT"), ("4", 2))
+
+def test_calculate_md_nm__deletion():
+    assert_equal(calculate_md_nm([(0, 2), (2, 2), (0, 2)], "ACGT", "ACTTGT"), ("2^TT2", 2))
+
+def test_calculate_md_nm__mismatch_after_deletion():
+    assert_equal(calculate_md_nm([(0, 2), (2, 1), (0, 2)], "ACAT", "ACGGT"), ("2^G0G1", 2))
+
+def test_calculate_md_nm__skipped_bases():
+    assert_equal(calculate_md_nm([(0, 2), (3, 3), (0, 2)], "ACGT", "ACNNNGT"), ("4", 0))
+
+def test_calculate_md_nm__clipping():
+    assert_equal(calculate_md_nm([(5, 3), (4, 2), (0, 3)], "NNACG", "ACG"), ("3", 0))
+
+def test_calculate_md_nm__equal_and_diff_ops():
+    assert_equal(calculate_md_nm([(7, 2), (8, 1), (7, 1)], "ACTT", "ACGT"), ("2G1", 1))
+
+
+################################################################################
+################################################################################
+## Tests for 'cleanup_header'
+
+def test_cleanup_header():
+    header = {"HD" : {"VN" : "1.0"}, "RG" : [{"ID" : "a"}, {"ID" : "b"}]}
+    result = cleanup_header(header, {"ID" : "c", "SM" : "sample"})
+    assert_equal(result, {"HD" : {"VN" : "1.0"}, "RG" : [{"ID" : "c", "SM" : "sample"}]})
+    assert_equal(header["RG"], [{"ID" : "a"}, {"ID" : "b"}])
+
+
+################################################################################
+################################################################################
+## Tests for 'cleanup_reads'
+
+def _cleanup(reads, min_mapq = 0):
+    reference = _Reference({"chr1" : "ACGTACGT", "chr2" : "GATTACA"})
+    return list(cleanup_reads(reads, ["chr1", "chr2"], reference, "rg", min_mapq))
+
+def test_cleanup_reads__filtering():
+    reads = [_Read("a", 0, 0, [(0, 4)], "ACGT", mapq = 10),
+             _Read("b", 0, 0, [(0, 4)], "ACGT", mapq = 30),
+             _Read("c", -1, -1, None, "ACGT", is_unmapped = True),
+             _Read("d", 1, 0, [(0, 4)], "GATT", mapq = 20)]
+    assert_equal([read.qname for read in _cleanup(reads, min_mapq = 20)], ["b", "d"])
+
+def test_cleanup_reads__new_tags():
+    reads = _cleanup([_Read("a", 1, 2, [(0, 4)], "TTAA", tags = [("XT", "U")])])
+    assert_equal(reads[0].tags, [("XT", "U"), ("RG", "rg"), ("NM", 1), ("MD", "3C0")])
+
+def test_cleanup_reads__replaced_tags():
+    tags = [("MD", "4"), ("RG", "old"), ("NM", 0), ("XT", "U")]
+    reads = _cleanup([_Read("a", 0, 4, [(0, 4)], "ACTT", tags = tags)])
+    assert_equal(reads[0].tags, [("MD", "2G1"), ("RG", "rg"), ("NM", 1), ("XT", "U")])
+
+def test_cleanup_reads__no_sequence():
+    reads = _cleanup([_Read("a", 0, 4, [(0, 4)], None, tags = [("NM", 0)])])
+    assert_equal(reads[0].tags, [("NM", 0), ("RG", "rg")])
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import nose.tools
+from nose.tools import assert_equal
+
+from pypeline.common.bammerge import \
+     BAMMergeError, \
+     merge_headers, \
+     merge_reads
+
+
+class _Read(object):
+    def __init__(self, name, tid, pos, tags = ()):
+        self.qname = name
+        self.tid = tid
+        self.pos = pos
+        self.tags = list(tags)
+
+    def __repr__(self):
+        return "_Read(%r)" % (self.qname,)
+
+
+def _header(**kwargs):
+    header = {"HD" : {"VN" : "1.0", "SO" : "coordinate"},
+              "SQ" : [{"SN" : "chr1", "LN" : 1000}, {"SN" : "chr2", "LN" : 500}]}
+    header.update(kwargs)
+    return header
+
+
+def _names(reads):
+    return [read.qname for read in reads]
+
+
+################################################################################
+################################################################################
+## Tests for 'merge_headers'
+
+def test_merge_headers__single_header():
+    header = _header(RG = [{"ID" : "rg1", "SM" : "sample"}], CO = ["comment"])
+    assert_equal(merge_headers([header]), (header, [None]))
+
+def test_merge_headers__sort_order_is_coordinate():
+    header, _ = merge_headers([_header(HD = {"VN" : "1.4", "SO" : "unsorted"})])
+    assert_equal(header["HD"], {"VN" : "1.4", "SO" : "coordinate"})
+
+@nose.tools.raises(BAMMergeError)
+def test_merge_headers__no_headers():
+    merge_headers([])
+
+@nose.tools.raises(BAMMergeError)
+def test_merge_headers__different_sequences():
+    merge_headers([_header(), _header(SQ = [{"SN" : "chr1", "LN" : 1000}])])
+
+def test_merge_headers__identical_records_merged():
+    header_1 = _header(RG = [{"ID" : "rg1", "SM" : "a"}], PG = [{"ID" : "bwa", "CL" : "bwa aln"}])
+    header_2 = _header(RG = [{"ID" : "rg1", "SM" : "a"}, {"ID" : "rg2", "SM" : "b"}],
+                       PG = [{"ID" : "bwa", "CL" : "bwa aln"}])
+    header, mappings = merge_headers([header_1, header_2])
+    assert_equal(header["RG"], [{"ID" : "rg1", "SM" : "a"}, {"ID" : "rg2", "SM" : "b"}])
+    assert_equal(header["PG"], [{"ID" : "bwa", "CL" : "bwa aln"}])
+    assert_equal(mappings, [None, None])
+
+def test_merge_headers__conflicting_records_renamed():
+    header_1 = _header(RG = [{"ID" : "rg1", "SM" : "a"}])
+    header_2 = _header(RG = [{"ID" : "rg1", "SM" : "b"}],
+                       PG = [{"ID" : "bwa", "CL" : "bwa aln"}])
+    header_3 = _header(RG = [{"ID" : "rg1", "SM" : "c"}],
+                       PG = [{"ID" : "bwa", "CL" : "bwa mem"},
+                             {"ID" : "samtools", "PP" : "bwa"}])
+    header, mappings = merge_headers([header_1, header_2, header_3])
+    assert_equal(header["RG"], [{"ID" : "rg1", "SM" : "a"},
+                                {"ID" : "rg1.1", "SM" : "b"},
+                                {"ID" : "rg1.2", "SM" : "c"}])
+    assert_equal(header["PG"], [{"ID" : "bwa", "CL" : "bwa aln"},
+                                {"ID" : "bwa.1", "CL" : "bwa mem"},
+                                {"ID" : "samtools", "PP" : "bwa.1"}])
+    assert_equal(mappings, [None,
+                            {"RG" : {"rg1" : "rg1.1"}},
+                            {"RG" : {"rg1" : "rg1.2"}, "PG" : {"bwa" : "bwa.1"}}])
+
+def test_merge_headers__comments():
+    header, _ = merge_headers([_header(CO = ["a", "b"]), _header(CO = ["b", "c"])])
+    assert_equal(header["CO"], ["a", "b", "c"])
+
+def test_merge_headers__input_not_modified():
+    header_1 = _header(RG = [{"ID" : "rg1", "SM" : "a"}])
+    header_2 = _header(RG = [{"ID" : "rg1", "SM" : "b"}])
+    merge_headers([header_1, header_2])
+    assert_equal(header_2["RG"], [{"ID" : "rg1", "SM" : "b"}])
+
+
+################################################################################
+################################################################################
+## Tests for 'merge_reads'
+
+def test_merge_reads__no_files():
+    assert_equal(list(merge_reads([])), [])
+
+def test_merge_reads__coordinate_order():
+    file_1 = [_Read("a", 0, 10), _Read("b", 0, 30), _Read("c", 1, 5)]
+    file_2 = [_Read("d", 0, 20), _Read("e", 1, 1), _Read("f", 1, 7)]
+    assert_equal(_names(merge_reads([file_1, file_2])), ["a", "d", "b", "e", "c", "f"])
+
+def test_merge_reads__ties_in_file_order():
+    file_1 = [_Read("a", 0, 10), _Read("b", 0, 10)]
+    file_2 = [_Read("c", 0, 10)]
+    assert_equal(_names(merge_reads([file_2, file_1])), ["c", "a", "b"])
+
+def test_merge_reads__unmapped_reads_last():
+    file_1 = [_Read("a", 0, 10), _Read("b", -1, -1)]
+    file_2 = [_Read("c", 1, 10), _Read("d", -1, -1)]
+    assert_equal(_names(merge_reads([file_1, file_2])), ["a", "c", "b", "d"])
+
+@nose.tools.raises(BAMMergeError)
+def test_merge_reads__unsorted_file():
+    list(merge_reads([[_Read("a", 0, 10), _Read("b", 0, 5)]]))
+
+@nose.tools.raises(BAMMergeError)
+def test_merge_reads__mapped_after_unmapped():
+    list(merge_reads([[_Read("a", -1, -1), _Read("b", 0, 5)]]))
+
+def test_merge_reads__tags_updated():
+    file_1 = [_Read("a", 0, 10, [("RG", "rg1"), ("PG", "bwa"), ("NM", 0)])]
+    file_2 = [_Read("b", 0, 20, [("RG", "rg1"), ("PG", "bwa"), ("NM", 1)])]
+    mappings = [None, {"RG" : {"rg1" : "rg1.1"}}]
+    reads = list(merge_reads([file_1, file_2], mappings))
+    assert_equal([read.tags for read in reads],
+                 [[("RG", "rg1"), ("PG", "bwa"), ("NM", 0)],
+                  [("RG", "rg1.1"), ("PG", "bwa"), ("NM", 1)]])
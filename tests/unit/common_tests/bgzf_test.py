@@ -0,0 +1,141 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import gzip
+import random
+import StringIO
+
+import nose.tools
+from nose.tools import assert_equal
+
+from pypeline.common.bgzf import \
+     BGZFWriter, \
+     BGZFError, \
+     compress_block, \
+     read_blocks, \
+     recompress
+
+
+def _random_data(size, seed = 1234):
+    rng = random.Random(seed)
+    # Partially compressible data, to ensure that multiple blocks are used
+    return "".join(rng.choice("ACGT") + chr(rng.randint(0, 255)) for _ in xrange(size // 2))
+
+
+def _write_bgzf(chunks, threads = 1):
+    handle = StringIO.StringIO()
+    with BGZFWriter(handle, threads) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return handle.getvalue()
+
+
+def _gunzip(data):
+    return gzip.GzipFile(fileobj = StringIO.StringIO(data)).read()
+
+
+################################################################################
+################################################################################
+## Tests for BGZFWriter
+
+def test_bgzf_writer__empty():
+    result = _write_bgzf([])
+    assert_equal(_gunzip(result), "")
+    assert_equal(list(read_blocks(StringIO.StringIO(result))), [])
+
+
+def test_bgzf_writer__single_block():
+    result = _write_bgzf(["foo", "bar"])
+    assert_equal(_gunzip(result), "foobar")
+    assert_equal(list(read_blocks(StringIO.StringIO(result))), ["foobar"])
+
+
+def test_bgzf_writer__multiple_blocks():
+    def _test_bgzf_writer__multiple_blocks(threads):
+        data = _random_data(300000)
+        chunks = [data[offset:offset + 1000] for offset in xrange(0, len(data), 1000)]
+        result = _write_bgzf(chunks, threads)
+        assert_equal(_gunzip(result), data)
+
+        blocks = list(read_blocks(StringIO.StringIO(result)))
+        assert_equal("".join(blocks), data)
+        assert all(len(block) <= 0xff00 for block in blocks)
+
+    for threads in (1, 2, 4):
+        yield _test_bgzf_writer__multiple_blocks, threads
+
+
+def test_bgzf_writer__eof_block():
+    result = _write_bgzf(["foo"])
+    assert result.endswith("1f8b08040000000000ff0600424302001b0003000000000000000000".decode("hex"))
+
+
+def test_bgzf_writer__no_eof_block_on_error():
+    handle = StringIO.StringIO()
+    try:
+        with BGZFWriter(handle, 2) as writer:
+            writer.write("foo")
+            raise KeyError("bar")
+    except KeyError:
+        pass
+    assert_equal(handle.getvalue(), "")
+
+
+def test_compress_block__incompressible_data():
+    data = "".join(chr(random.Random(4321).randint(0, 255)) for _ in xrange(0xff00))
+    result = compress_block(data, 9)
+    assert_equal(_gunzip(result), data)
+    assert_equal("".join(read_blocks(StringIO.StringIO(result))), data)
+
+
+################################################################################
+################################################################################
+## Tests for read_blocks / recompress
+
+def test_read_blocks__truncated():
+    result = _write_bgzf([_random_data(1000)])
+    handle = StringIO.StringIO(result[:40])
+    nose.tools.assert_raises(BGZFError, list, read_blocks(handle))
+
+
+def test_read_blocks__not_bgzf():
+    handle = StringIO.StringIO()
+    with gzip.GzipFile(fileobj = handle, mode = "w") as output:
+        output.write("foobar")
+    handle.seek(0)
+    nose.tools.assert_raises(BGZFError, list, read_blocks(handle))
+
+
+def test_read_blocks__corrupt():
+    result = _write_bgzf([_random_data(1000)])
+    handle = StringIO.StringIO(result[:-40] + chr(ord(result[-40]) ^ 1) + result[-39:])
+    nose.tools.assert_raises(BGZFError, list, read_blocks(handle))
+
+
+def test_recompress():
+    data = _random_data(200000)
+    # Level 0 corresponds to the 'uncompressed' BAM files written by samtools
+    stored = compress_block(data[:1000], 0) + compress_block(data[1000:], 0)
+    output = StringIO.StringIO()
+    recompress(StringIO.StringIO(stored), output, threads = 2)
+    assert_equal(_gunzip(output.getvalue()), data)
+    assert len(output.getvalue()) < len(stored)
@@ -30,6 +30,7 @@ import pypeline
 from pypeline.common.testing import \
      with_temp_folder, \
      Monkeypatch, \
+     RequiredCall, \
      SetWorkingDirectory, \
      set_file_contents, \
      get_file_contents, \
@@ -43,14 +44,17 @@ from pypeline.common.fileutils import \
      missing_files, \
      modified_after, \
      is_executable, \
+     find_executable, \
      executable_exists, \
      missing_executables, \
      make_dirs, \
      move_file, \
      copy_file, \
      open_ro, \
+     file_checksum, \
      try_remove, \
-     describe_files
+     describe_files, \
+     FileStatusCache
 
 
 ################################################################################
@@ -253,6 +257,86 @@ def test_modified_after__same_file():
 
 
 
+################################################################################
+################################################################################
+## Tests for 'FileStatusCache'
+
+def test_file_status_cache__stat():
+    cache = FileStatusCache()
+    assert_equal(cache.stat("tests/data/timestamp_a_older").st_mtime,
+                 os.path.getmtime("tests/data/timestamp_a_older"))
+    assert_equal(cache.stat("tests/data/missing_file_1"), None)
+
+
+@with_temp_folder
+def test_file_status_cache__missing_files__cached(temp_folder):
+    filename = os.path.join(temp_folder, "file")
+    with FileStatusCache() as cache:
+        assert_equal(missing_files([filename]), [filename])
+        set_file_contents(filename, "1")
+        assert_equal(missing_files([filename]), [filename])
+        cache.invalidate(filename)
+        assert_equal(missing_files([filename]), [])
+
+
+@with_temp_folder
+def test_file_status_cache__inactive(temp_folder):
+    filename = os.path.join(temp_folder, "file")
+    cache = FileStatusCache()
+    with cache:
+        assert_equal(missing_files([filename]), [filename])
+    set_file_contents(filename, "1")
+    assert_equal(missing_files([filename]), [])
+
+
+def test_file_status_cache__modified_after():
+    with FileStatusCache():
+        assert modified_after("tests/data/timestamp_a_younger", "tests/data/timestamp_a_older")
+        assert not modified_after("tests/data/timestamp_a_older", "tests/data/timestamp_a_younger")
+
+
+def test_file_status_cache__modified_after__missing_file():
+    with FileStatusCache():
+        assert_raises(OSError, modified_after, "tests/data/missing_file_1", "tests/data/empty_file_1")
+
+
+def _do_test_file_status_cache__prefetch(threads):
+    filenames = ["tests/data/empty_file_1", "tests/data/missing_file_1",
+                 "tests/data/timestamp_a_older"]
+    cache = FileStatusCache(threads = threads)
+    with Monkeypatch("pypeline.common.fileutils._MIN_FILES_PER_THREAD", 1):
+        cache.prefetch(filenames)
+
+    def _stat_wrap(filename):
+        assert False, "os.stat called for %r" % (filename,)
+
+    with Monkeypatch("os.stat", _stat_wrap):
+        assert_equal(cache.stat("tests/data/missing_file_1"), None)
+        assert cache.stat("tests/data/empty_file_1")
+        assert cache.stat("tests/data/timestamp_a_older")
+
+def test_file_status_cache__prefetch():
+    yield _do_test_file_status_cache__prefetch, 1
+    yield _do_test_file_status_cache__prefetch, 4
+
+
+def test_file_status_cache__clear():
+    cache = FileStatusCache()
+    cache.prefetch(["tests/data/empty_file_1"])
+    cache.clear()
+    with RequiredCall("os.stat", args = ("tests/data/empty_file_1",)):
+        cache.stat("tests/data/empty_file_1")
+
+
+def test_file_status_cache__nested():
+    with FileStatusCache() as cache_1:
+        with FileStatusCache():
+            missing_files(["tests/data/empty_file_1"])
+        missing_files(["tests/data/empty_file_2"])
+    assert_equal(cache_1._stats.keys(), ["tests/data/empty_file_2"])
+
+
+
 
 ################################################################################
 ################################################################################
@@ -297,6 +381,37 @@ def test_executable_exists__rel_path__is_non_executable():
 
 
 
+################################################################################
+################################################################################
+## Tests for 'find_executable'
+
+def test_find_executable__executable():
+    assert_equal(os.path.basename(find_executable("ls")), "ls")
+    assert is_executable(find_executable("ls"))
+
+def test_find_executable__non_executable():
+    assert_equal(find_executable("lsxxxx"), None)
+
+def test_find_executable__rel_path():
+    assert_equal(find_executable("tests/unit/run"), "tests/unit/run")
+    assert_equal(find_executable("tests/data/empty_file_1"), None)
+
+def test_find_executable__cached():
+    find_executable("ls")
+    with Monkeypatch("pypeline.common.fileutils.is_executable", _is_executable_not_called):
+        assert find_executable("ls")
+
+def test_find_executable__cache_depends_on_path():
+    find_executable("ls")
+    with Monkeypatch("os.environ", {"PATH" : "tests/data"}):
+        assert_equal(find_executable("ls"), None)
+        assert find_executable("empty_file_1") is None
+
+def _is_executable_not_called(filename):
+    assert False, "is_executable called for %r" % (filename,)
+
+
+
 
 ################################################################################
 ################################################################################
@@ -564,6 +679,54 @@ def test_open_ro__close_handle_on_error():
 
 
 
+################################################################################
+################################################################################
+## Tests for 'file_checksum'
+
+def test_file_checksum__empty_file():
+    assert_equal(file_checksum("tests/data/empty_file_1"), "d41d8cd98f00b204e9800998ecf8427e")
+
+@with_temp_folder
+def test_file_checksum__contents(temp_folder):
+    fpath = os.path.join(temp_folder, "test.txt")
+    set_file_contents(fpath, "1 2 3\n")
+    assert_equal(file_checksum(fpath), "f2b33fb7b3d0eb95090a16060e6a24f9")
+
+@with_temp_folder
+def test_file_checksum__multiple_chunks(temp_folder):
+    fpath = os.path.join(temp_folder, "test.txt")
+    set_file_contents(fpath, "1 2 3\n")
+    with Monkeypatch("pypeline.common.fileutils._CHECKSUM_CHUNK_SIZE", 2):
+        assert_equal(file_checksum(fpath), "f2b33fb7b3d0eb95090a16060e6a24f9")
+
+@with_temp_folder
+def test_file_checksum__cached(temp_folder):
+    fpath = os.path.join(temp_folder, "test.txt")
+    set_file_contents(fpath, "1 2 3\n")
+    file_checksum(fpath)
+    with Monkeypatch("pypeline.common.fileutils._calculate_checksum", _calculate_checksum_not_called):
+        assert_equal(file_checksum(fpath), "f2b33fb7b3d0eb95090a16060e6a24f9")
+
+@with_temp_folder
+def test_file_checksum__modified_file(temp_folder):
+    fpath = os.path.join(temp_folder, "test.txt")
+    set_file_contents(fpath, "1 2 3\n")
+    os.utime(fpath, (1000, 1000))
+    file_checksum(fpath)
+    set_file_contents(fpath, "4 5 6\n")
+    os.utime(fpath, (2000, 2000))
+    assert_equal(file_checksum(fpath), "95308c7051e4b6dbf42c5bc98f50d3a2")
+
+@with_temp_folder
+@nose.tools.raises(OSError)
+def test_file_checksum__missing_file(temp_folder):
+    file_checksum(os.path.join(temp_folder, "test.txt"))
+
+def _calculate_checksum_not_called(filename):
+    assert False, "_calculate_checksum called for %r" % (filename,)
+
+
+
 ################################################################################
 ################################################################################
 ## Tests for 'try_remove'
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import StringIO
+
+import nose.tools
+from nose.tools import assert_equal
+
+from pypeline.common.formats.fastq import \
+     read_fastq, \
+     split_fastq, \
+     FASTQError
+
+
+_RECORDS = ["@read_%i\nACGT\n+\nIIII\n" % (index,) for index in range(5)]
+
+
+################################################################################
+################################################################################
+## Tests for 'read_fastq'
+
+def test_read_fastq__empty():
+    assert_equal(list(read_fastq([])), [])
+
+def test_read_fastq__records():
+    lines = StringIO.StringIO("".join(_RECORDS))
+    assert_equal(list(read_fastq(lines)), _RECORDS)
+
+def test_read_fastq__missing_final_newline():
+    lines = ["@read\n", "ACGT\n", "+\n", "IIII"]
+    assert_equal(list(read_fastq(lines)), ["@read\nACGT\n+\nIIII\n"])
+
+@nose.tools.raises(FASTQError)
+def test_read_fastq__truncated_record():
+    list(read_fastq(["@read\n", "ACGT\n", "+\n"]))
+
+@nose.tools.raises(FASTQError)
+def test_read_fastq__bad_header():
+    list(read_fastq([">read\n", "ACGT\n", "+\n", "IIII\n"]))
+
+@nose.tools.raises(FASTQError)
+def test_read_fastq__bad_separator():
+    list(read_fastq(["@read\n", "ACGT\n", "IIII\n", "+\n"]))
+
+
+################################################################################
+################################################################################
+## Tests for 'split_fastq'
+
+def test_split_fastq__single_file():
+    outputs = [StringIO.StringIO() for _ in range(3)]
+    assert_equal(split_fastq([StringIO.StringIO("".join(_RECORDS))], [outputs]), 5)
+    assert_equal([output.getvalue() for output in outputs],
+                 [_RECORDS[0] + _RECORDS[3], _RECORDS[1] + _RECORDS[4], _RECORDS[2]])
+
+def test_split_fastq__more_chunks_than_records():
+    outputs = [StringIO.StringIO() for _ in range(3)]
+    assert_equal(split_fastq([StringIO.StringIO(_RECORDS[0])], [outputs]), 1)
+    assert_equal([output.getvalue() for output in outputs], [_RECORDS[0], "", ""])
+
+def test_split_fastq__mates_kept_together():
+    mates_1 = [record.replace("\nACGT", "/1\nACGT") for record in _RECORDS]
+    mates_2 = [record.replace("\nACGT", "/2\nTGCA") for record in _RECORDS]
+    outputs = [[StringIO.StringIO() for _ in range(2)] for _ in range(2)]
+    handles = [StringIO.StringIO("".join(mates)) for mates in (mates_1, mates_2)]
+    assert_equal(split_fastq(handles, outputs), 5)
+
+    for (mates, chunks) in zip((mates_1, mates_2), outputs):
+        assert_equal([chunk.getvalue() for chunk in chunks],
+                     ["".join(mates[0::2]), "".join(mates[1::2])])
+
+@nose.tools.raises(FASTQError)
+def test_split_fastq__different_number_of_mates():
+    handles = [StringIO.StringIO("".join(_RECORDS)), StringIO.StringIO("".join(_RECORDS[:-1]))]
+    outputs = [[StringIO.StringIO()], [StringIO.StringIO()]]
+    split_fastq(handles, outputs)
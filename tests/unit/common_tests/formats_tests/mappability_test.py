@@ -0,0 +1,140 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import os
+
+import numpy
+import nose.tools
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     set_file_contents
+from pypeline.common.formats.mappability import \
+     MappabilityTrack, \
+     MappabilityError, \
+     is_mappability_track, \
+     write_mappability, \
+     convert_gem_mappability
+
+
+_CONTIGS = (("chr1", [True, False, False, True, True, True, False, True, False, True]),
+            ("chr2", []),
+            ("chrM", [False] * 8 + [True] * 9))
+
+
+def _assert_track_equals(filename, contigs):
+    with MappabilityTrack(filename) as track:
+        assert_equal(track.contigs, dict((name, len(values)) for (name, values) in contigs))
+        for (name, values) in contigs:
+            assert_equal([track.is_mappable(name, index) for index in range(len(values))], values)
+            assert_equal(list(track.is_mappable(name, range(len(values)))), values)
+
+
+################################################################################
+################################################################################
+## Tests for write_mappability / MappabilityTrack
+
+@with_temp_folder
+def test_mappability__write_and_read(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    write_mappability(filename, _CONTIGS)
+    assert is_mappability_track(filename)
+    _assert_track_equals(filename, _CONTIGS)
+
+
+@with_temp_folder
+def test_mappability__packed_size(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    write_mappability(filename, [("chr1", [True] * 8000)])
+    assert os.path.getsize(filename) < 1100
+
+
+@with_temp_folder
+def test_mappability__batch_lookup(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    values = numpy.random.RandomState(1234).randint(0, 2, 1001).astype(bool)
+    write_mappability(filename, [("chr1", values)])
+    with MappabilityTrack(filename) as track:
+        positions = numpy.array([1000, 0, 7, 8, 500, 7])
+        assert_equal(list(track.is_mappable("chr1", positions)), list(values[positions]))
+        assert_equal(track.is_mappable("chr1", numpy.int64(7)), values[7])
+
+
+@with_temp_folder
+def test_mappability__unknown_contig(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    write_mappability(filename, _CONTIGS)
+    with MappabilityTrack(filename) as track:
+        nose.tools.assert_raises(KeyError, track.is_mappable, "chr3", 0)
+
+
+@with_temp_folder
+def test_mappability__outside_contig(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    write_mappability(filename, _CONTIGS)
+    with MappabilityTrack(filename) as track:
+        nose.tools.assert_raises(IndexError, track.is_mappable, "chr1", 10)
+        nose.tools.assert_raises(IndexError, track.is_mappable, "chr1", -1)
+        nose.tools.assert_raises(IndexError, track.is_mappable, "chr1", [0, 10])
+
+
+@with_temp_folder
+def test_mappability__duplicate_contigs(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    nose.tools.assert_raises(MappabilityError, write_mappability, filename,
+                             [("chr1", [True]), ("chr1", [False])])
+    assert not os.path.exists(filename)
+
+
+@with_temp_folder
+def test_mappability__not_a_track(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    set_file_contents(filename, ">chr1\n0110\n")
+    assert not is_mappability_track(filename)
+    nose.tools.assert_raises(MappabilityError, MappabilityTrack, filename)
+
+
+@with_temp_folder
+def test_mappability__truncated_track(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    write_mappability(filename, _CONTIGS)
+    with open(filename) as handle:
+        contents = handle.read()
+    set_file_contents(filename, contents[:-3])
+    nose.tools.assert_raises(MappabilityError, MappabilityTrack, filename)
+
+
+################################################################################
+################################################################################
+## Tests for convert_gem_mappability
+
+@with_temp_folder
+def test_convert_gem_mappability(temp_folder):
+    filename = os.path.join(temp_folder, "track.bmap")
+    lines = ["~~K-MER LENGTH\n", "100\n",
+             "~chr1\n", "!!\"!#\n", "!!\n",
+             "~chrM\n", "#!\n",
+             "~~ENCODING\n", "'!'~[1-1]\n"]
+    convert_gem_mappability(lines, filename)
+    _assert_track_equals(filename, [("chr1", [True, True, False, True, False, True, True]),
+                                    ("chrM", [False, True])])
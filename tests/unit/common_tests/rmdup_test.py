@@ -0,0 +1,108 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+from nose.tools import assert_equal
+
+from pypeline.common.rmdup import rmdup_collapsed
+
+
+class _Read(object):
+    def __init__(self, name, pos, qual = "IIII", cigar = ((0, 4),), is_reverse = False,
+                 tid = 0, flag = 0, tags = ()):
+        self.qname = name
+        self.tid = tid
+        self.pos = pos
+        self.qual = qual
+        self.cigar = list(cigar)
+        self.alen = sum(num for (op, num) in cigar if op in (0, 2, 3))
+        self.is_reverse = is_reverse
+        self.flag = flag
+        self.tags = list(tags)
+        self.is_duplicate = False
+
+    def __repr__(self):
+        return "_Read(%r)" % (self.qname,)
+
+
+def _names(reads):
+    return [read.qname for read in reads]
+
+
+################################################################################
+################################################################################
+## Tests for 'rmdup_collapsed'
+
+def test_rmdup_collapsed__non_collapsed_reads():
+    reads = [_Read("read_1", 10), _Read("read_2", 10), _Read("M_read", 10, flag = 0x4),
+             _Read("M_read_2", 10, qual = None)]
+    assert_equal(_names(rmdup_collapsed(reads)), _names(reads))
+    assert not any(read.is_duplicate for read in reads)
+    assert not any(read.tags for read in reads)
+
+
+def test_rmdup_collapsed__single_read():
+    read = _Read("M_read", 10, tags = [("NM", 0)])
+    read.is_duplicate = True
+    assert_equal(list(rmdup_collapsed([read])), [read])
+    assert not read.is_duplicate
+    assert_equal(read.tags, [("NM", 0), ("XP", 1)])
+
+
+def test_rmdup_collapsed__duplicates():
+    reads = [_Read("M_1", 10, "IIII"), _Read("M_2", 10, "JJJJ"), _Read("M_3", 10, "IIIJ")]
+    assert_equal(_names(rmdup_collapsed(reads)), ["M_1", "M_2", "M_3"])
+    assert_equal([read.is_duplicate for read in reads], [True, False, True])
+    assert_equal(reads[1].tags, [("XP", 3)])
+
+
+def test_rmdup_collapsed__remove_duplicates():
+    reads = [_Read("M_1", 10, "IIII"), _Read("M_2", 10, "JJJJ")]
+    assert_equal(_names(rmdup_collapsed(reads, remove_duplicates = True)), ["M_2"])
+
+
+def test_rmdup_collapsed__previous_counts():
+    reads = [_Read("M_1", 10, "JJJJ", tags = [("XP", 2)]), _Read("M_2", 10, tags = [("XP", 4)])]
+    list(rmdup_collapsed(reads))
+    assert_equal(reads[0].tags, [("XP", 2), ("XP", 8)])
+
+
+def test_rmdup_collapsed__most_common_cigar():
+    reads = [_Read("M_1", 10, "JJJJ", cigar = ((0, 2), (1, 1), (0, 1))),
+             _Read("M_2", 10, "IIII", cigar = ((0, 3),)),
+             _Read("M_3", 10, "IIII", cigar = ((0, 3),))]
+    list(rmdup_collapsed(reads))
+    assert_equal([read.is_duplicate for read in reads], [True, False, True])
+    assert_equal(reads[1].tags, [("XP", 2)])
+
+
+def test_rmdup_collapsed__strand_and_length():
+    reads = [_Read("M_1", 10), _Read("M_2", 10, is_reverse = True),
+             _Read("M_3", 10, cigar = ((0, 5),)), _Read("M_4", 10, tid = 1)]
+    assert_equal(_names(rmdup_collapsed(reads)), ["M_1", "M_2", "M_3", "M_4"])
+    assert not any(read.is_duplicate for read in reads)
+
+
+def test_rmdup_collapsed__buffered_until_next_position():
+    reads = [_Read("M_1", 10), _Read("read", 10), _Read("M_2", 10, is_reverse = True),
+             _Read("M_3", 10), _Read("read_2", 11), _Read("M_4", 12)]
+    assert_equal(_names(rmdup_collapsed(reads)),
+                 ["read", "M_1", "M_3", "M_2", "read_2", "M_4"])
@@ -0,0 +1,127 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+import os
+import sys
+import StringIO
+
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     set_file_contents
+
+from pypeline.common.sharding import \
+     read_contigs, \
+     read_bed_contigs, \
+     genotype_contigs, \
+     concatenate_vcfs
+
+
+# Mock 'mpileup' command, printing a header followed by the records of the
+# contig specified using '-r', or the records of all contigs if none is given
+_MOCK_PILEUP = """
+import sys
+contig = sys.argv[sys.argv.index("-r") + 1] if "-r" in sys.argv else None
+sys.stdout.write("##fileformat=VCFv4.1\\n#CHROM\\tPOS\\n")
+for line in open(sys.argv[-1]):
+    if contig in (None, line.split("\\t")[0]):
+        sys.stdout.write(line)
+"""
+
+_RECORDS = "chr1\t1\nchr1\t7\nchr2\t3\nchrM\t5\nchrM\t9\n"
+
+
+def _setup_mock_pileup(temp_folder):
+    script = os.path.join(temp_folder, "mpileup.py")
+    records = os.path.join(temp_folder, "records.txt")
+    set_file_contents(script, _MOCK_PILEUP)
+    set_file_contents(records, _RECORDS)
+    return [sys.executable, script, records]
+
+
+################################################################################
+################################################################################
+## Tests for 'read_contigs' / 'read_bed_contigs'
+
+@with_temp_folder
+def test_read_contigs(temp_folder):
+    filename = os.path.join(temp_folder, "ref.fasta.fai")
+    set_file_contents(filename, "chr1\t1000\t6\t60\t61\n\nchrM\t16571\t1030\t60\t61\n")
+    assert_equal(read_contigs(filename), [("chr1", 1000), ("chrM", 16571)])
+
+
+@with_temp_folder
+def test_read_bed_contigs(temp_folder):
+    filename = os.path.join(temp_folder, "regions.bed")
+    set_file_contents(filename, "# comment\ntrack name=foo\nchr1\t10\t20\n\nchrM 5 15\nchr1\t30\t40\n")
+    assert_equal(read_bed_contigs(filename), set(("chr1", "chrM")))
+
+
+################################################################################
+################################################################################
+## Tests for 'concatenate_vcfs'
+
+@with_temp_folder
+def test_concatenate_vcfs(temp_folder):
+    filenames = [os.path.join(temp_folder, "%i.vcf" % (index,)) for index in range(3)]
+    set_file_contents(filenames[0], "##foo\n#CHROM\nchr1\t1\n")
+    set_file_contents(filenames[1], "##foo\n#CHROM\n")
+    set_file_contents(filenames[2], "##bar\n#CHROM\nchr2\t1\nchr2\t2\n")
+
+    output = StringIO.StringIO()
+    concatenate_vcfs(filenames, output)
+    assert_equal(output.getvalue(), "##foo\n#CHROM\nchr1\t1\nchr2\t1\nchr2\t2\n")
+
+
+################################################################################
+################################################################################
+## Tests for 'genotype_contigs'
+
+@with_temp_folder
+def test_genotype_contigs__identical_to_unsharded(temp_folder):
+    pileup_call = _setup_mock_pileup(temp_folder)
+    contigs = [("chr1", 100), ("chr2", 50), ("chrM", 200)]
+    for processes in (1, 2, 4):
+        output = StringIO.StringIO()
+        assert genotype_contigs(pileup_call, ["cat"], contigs, processes, temp_folder, output)
+        assert_equal(output.getvalue(), "##fileformat=VCFv4.1\n#CHROM\tPOS\n" + _RECORDS)
+
+
+@with_temp_folder
+def test_genotype_contigs__temp_files_removed(temp_folder):
+    pileup_call = _setup_mock_pileup(temp_folder)
+    before = set(os.listdir(temp_folder))
+    assert genotype_contigs(pileup_call, ["cat"], [("chr1", 100)], 2, temp_folder, StringIO.StringIO())
+    assert_equal(set(os.listdir(temp_folder)), before)
+
+
+@with_temp_folder
+def test_genotype_contigs__failed_pipeline(temp_folder):
+    pileup_call = _setup_mock_pileup(temp_folder)
+    output = StringIO.StringIO()
+    stderr, sys.stderr = sys.stderr, StringIO.StringIO()
+    try:
+        assert not genotype_contigs(pileup_call, ["false"], [("chr1", 100)], 1, temp_folder, output)
+    finally:
+        sys.stderr = stderr
+    assert_equal(output.getvalue(), "")
@@ -389,3 +389,39 @@ def test_fast_pickle_test__unpicklable_2():
         return None # pragma: no coverage
     utils.fast_pickle_test(_func)
 
+
+
+################################################################################
+################################################################################
+## Tests for 'fork_map'
+
+def _fork_map_square(value):
+    return value * value
+
+def _fork_map_raise(value):
+    if value == 7:
+        raise ValueError("Bad value")
+    return value
+
+def test_fork_map__empty():
+    assert_equal(utils.fork_map(_fork_map_square, [], 4), [])
+
+def test_fork_map__single_process():
+    assert_equal(utils.fork_map(_fork_map_square, range(10), 1), [value * value for value in range(10)])
+
+def test_fork_map__multiple_processes():
+    assert_equal(utils.fork_map(_fork_map_square, range(10), 4), [value * value for value in range(10)])
+
+def test_fork_map__more_processes_than_items():
+    assert_equal(utils.fork_map(_fork_map_square, range(3), 8), [0, 1, 4])
+
+def test_fork_map__exception_in_child():
+    try:
+        utils.fork_map(_fork_map_raise, range(10), 3)
+        assert False # pragma: no coverage
+    except RuntimeError, error:
+        assert "Bad value" in str(error)
+
+@nose.tools.raises(ValueError)
+def test_fork_map__exception_in_parent():
+    utils.fork_map(_fork_map_raise, range(10), 7)
@@ -0,0 +1,653 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+import random
+import optparse
+import StringIO
+import tempfile
+import collections
+
+import pysam
+
+from nose.tools import assert_equal, assert_raises
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     Monkeypatch, \
+     set_file_contents
+
+import pypeline.common.vcfwrap as vcfwrap
+import pypeline.common.vcffilter as vcffilter
+
+
+class _VCF(object):
+    def __init__(self, contig, pos, ref, alt, qual = "50", info = "DP=20;DP4=5,5,5,5",
+                 pl = "99,0,99"):
+        self.contig = contig
+        self.pos = pos
+        self.ref = ref
+        self.alt = alt
+        self.qual = qual
+        self.info = info
+        self.filter = "."
+        self.format = "GT:PL"
+        self._samples = ["0/1:" + pl]
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __getitem__(self, index):
+        return self._samples[index]
+
+
+class _Mappability(object):
+    @classmethod
+    def is_mappable(cls, _contig, position):
+        return position % 7
+
+
+class _Frequencies(object):
+    VALID, INVALID, NA = vcffilter.AlleleFrequencies.VALID, \
+                         vcffilter.AlleleFrequencies.INVALID, \
+                         vcffilter.AlleleFrequencies.NA
+
+    def frequency_is_valid(self, _contig, position, _ref, _first, _second):
+        return (self.VALID, self.INVALID, self.NA)[position % 3]
+
+
+def _get_options(**kwargs):
+    parser = optparse.OptionParser()
+    vcffilter.add_varfilter_options(parser)
+    options, _ = parser.parse_args([])
+    for (key, value) in kwargs.iteritems():
+        setattr(options, key, value)
+    return options
+
+
+################################################################################
+################################################################################
+## _filter_by_properties
+
+def _filter_by_properties_previous(options, vcfs, mappability, frequencies):
+    """Per-record implementation of _filter_by_properties, as used by previous
+    versions, with which the current implementation is compared."""
+    mark = vcffilter._mark_as_filtered
+    for vcf in vcfs:
+        if float(vcf.qual) < options.min_quality:
+            mark(vcf, "q=%i" % options.min_quality)
+
+        properties = {}
+        for field in vcf.info.split(";"):
+            if "=" in field:
+                key, value = field.split("=")
+            else:
+                key, value = field, None
+            properties[key] = value
+
+        read_depth = float(properties["DP"])
+        if options.min_read_depth > read_depth:
+            mark(vcf, "d=%i" % options.min_read_depth)
+        elif options.max_read_depth < read_depth:
+            mark(vcf, "D=%i" % options.max_read_depth)
+
+        if "MQ" in properties:
+            if float(properties["MQ"]) < options.min_mapping_quality:
+                mark(vcf, "Q=%i" % options.min_mapping_quality)
+
+        if "PV4" in properties:
+            pv4 = [float(value) for value in properties["PV4"].split(",")]
+            if (pv4[0] < options.min_strand_bias):
+                mark(vcf, "1=%e" % options.min_strand_bias)
+            if (pv4[1] < options.min_baseq_bias):
+                mark(vcf, "2=%e" % options.min_baseq_bias)
+            if  (pv4[2] < options.min_mapq_bias):
+                mark(vcf, "3=%e" % options.min_mapq_bias)
+            if (pv4[3] < options.min_end_distance_bias):
+                mark(vcf, "4=%e" % options.min_end_distance_bias)
+
+        if vcf.alt != ".":
+            if not mappability.is_mappable(vcf.contig, vcf.pos):
+                mark(vcf, "m")
+
+            ref_fw, ref_rev, alt_fw, alt_rev = map(int, properties["DP4"].split(","))
+            if (alt_fw + alt_rev) < options.min_num_alt_bases:
+                mark(vcf, "a=%i" % options.min_num_alt_bases)
+
+            ml_genotype = vcfwrap.get_ml_phenotype(vcf)
+            if (ml_genotype == ("N", "N")) and not options.keep_ambigious_genotypes:
+                mark(vcf, "k")
+
+            if (ml_genotype[0] != ml_genotype[1]):
+                if vcf.contig in options.homozygous_chromosome:
+                    mark(vcf, "HET")
+
+                if vcf.ref in ml_genotype:
+                    n_minor = min(ref_fw + ref_rev, alt_fw + alt_rev)
+                    n_major = max(ref_fw + ref_rev, alt_fw + alt_rev)
+
+                    if (n_minor / float(n_minor + n_major)) < options.min_allele_frequency:
+                        mark(vcf, "f=%.4f" % options.min_allele_frequency)
+                else:
+                    state = frequencies.frequency_is_valid(vcf.contig, vcf.pos, vcf.ref, *ml_genotype)
+                    if state is frequencies.INVALID:
+                        mark(vcf, "f=%.4f" % options.min_allele_frequency)
+                    elif state is frequencies.NA:
+                        mark(vcf, "F=%.4f" % options.min_allele_frequency)
+
+
+def _build_property_records(rng, nrecords):
+    records = []
+    for position in xrange(nrecords):
+        ref = rng.choice("ACGT")
+        alt = rng.choice((".", rng.choice("ACGT".replace(ref, "")), "A,C" if ref not in "AC" else "G,T"))
+        n_alleles = 1 + len(alt.split(",")) if (alt != ".") else 1
+        pl = ",".join(str(rng.choice((0, 0, 10, 99)))
+                      for _ in xrange(n_alleles * (n_alleles + 1) // 2))
+
+        info = ["DP=%i" % (rng.randint(0, 40),)]
+        if rng.random() < 0.75:
+            info.append("MQ=%i" % (rng.randint(0, 60),))
+        if rng.random() < 0.5:
+            info.append("PV4=%s" % (",".join(rng.choice(("1", "0.5", "1e-5", "1e-200", "0"))
+                                             for _ in xrange(4)),))
+        info.append("DP4=%i,%i,%i,%i" % (rng.randint(1, 10), rng.randint(1, 10),
+                                          rng.randint(0, 5), rng.randint(0, 5)))
+        rng.shuffle(info)
+
+        records.append(_VCF(rng.choice(("chr1", "chrX")), position, ref, alt,
+                            qual = "%.2f" % (rng.random() * 60,),
+                            info = ";".join(info),
+                            pl = pl))
+    return records
+
+
+def _compare_filter_by_properties(seed, **kwargs):
+    options = _get_options(homozygous_chromosome = ["chrX"], max_read_depth = 30, **kwargs)
+    current = _build_property_records(random.Random(seed), 1000)
+    previous = _build_property_records(random.Random(seed), 1000)
+    # Warnings are printed for sites where frequencies could not be determined
+    with Monkeypatch("sys.stderr", StringIO.StringIO()):
+        vcffilter._filter_by_properties(options, current, _Mappability(), _Frequencies())
+        _filter_by_properties_previous(options, previous, _Mappability(), _Frequencies())
+
+    assert_equal([vcf.filter for vcf in previous], [vcf.filter for vcf in current])
+
+
+def test_filter_by_properties__same_as_previous():
+    for seed in xrange(5):
+        yield _compare_filter_by_properties, seed
+
+
+def test_filter_by_properties__same_as_previous__keep_ambigious():
+    _compare_filter_by_properties(1234, keep_ambigious_genotypes = True)
+
+
+def test_filter_by_properties__same_as_previous__other_cutoffs():
+    _compare_filter_by_properties(1234, min_quality = 10, min_read_depth = 2,
+                                  min_mapping_quality = 30, min_strand_bias = 0.6,
+                                  min_baseq_bias = 0.1, min_mapq_bias = 1e-10,
+                                  min_end_distance_bias = 0.6, min_num_alt_bases = 10,
+                                  min_allele_frequency = 0.4)
+
+
+def _filter_record(vcf, **kwargs):
+    vcffilter._filter_by_properties(_get_options(**kwargs), [vcf], _Mappability(), _Frequencies())
+    return vcf.filter
+
+
+def test_filter_by_properties__pass():
+    assert_equal(_filter_record(_VCF("chr1", 1, "A", "G")), ".")
+
+
+def test_filter_by_properties__thresholds_are_exclusive():
+    vcf = _VCF("chr1", 1, "A", "G", qual = "30", info = "DP=8;MQ=10;PV4=1e-4,1e-100,0,1e-4;DP4=1,1,1,1")
+    assert_equal(_filter_record(vcf, max_read_depth = 8), ".")
+
+
+def test_filter_by_properties__below_thresholds():
+    vcf = _VCF("chr1", 1, "A", "G", qual = "29.9", info = "DP=7;MQ=9;PV4=1e-5,1e-101,0,1e-5;DP4=1,1,1,0")
+    assert_equal(_filter_record(vcf).split(";"),
+                 ["q=30", "d=8", "Q=10", "1=1.000000e-04", "2=1.000000e-100",
+                  "4=1.000000e-04", "a=2"])
+
+
+def test_filter_by_properties__max_depth():
+    vcf = _VCF("chr1", 1, "A", "G", info = "DP=21;DP4=5,5,5,5")
+    assert_equal(_filter_record(vcf, max_read_depth = 20), "D=20")
+
+
+def test_filter_by_properties__missing_mq_and_pv4():
+    vcf = _VCF("chr1", 1, "A", "G", info = "DP=20;DP4=5,5,5,5")
+    assert_equal(_filter_record(vcf, min_mapping_quality = 1000, min_strand_bias = 1), ".")
+
+
+def test_filter_by_properties__reference_sites():
+    vcf = _VCF("chr1", 1, "A", ".", pl = "0", info = "DP=20;DP4=0,0,0,0")
+    assert_equal(_filter_record(vcf, min_num_alt_bases = 10), ".")
+
+
+def test_filter_by_properties__no_records():
+    vcffilter._filter_by_properties(_get_options(), [], _Mappability(), _Frequencies())
+
+
+################################################################################
+################################################################################
+## _select_indels_near_indels / _filter_by_indels
+
+def _group_indels_near_position_previous(indels, distance):
+    """Blacklist of positions near indels, as built by previous versions; for
+    each position, a list of adjacent / overlapping indels is provided."""
+    positions = collections.defaultdict(list)
+    if not distance:
+        return positions
+
+    for vcf in indels:
+        length = len(vcf.ref) - 1
+        start = vcf.pos + 1 - distance
+        end   = vcf.pos + 1 + distance + length
+
+        for position in xrange(start, end + 1):
+            positions[position].append(vcf)
+
+    return positions
+
+
+def _select_indels_near_indels_previous(indels, distance):
+    """Indels filtered by previous versions, using the above blacklist."""
+    blacklist = _group_indels_near_position_previous(indels, distance)
+    return [vcf for vcf in indels
+            if vcf is not vcffilter._select_best_indel(blacklist.get(vcf.pos + 1, [vcf]))]
+
+
+def _indel(contig, pos, qual, ref = "A", alt = "AC"):
+    return _VCF(contig, pos, ref, alt, qual = str(qual), info = "INDEL;DP=20;DP4=5,5,5,5")
+
+
+def _select_indels(indels, distance):
+    return [indels.index(vcf) for vcf in vcffilter._select_indels_near_indels(indels, distance)]
+
+
+def _compare_select_indels_near_indels(indels, distance):
+    current = sorted(_select_indels(indels, distance))
+    previous = sorted(indels.index(vcf)
+                      for vcf in _select_indels_near_indels_previous(indels, distance))
+    assert_equal(previous, current)
+
+
+def test_select_indels_near_indels__no_distance():
+    indels = [_indel("chr1", 10, 20), _indel("chr1", 11, 30)]
+    assert_equal(_select_indels(indels, 0), [])
+
+
+def test_select_indels_near_indels__isolated():
+    indels = [_indel("chr1", 10, 20), _indel("chr1", 100, 30)]
+    assert_equal(_select_indels(indels, 10), [])
+
+
+def test_select_indels_near_indels__overlapping():
+    indels = [_indel("chr1", 10, 20), _indel("chr1", 12, 30)]
+    assert_equal(_select_indels(indels, 5), [0])
+    _compare_select_indels_near_indels(indels, 5)
+
+
+def test_select_indels_near_indels__same_quality():
+    # The earlier of two equally good indels is kept
+    indels = [_indel("chr1", 12, 30), _indel("chr1", 10, 30)]
+    assert_equal(_select_indels(indels, 5), [0])
+    _compare_select_indels_near_indels(indels, 5)
+
+
+def test_select_indels_near_indels__adjacent():
+    # Indels at the border of the interval of a better indel are filtered,
+    # but not indels just outside; intervals cover the bases from
+    # pos + 1 - distance to pos + 1 + distance + len(ref) - 1, and are
+    # compared with the first base after the prefix (pos + 1) of indels
+    for (pos, expected) in ((13, []), (12, [1]), (8, [1]), (7, [])):
+        indels = [_indel("chr1", 10, 30), _indel("chr1", pos, 20)]
+        assert_equal(_select_indels(indels, 2), expected)
+        _compare_select_indels_near_indels(indels, 2)
+
+
+def test_select_indels_near_indels__long_deletion():
+    indels = [_indel("chr1", 10, 30, ref = "ACGTACGT", alt = "A"), _indel("chr1", 19, 20)]
+    assert_equal(_select_indels(indels, 2), [1])
+    _compare_select_indels_near_indels(indels, 2)
+
+
+def test_select_indels_near_indels__chains():
+    # The middle indel is filtered by both neighbours, which are kept, as
+    # they are not within the distance of each other
+    indels = [_indel("chr1", 10, 30), _indel("chr1", 13, 10), _indel("chr1", 17, 30)]
+    assert_equal(_select_indels(indels, 4), [1])
+    _compare_select_indels_near_indels(indels, 4)
+
+
+def test_select_indels_near_indels__start_of_contig():
+    indels = [_indel("chr1", 0, 20), _indel("chr1", 3, 30), _indel("chr1", 1, 10)]
+    assert_equal(sorted(_select_indels(indels, 5)), [0, 2])
+    _compare_select_indels_near_indels(indels, 5)
+
+
+def _build_indel_records(rng, nrecords):
+    records = []
+    for contig in ("chr1", "chr2"):
+        position = 0
+        for _ in xrange(nrecords // 2):
+            # Positions are unique, as the choice between equally good indels
+            # at the same position was arbitrary in previous versions
+            position += rng.randint(1, 10)
+            ref = "A" * rng.randint(1, 5)
+            alt = "A" if (len(ref) > 1) else "AC"
+            # Qualities are chosen from a small set, resulting in many ties
+            records.append(_indel(contig, position, rng.randint(1, 5) * 10, ref, alt))
+    return records
+
+
+def test_select_indels_near_indels__same_as_previous():
+    for distance in (1, 3, 10, 50):
+        for seed in xrange(3):
+            indels = _build_indel_records(random.Random(seed), 500)
+            yield _compare_select_indels_near_indels, indels, distance
+
+
+def _filter_by_indels_previous(options, chunk):
+    """Filtering of SNPs and indels near indels by previous versions."""
+    indels = [vcf for vcf in chunk if vcfwrap.is_indel(vcf)]
+
+    distance_between = options.min_distance_between_indels
+    indel_blacklist  = _group_indels_near_position_previous(indels, distance_between)
+    distance_to      = options.min_distance_to_indels
+    snp_blacklist    = _group_indels_near_position_previous(indels, distance_to)
+
+    for vcf in chunk:
+        if vcfwrap.is_indel(vcf):
+            blacklisted = indel_blacklist.get(vcf.pos + 1, [vcf])
+            if vcf is not vcffilter._select_best_indel(blacklisted):
+                vcffilter._mark_as_filtered(vcf, "W=%i" % distance_between)
+        elif (vcf.alt != ".") and (vcf.pos in snp_blacklist):
+            vcffilter._mark_as_filtered(vcf, "w=%i" % distance_to)
+
+
+def _build_indels_and_snps(seed):
+    rng = random.Random(seed)
+    records = []
+    for (index, vcf) in enumerate(_build_indel_records(rng, 500)):
+        if rng.random() < 0.7:
+            # Replaced by a SNP or reference site at the same position
+            vcf = _VCF(vcf.contig, vcf.pos, "A", rng.choice(".CGT"))
+        records.append(vcf)
+    return records
+
+
+def test_filter_by_indels__same_as_previous():
+    for (distance_to, distance_between) in ((0, 0), (3, 10), (10, 3), (5, 5)):
+        for seed in xrange(3):
+            yield _compare_filter_by_indels, seed, distance_to, distance_between
+
+
+def _compare_filter_by_indels(seed, distance_to, distance_between):
+    options = _get_options(min_distance_to_indels = distance_to,
+                           min_distance_between_indels = distance_between)
+    current, previous = _build_indels_and_snps(seed), _build_indels_and_snps(seed)
+    vcffilter._filter_by_indels(options, current)
+    _filter_by_indels_previous(options, previous)
+
+    assert_equal([vcf.filter for vcf in previous], [vcf.filter for vcf in current])
+
+
+def test_filter_vcfs__contigs_filtered_independently():
+    # Indels / SNPs on different contigs do not affect each other
+    options = _get_options(min_distance_to_indels = 5, min_distance_between_indels = 10)
+    vcfs = [_indel("chr1", 100, 40), _indel("chr2", 101, 50),
+            _VCF("chr3", 99, "A", "G"), _indel("chr3", 200, 30)]
+    with vcffilter.Mappability(None) as mappability:
+        with Monkeypatch("pypeline.common.vcffilter.Mappability", lambda _filename: mappability):
+            result = [vcf.filter for vcf in vcffilter.filter_vcfs(options, iter(vcfs))]
+    assert_equal(result, ["PASS", "PASS", "PASS", "PASS"])
+
+
+
+################################################################################
+################################################################################
+## filter_vcf_file
+
+_VCF_HEADER = "##fileformat=VCFv4.1\n" \
+              "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSample\n"
+
+
+def _build_vcf_lines(rng):
+    """Simulated records for contigs of varying size, which are not sorted by
+    name, so that contigs are not necessarily filtered in the output order."""
+    lines = []
+    for (contig, nrecords) in (("chr2", 300), ("chr10", 20), ("chr1", 500), ("chrX", 1)):
+        position = 0
+        for _ in xrange(nrecords):
+            position += rng.randint(1, 20)
+            ref, alt, info = "A", rng.choice(".CGT"), "DP=%i;DP4=5,5,%i,%i"
+            if rng.random() < 0.2:
+                ref, alt, info = rng.choice((("A", "AC"), ("ACG", "A"))) + ("INDEL;" + info,)
+            info %= (rng.randint(0, 30), rng.randint(0, 5), rng.randint(0, 5))
+            pl = rng.choice(("99,0,99", "0,20,99", "99,99,0", "0,0,99"))
+            lines.append("%s\t%i\t.\t%s\t%s\t%i\t.\t%s\tGT:PL\t0/1:%s\n"
+                         % (contig, position, ref, alt, rng.randint(1, 99), info, pl))
+    return lines
+
+
+@with_temp_folder
+def test_filter_vcf_file__same_as_filter_vcfs(temp_folder):
+    options = _get_options(min_distance_between_indels = 50)
+    lines = _build_vcf_lines(random.Random(1234))
+    filename = os.path.join(temp_folder, "input.vcf")
+    set_file_contents(filename, _VCF_HEADER + "".join(lines))
+    filename = pysam.tabix_index(filename, preset = "vcf")
+
+    parser = pysam.asVCF()
+    vcfs = [parser(line.rstrip("\n"), len(line.rstrip("\n"))) for line in lines]
+    expected = StringIO.StringIO()
+    expected.write(_VCF_HEADER)
+
+    temp_dirs = []
+    def _mkdtemp(*args, **kwargs):
+        temp_dirs.append(mkdtemp(*args, **kwargs))
+        return temp_dirs[-1]
+
+    mkdtemp = tempfile.mkdtemp
+    with Monkeypatch("sys.stderr", StringIO.StringIO()):
+        for vcf in vcffilter.filter_vcfs(options, iter(vcfs)):
+            expected.write("%s\n" % (vcf,))
+
+        with Monkeypatch("tempfile.mkdtemp", _mkdtemp):
+            for processes in (1, 2, 4):
+                output = StringIO.StringIO()
+                vcffilter.filter_vcf_file(options, filename, processes, output,
+                                          temp_root = temp_folder)
+                assert_equal(expected.getvalue(), output.getvalue())
+
+    # Temporary files are placed in, and removed from, the temp root
+    assert_equal([os.path.dirname(path) for path in temp_dirs], [temp_folder] * 3)
+    assert not any(os.path.exists(path) for path in temp_dirs)
+
+
+################################################################################
+################################################################################
+## AlleleFrequencies
+
+def _count(bases, ref = "A"):
+    return vcffilter._count_pileup_bases(["chr1", "10", ref, "10", bases, "I" * 10])
+
+
+def test_count_pileup_bases__bases():
+    assert_equal(_count("ACGTNacgtn"), {"A" : 2, "C" : 2, "G" : 2, "T" : 2, "N" : 2})
+
+
+def test_count_pileup_bases__reference():
+    assert_equal(_count(".,.,", ref = "G"), {"G" : 4})
+    assert_equal(_count(".,Gg", ref = "G"), {"G" : 4})
+
+
+def test_count_pileup_bases__deletions():
+    assert_equal(_count("**."), {-1 : 2, "A" : 1})
+
+
+def test_count_pileup_bases__start_and_end_marks():
+    assert_equal(_count("^F.^!,C$T$"), {"A" : 2, "C" : 1, "T" : 1})
+
+
+def test_count_pileup_bases__start_marks_with_special_qualities():
+    # The character following '^' is a mapping quality, and not a base
+    assert_equal(_count("^A.^$,^+C^^G^*T"), {"A" : 2, "C" : 1, "G" : 1, "T" : 1})
+
+
+def test_count_pileup_bases__insertions():
+    assert_equal(_count(".+3ACG,+3acgT"), {3 : 2, "A" : 2, "T" : 1})
+
+
+def test_count_pileup_bases__deletion_runs():
+    assert_equal(_count(".-2AC,-2ac*"), {-2 : 2, -1 : 1, "A" : 2})
+
+
+def test_count_pileup_bases__long_indels():
+    assert_equal(_count(".+12ACGTACGTACGTC"), {12 : 1, "A" : 1, "C" : 1})
+
+
+def test_count_pileup_bases__indel_after_start_mark():
+    assert_equal(_count("^+.-1T$G"), {-1 : 1, "A" : 1, "G" : 1})
+
+
+def test_count_pileup_bases__unexpected_characters():
+    assert_raises(RuntimeError, _count, ".,X")
+
+
+class _Pileup(object):
+    """Stand-in for a tabix indexed pileup; records calls to 'fetch'."""
+    def __init__(self, lines):
+        self._lines = [line.split("\t") for line in lines]
+        self.fetches = []
+
+    def fetch(self, contig, start):
+        # Returns records at or after the (0-based) position
+        self.fetches.append((contig, start))
+        return iter("\t".join(fields) for fields in self._lines
+                    if (fields[0] == contig) and (int(fields[1]) > start))
+
+    def close(self):
+        pass
+
+
+def _pileup_line(contig, position, bases, ref = "A"):
+    return "\t".join((contig, str(position), ref, str(len(bases)), bases, "I" * len(bases)))
+
+
+_PILEUP_LINES = [_pileup_line("chr1", 10, "..CC"),
+                 _pileup_line("chr1", 12, ",,,GG"),
+                 _pileup_line("chr1", 15, ".+2TT.+2TTC"),
+                 _pileup_line("chr1", 17, ".+1T.+2TT.+2TT"),
+                 _pileup_line("chr2", 3, "GGTT")]
+
+
+def _build_frequencies(lines = _PILEUP_LINES, min_freq = 0.2):
+    frequencies = vcffilter.AlleleFrequencies(None, min_freq)
+    frequencies._handle = handle = _Pileup(lines)
+    return frequencies, handle
+
+
+def test_allele_frequencies__fetch():
+    frequencies, _ = _build_frequencies()
+    # Positions are 0-based, while positions in the pileup are 1-based
+    assert_equal(frequencies._fetch("chr1", 9), {"A" : 2, "C" : 2})
+    assert_equal(frequencies._fetch("chr1", 11), {"A" : 3, "G" : 2})
+    assert_equal(frequencies._fetch("chr1", 14), {"A" : 2, 2 : 2, "C" : 1})
+    assert_equal(frequencies._fetch("chr2", 2), {"G" : 2, "T" : 2})
+
+
+def test_allele_frequencies__sequential_reads():
+    frequencies, handle = _build_frequencies()
+    for position in (9, 11, 14):
+        frequencies._fetch("chr1", position)
+    assert_equal(handle.fetches, [("chr1", 9)])
+
+
+def test_allele_frequencies__cached_positions_are_not_reread():
+    frequencies, handle = _build_frequencies()
+    frequencies._fetch("chr1", 11)
+    frequencies._fetch("chr1", 14)
+    frequencies._fetch("chr1", 11)
+    assert_equal(handle.fetches, [("chr1", 11)])
+
+
+def test_allele_frequencies__seek_backwards():
+    frequencies, handle = _build_frequencies()
+    frequencies._fetch("chr1", 14)
+    assert_equal(frequencies._fetch("chr1", 9), {"A" : 2, "C" : 2})
+    assert_equal(handle.fetches, [("chr1", 14), ("chr1", 9)])
+
+
+def test_allele_frequencies__change_of_contig():
+    frequencies, handle = _build_frequencies()
+    frequencies._fetch("chr1", 9)
+    frequencies._fetch("chr2", 2)
+    assert_equal(frequencies._fetch("chr1", 11), {"A" : 3, "G" : 2})
+    assert_equal(handle.fetches, [("chr1", 9), ("chr2", 2), ("chr1", 11)])
+
+
+def test_allele_frequencies__missing_position():
+    frequencies, _ = _build_frequencies()
+    frequencies._fetch("chr1", 9)
+    assert_raises(RuntimeError, frequencies._fetch, "chr1", 10)
+    # The cursor is still usable after a missing position
+    assert_equal(frequencies._fetch("chr1", 11), {"A" : 3, "G" : 2})
+
+
+def test_allele_frequencies__position_after_last_record():
+    frequencies, _ = _build_frequencies()
+    assert_raises(RuntimeError, frequencies._fetch, "chr1", 20)
+    assert_raises(RuntimeError, frequencies._fetch, "chr1", 21)
+
+
+def test_allele_frequencies__missing_contig():
+    frequencies, _ = _build_frequencies()
+    assert_raises(RuntimeError, frequencies._fetch, "chr3", 9)
+
+
+def test_allele_frequencies__wrong_contig_in_index():
+    frequencies, handle = _build_frequencies()
+    handle.fetch = lambda _contig, _start: iter([_PILEUP_LINES[-1]])
+    assert_raises(RuntimeError, frequencies._fetch, "chr1", 9)
+
+
+def test_allele_frequencies__frequency_is_valid():
+    frequencies, _ = _build_frequencies()
+    valid = frequencies._frequency_is_valid
+    assert_equal(valid("chr1", 9, "A", "A", "C"), frequencies.VALID)
+    assert_equal(valid("chr1", 9, "A", "C", "G"), frequencies.INVALID)
+    assert_equal(valid("chr1", 9, "A", "G", "T"), frequencies.NA)
+    # Indels are counted by their length, relative to the reference; the
+    # pileup at chr1:15 contains two 2bp insertions and no 1bp insertions
+    assert_equal(valid("chr1", 14, "A", "ATT", "AT"), frequencies.INVALID)
+    assert_equal(valid("chr1", 14, "A", "AT", "ATTT"), frequencies.NA)
+    assert_equal(valid("chr1", 16, "A", "AT", "ATT"), frequencies.VALID)
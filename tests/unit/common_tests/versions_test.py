@@ -0,0 +1,167 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal, assert_raises
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     Monkeypatch, \
+     set_file_contents
+import pypeline.common.versions as versions
+
+
+class _CacheMonkeypatch:
+    """Replaces the call / disk caches used by the 'versions' module, using
+    a cache-file located in the specified folder."""
+    def __init__(self, root):
+        self.filename = os.path.join(root, "versions.cache")
+        self._patches = (Monkeypatch("pypeline.common.versions.CACHE_FILENAME", self.filename),
+                         Monkeypatch("pypeline.common.versions._DISK_CACHE", None),
+                         Monkeypatch("pypeline.common.versions._CALL_CACHE", {}))
+
+    def __enter__(self):
+        for patch in self._patches:
+            patch.__enter__()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        for patch in self._patches:
+            patch.__exit__(type_, value, traceback)
+
+
+################################################################################
+################################################################################
+## On-disk cache of calls
+
+@with_temp_folder
+def test_disk_cache__call_is_cached(temp_folder):
+    with _CacheMonkeypatch(temp_folder) as patch:
+        assert_equal(versions._do_call(("echo", "v1.2")), "v1.2\n")
+        assert os.path.exists(patch.filename)
+
+    def _run_not_called(call):
+        assert False, "call %r was run" % (call,)
+
+    with _CacheMonkeypatch(temp_folder):
+        with Monkeypatch("pypeline.common.versions._run", _run_not_called):
+            assert_equal(versions._do_call(("echo", "v1.2")), "v1.2\n")
+
+
+@with_temp_folder
+def test_disk_cache__key_includes_mtimes_of_files(temp_folder):
+    filename = os.path.join(temp_folder, "file.jar")
+    set_file_contents(filename, "")
+    key_1 = versions._get_cache_key(("echo", filename))
+    os.utime(filename, (1, 1))
+    key_2 = versions._get_cache_key(("echo", filename))
+    assert key_1 != key_2
+
+
+def test_disk_cache__missing_executable_not_cached():
+    assert_equal(versions._get_cache_key(("lsxxxx", "--version")), None)
+
+
+def test_disk_cache__disabled():
+    with Monkeypatch("pypeline.common.versions.CACHE_FILENAME", None):
+        assert_equal(versions._get_cache_key(("ls", "--version")), None)
+
+
+@with_temp_folder
+def test_disk_cache__failed_call_not_cached(temp_folder):
+    def _run_failed(_call):
+        return "[Errno 2] No such file or directory", False
+
+    with _CacheMonkeypatch(temp_folder) as patch:
+        with Monkeypatch("pypeline.common.versions._run", _run_failed):
+            versions._do_call(("echo", "v1.2"))
+        assert not os.path.exists(patch.filename)
+
+
+@with_temp_folder
+def test_disk_cache__invalid_output_not_cached(temp_folder):
+    def _is_valid(output):
+        return output.startswith("v2")
+
+    with _CacheMonkeypatch(temp_folder) as patch:
+        assert_equal(versions._do_call(("echo", "v1.2"), _is_valid), "v1.2\n")
+        assert not os.path.exists(patch.filename)
+        assert_equal(versions._do_call(("echo", "v2.1"), _is_valid), "v2.1\n")
+        assert os.path.exists(patch.filename)
+
+
+def test_disk_cache__key_includes_environment():
+    key_1 = versions._get_cache_key(("echo", "v1.2"))
+    with Monkeypatch("os.environ", dict(os.environ, JAVA_HOME = "/xyz/java")):
+        key_2 = versions._get_cache_key(("echo", "v1.2"))
+    assert key_1 != key_2
+
+
+@with_temp_folder
+def test_disk_cache__corrupt_cache(temp_folder):
+    with _CacheMonkeypatch(temp_folder) as patch:
+        set_file_contents(patch.filename, "not a pickle")
+        assert_equal(versions._do_call(("echo", "v1.2")), "v1.2\n")
+
+
+################################################################################
+################################################################################
+## prefetch
+
+def _get_version(value):
+    return value
+
+@with_temp_folder
+def test_prefetch(temp_folder):
+    requirements = [versions.RequirementObj(call   = (_get_version, "v1.%i" % (index,)),
+                                            search = r"v(\d+)\.(\d+)",
+                                            pprint = None,
+                                            checks = versions.GE(1, 0))
+                    for index in range(5)]
+
+    with _CacheMonkeypatch(temp_folder):
+        versions.prefetch(requirements + [id, str])
+        for (index, requirement) in enumerate(requirements):
+            assert_equal(requirement._version, (1, index))
+
+
+@with_temp_folder
+def test_prefetch__errors_raised_on_check(temp_folder):
+    requirements = [versions.RequirementObj(call   = (_get_version, "unknown"),
+                                            search = r"v(\d+)\.(\d+)",
+                                            pprint = None,
+                                            checks = versions.GE(1, 0)),
+                    versions.RequirementObj(call   = (_get_version, "v0.1"),
+                                            search = r"v(\d+)\.(\d+)",
+                                            pprint = None,
+                                            checks = versions.GE(1, 0))]
+
+    with _CacheMonkeypatch(temp_folder):
+        versions.prefetch(requirements)
+        for requirement in requirements:
+            assert_raises(versions.VersionRequirementError, requirement)
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     Monkeypatch, \
+     set_file_contents, \
+     get_file_contents
+from pypeline.node import Node
+from pypeline.journal import NodeJournal, checksum_files
+
+
+def _setup_node(temp_folder, n_inputs = 1):
+    input_files = [os.path.join(temp_folder, "in_%i" % (index,)) for index in range(n_inputs)]
+    output_file = os.path.join(temp_folder, "out")
+    for filename in input_files:
+        set_file_contents(filename, "input")
+        os.utime(filename, (1000, 1000))
+    set_file_contents(output_file, "output")
+    os.utime(output_file, (2000, 2000))
+
+    return Node(input_files = input_files, output_files = output_file)
+
+
+################################################################################
+################################################################################
+## NodeJournal
+
+@with_temp_folder
+def test_journal__not_recorded(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__recorded(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    assert journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__reloaded(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    journal.close()
+
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    assert journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__output_modified(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    os.utime(os.path.join(temp_folder, "out"), (3000, 3000))
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__input_modified(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    os.utime(os.path.join(temp_folder, "in_0"), (1500, 1500))
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__output_removed(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    os.remove(os.path.join(temp_folder, "out"))
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__outdated_node_not_recorded(temp_folder):
+    node = _setup_node(temp_folder)
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__no_output_files(temp_folder):
+    node = Node()
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    assert not journal.is_up_to_date(node)
+    assert_equal(get_file_contents(os.path.join(temp_folder, "journal")), "")
+
+
+@with_temp_folder
+def test_journal__truncated_lines_are_ignored(temp_folder):
+    node = _setup_node(temp_folder)
+    filename = os.path.join(temp_folder, "journal")
+    journal = NodeJournal(filename)
+    journal.add(node)
+    journal.close()
+    with open(filename, "a") as handle:
+        handle.write('{"outputs":[["/foo", 1')
+
+    journal = NodeJournal(filename)
+    assert journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal__compacted(temp_folder):
+    node = _setup_node(temp_folder)
+    filename = os.path.join(temp_folder, "journal")
+    journal = NodeJournal(filename)
+    for _ in range(1010):
+        journal.add(node)
+    journal.close()
+    assert_equal(len(get_file_contents(filename).split("\n")), 1011)
+
+    journal = NodeJournal(filename)
+    assert journal.is_up_to_date(node)
+    assert_equal(len(get_file_contents(filename).split("\n")), 2)
+
+
+################################################################################
+################################################################################
+## NodeJournal -- checksums
+
+@with_temp_folder
+def test_journal_checksums__input_touched(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    journal.add(node)
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    assert journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal_checksums__input_modified(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    journal.add(node)
+    set_file_contents(os.path.join(temp_folder, "in_0"), "modified")
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal_checksums__disabled(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal_checksums__entry_without_checksums(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"))
+    journal.add(node)
+    journal.close()
+
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    assert not journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal_checksums__entry_updated(temp_folder):
+    node = _setup_node(temp_folder)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    journal.add(node)
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    assert journal.is_up_to_date(node)
+    journal.close()
+
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    with Monkeypatch("pypeline.common.fileutils.file_checksum", _file_checksum_not_called):
+        assert journal.is_up_to_date(node)
+
+
+@with_temp_folder
+def test_journal_checksums__precalculated(temp_folder):
+    node = _setup_node(temp_folder)
+    checksums = checksum_files(node.input_files)
+    journal = NodeJournal(os.path.join(temp_folder, "journal"), checksums = True)
+    with Monkeypatch("pypeline.common.fileutils.file_checksum", _file_checksum_not_called):
+        journal.add(node, checksums)
+    os.utime(os.path.join(temp_folder, "in_0"), (3000, 3000))
+    assert journal.is_up_to_date(node)
+
+
+def _file_checksum_not_called(filename):
+    assert False, "file_checksum called for %r" % (filename,)
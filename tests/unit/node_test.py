@@ -284,6 +284,42 @@ def test_constuctor__threads_meta():
 
 
 
+################################################################################
+################################################################################
+## *Node: Constructor tests: memory / io_weight
+
+def test_constructor__resources():
+    def _do_test_constructor__resources(cls, name, value):
+        node = cls(**{name : value})
+        assert_equal(getattr(node, name), value)
+    for cls in (Node, _CommandNodeWrap):
+        for name in ("memory", "io_weight"):
+            yield _do_test_constructor__resources, cls, name, 0
+            yield _do_test_constructor__resources, cls, name, 4096L
+
+def test_constructor__resources_invalid_range():
+    def _do_test_constructor__resources_invalid_range(cls, name, value):
+        assert_raises(ValueError, cls, **{name : value})
+    for cls in (Node, _CommandNodeWrap):
+        for name in ("memory", "io_weight"):
+            yield _do_test_constructor__resources_invalid_range, cls, name, -1
+
+def test_constructor__resources_invalid_type():
+    def _do_test_constructor__resources_invalid_type(cls, name, value):
+        assert_raises(TypeError, cls, **{name : value})
+    for cls in (Node, _CommandNodeWrap):
+        for name in ("memory", "io_weight"):
+            yield _do_test_constructor__resources_invalid_type, cls, name, "1"
+            yield _do_test_constructor__resources_invalid_type, cls, name, 2.7
+
+def test_constuctor__resources_meta():
+    node = MetaNode()
+    assert_equal(node.memory, 0)
+    assert_equal(node.io_weight, 0)
+
+
+
+
 ################################################################################
 ################################################################################
 ## Node: States
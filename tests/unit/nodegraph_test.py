@@ -0,0 +1,303 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal, assert_raises
+
+from pypeline.common.testing import with_temp_folder, set_file_contents
+from pypeline.node import Node, MetaNode
+from pypeline.nodegraph import NodeGraph, NodeGraphError
+
+
+_COUNTER = [0]
+def _node(threads = 1, dependencies = (), **kwargs):
+    """Returns a node with a (missing) output file, which is therefore
+    RUNABLE if all its dependencies are DONE."""
+    _COUNTER[0] += 1
+    return Node(output_files = "tests/data/missing_nodegraph_file_%i" % (_COUNTER[0],),
+                threads      = threads,
+                dependencies = dependencies,
+                **kwargs)
+
+
+################################################################################
+################################################################################
+## NodeGraph: pop_runable_node
+
+def test_pop_runable_node__empty():
+    graph = NodeGraph([Node()])
+    assert_equal(graph.pop_runable_node(4), None)
+
+
+def test_pop_runable_node__fifo():
+    nodes = [_node() for _ in range(5)]
+    graph = NodeGraph(nodes)
+    popped = [graph.pop_runable_node(1) for _ in range(5)]
+    assert_equal(sorted(popped), sorted(nodes))
+    assert_equal(graph.pop_runable_node(1), None)
+
+
+def test_pop_runable_node__threads():
+    node_a, node_b = _node(threads = 4), _node(threads = 1)
+    graph = NodeGraph([node_a, node_b])
+    assert_equal(graph.pop_runable_node(2), node_b)
+    assert_equal(graph.pop_runable_node(2), None)
+    assert_equal(graph.pop_runable_node(4), node_a)
+
+
+def test_pop_runable_node__critical_path_first():
+    node_a = _node()
+    node_b = _node(dependencies = _node(dependencies = _node()))
+    graph = NodeGraph([node_a, node_b])
+    popped = graph.pop_runable_node(1)
+    assert_equal(popped, iter(iter(node_b.dependencies).next().dependencies).next())
+    assert_equal(graph.pop_runable_node(1), node_a)
+
+
+def test_pop_runable_node__runtimes():
+    node_a, node_b = _node(), _node()
+    runtimes = {node_a : 1, node_b : 10}
+    graph = NodeGraph([node_a, node_b], runtimes = runtimes.get)
+    assert_equal(graph.pop_runable_node(1), node_b)
+    assert_equal(graph.pop_runable_node(1), node_a)
+
+    runtimes = {node_a : 10, node_b : 1}
+    graph = NodeGraph([node_a, node_b], runtimes = runtimes.get)
+    assert_equal(graph.pop_runable_node(1), node_a)
+    assert_equal(graph.pop_runable_node(1), node_b)
+
+
+def test_pop_runable_node__priority_across_threads():
+    node_a = _node(threads = 1)
+    node_b = _node(threads = 4)
+    runtimes = {node_a : 1, node_b : 10}
+    graph = NodeGraph([node_a, node_b], runtimes = runtimes.get)
+    assert_equal(graph.pop_runable_node(4), node_b)
+    assert_equal(graph.pop_runable_node(4), node_a)
+
+
+def test_pop_runable_node__memory():
+    node_a, node_b = _node(memory = 4096), _node(memory = 1024)
+    graph = NodeGraph([node_a, node_b])
+    assert_equal(graph.pop_runable_node(1, max_memory = 2048), node_b)
+    assert_equal(graph.pop_runable_node(1, max_memory = 2048), None)
+    assert_equal(graph.pop_runable_node(1, max_memory = 4096), node_a)
+
+
+def test_pop_runable_node__io_weight():
+    node_a, node_b = _node(io_weight = 2), _node(io_weight = 0)
+    graph = NodeGraph([node_a, node_b])
+    assert_equal(graph.pop_runable_node(1, max_io_weight = 1), node_b)
+    assert_equal(graph.pop_runable_node(1, max_io_weight = 1), None)
+    assert_equal(graph.pop_runable_node(1), node_a)
+
+
+def test_pop_runable_node__not_runable_until_dependencies_done():
+    node_a = _node()
+    node_b = _node(dependencies = node_a)
+    graph = NodeGraph([node_b])
+    assert_equal(graph.get_node_state(node_b), NodeGraph.QUEUED)
+    assert_equal(graph.pop_runable_node(1), node_a)
+    assert_equal(graph.pop_runable_node(1), None)
+
+    graph.set_node_state(node_a, NodeGraph.RUNNING)
+    assert_equal(graph.pop_runable_node(1), None)
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(node_b), NodeGraph.RUNABLE)
+    assert_equal(graph.pop_runable_node(1), node_b)
+
+
+def test_pop_runable_node__skips_nodes_no_longer_runable():
+    node_a, node_b = _node(), _node()
+    graph = NodeGraph([node_a, node_b])
+    graph.set_node_state(node_a, NodeGraph.ERROR)
+    assert_equal(graph.pop_runable_node(1), node_b)
+    assert_equal(graph.pop_runable_node(1), None)
+
+
+def test_pop_runable_node__after_refresh():
+    node_a = _node()
+    graph = NodeGraph([MetaNode(dependencies = node_a)])
+    graph.refresh_states()
+    assert_equal(graph.pop_runable_node(1), node_a)
+    assert_equal(graph.pop_runable_node(1), None)
+
+
+################################################################################
+################################################################################
+## NodeGraph: set_node_state
+
+def test_set_node_state__invalid_state():
+    node = _node()
+    graph = NodeGraph([node])
+    assert_raises(ValueError, graph.set_node_state, node, NodeGraph.QUEUED)
+
+
+def test_set_node_state__diamond():
+    node_a = _node()
+    node_b, node_c = _node(dependencies = node_a), _node(dependencies = node_a)
+    node_d = _node(dependencies = (node_b, node_c))
+    graph = NodeGraph([node_d])
+
+    graph.set_node_state(node_a, NodeGraph.RUNNING)
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(node_b), NodeGraph.RUNABLE)
+    assert_equal(graph.get_node_state(node_c), NodeGraph.RUNABLE)
+    assert_equal(graph.get_node_state(node_d), NodeGraph.QUEUED)
+
+    graph.set_node_state(node_b, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(node_d), NodeGraph.QUEUED)
+    graph.set_node_state(node_c, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(node_d), NodeGraph.RUNABLE)
+
+
+def test_set_node_state__error_propagates():
+    node_a = _node()
+    node_b = _node(dependencies = node_a)
+    node_c = MetaNode(dependencies = node_b)
+    graph = NodeGraph([node_c])
+    graph.set_node_state(node_a, NodeGraph.ERROR)
+    assert_equal(graph.get_node_state(node_b), NodeGraph.ERROR)
+    assert_equal(graph.get_node_state(node_c), NodeGraph.ERROR)
+
+
+def test_set_node_state__metanode():
+    node_a, node_b = _node(), _node()
+    meta = MetaNode(dependencies = (node_a, node_b))
+    graph = NodeGraph([meta])
+    assert_equal(graph.get_node_state(meta), NodeGraph.QUEUED)
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(meta), NodeGraph.QUEUED)
+    graph.set_node_state(node_b, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(meta), NodeGraph.DONE)
+
+
+def test_set_node_state__deep_chain():
+    node = None
+    for _ in range(5000):
+        node = _node(dependencies = filter(None, [node]))
+    graph = NodeGraph([node])
+    assert_equal(graph.get_node_state(node), NodeGraph.QUEUED)
+
+
+@with_temp_folder
+def test_set_node_state__invalidates_output_files(temp_folder):
+    file_a = os.path.join(temp_folder, "file_a")
+    file_b = os.path.join(temp_folder, "file_b")
+    set_file_contents(file_b, "b")
+    node_a = Node(output_files = file_a)
+    node_b = Node(output_files = file_b, subnodes = node_a)
+    graph = NodeGraph([node_b])
+    assert_equal(graph.get_node_state(node_b), NodeGraph.QUEUED)
+
+    set_file_contents(file_a, "a")
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    assert_equal(graph.get_node_state(node_b), NodeGraph.DONE)
+
+
+################################################################################
+################################################################################
+## NodeGraph: get_state_counts / iterrunning
+
+def _count_states(graph):
+    counts = [0] * (NodeGraph.ERROR + 1)
+    for node in graph.iterflat():
+        if not isinstance(node, MetaNode):
+            counts[graph.get_node_state(node)] += 1
+    return counts
+
+
+def test_get_state_counts__initial():
+    node_a = _node()
+    node_b = _node(dependencies = node_a)
+    graph = NodeGraph([MetaNode(dependencies = node_b)])
+    expected = [0] * (NodeGraph.ERROR + 1)
+    expected[NodeGraph.RUNABLE] = expected[NodeGraph.QUEUED] = 1
+    assert_equal(graph.get_state_counts(), expected)
+    assert_equal(list(graph.iterrunning()), [])
+
+
+def test_get_state_counts__updated_with_states():
+    node_a, node_b = _node(), _node()
+    node_c = _node(dependencies = (node_a, node_b))
+    graph = NodeGraph([MetaNode(dependencies = node_c)])
+
+    graph.set_node_state(node_a, NodeGraph.RUNNING)
+    graph.set_node_state(node_b, NodeGraph.RUNNING)
+    assert_equal(graph.get_state_counts(), _count_states(graph))
+    assert_equal(set(graph.iterrunning()), set([node_a, node_b]))
+
+    graph.set_node_state(node_a, NodeGraph.DONE)
+    graph.set_node_state(node_b, NodeGraph.ERROR)
+    assert_equal(graph.get_state_counts(), _count_states(graph))
+    assert_equal(list(graph.iterrunning()), [])
+    assert_equal(graph.get_node_state(node_c), NodeGraph.ERROR)
+
+
+def test_get_state_counts__after_refresh():
+    node_a, node_b = _node(), _node()
+    graph = NodeGraph([node_a, node_b])
+    graph.set_node_state(node_a, NodeGraph.RUNNING)
+    graph.set_node_state(node_b, NodeGraph.ERROR)
+    graph.refresh_states()
+    assert_equal(graph.get_state_counts(), _count_states(graph))
+    assert_equal(list(graph.iterrunning()), [node_a])
+
+
+################################################################################
+################################################################################
+## NodeGraph: Graph construction
+
+def test_topological_order():
+    node_a = _node()
+    node_b = _node(dependencies = node_a)
+    node_c = MetaNode(subnodes = node_b, dependencies = node_a)
+    graph = NodeGraph([node_c])
+    assert_equal(graph._topological_order, [node_a, node_b, node_c])
+
+
+def test_iterflat():
+    node_a = _node()
+    node_b = _node(dependencies = node_a)
+    graph = NodeGraph([node_b])
+    assert_equal(set(graph.iterflat()), set([node_a, node_b]))
+    assert_equal(list(graph), [node_b])
+
+
+def test_check_input_dependencies__indirect_dependency():
+    producer = Node(output_files = "tests/data/missing_nodegraph_file_producer")
+    node_b = MetaNode(dependencies = producer)
+    consumer = Node(input_files  = "tests/data/missing_nodegraph_file_producer",
+                    dependencies = node_b)
+    NodeGraph([consumer])
+
+
+def test_check_input_dependencies__missing_dependency():
+    producer = Node(output_files = "tests/data/missing_nodegraph_file_producer")
+    consumer = Node(input_files  = "tests/data/missing_nodegraph_file_producer")
+    assert_raises(NodeGraphError, NodeGraph, [producer, consumer])
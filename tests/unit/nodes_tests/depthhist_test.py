@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal, assert_raises
+
+from pypeline.common.testing import \
+     Monkeypatch, \
+     with_temp_folder
+
+from pypeline.node import NodeError
+from pypeline.nodes.depthhist import DepthHistogramNode
+
+
+class _Read:
+    def __init__(self, tid, pos, aend, is_unmapped = False):
+        self.tid = tid
+        self.pos = pos
+        self.aend = aend
+        self.is_unmapped = is_unmapped
+        self.is_duplicate = False
+
+    def opt(self, key):
+        raise KeyError(key)
+
+
+class _Samfile:
+    references = ("chr1", "chr2")
+    lengths = (100, 100)
+    header = {}
+
+    def __init__(self, reads):
+        self._reads = reads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        pass
+
+    def __iter__(self):
+        return iter(self._reads)
+
+
+class _Pysam:
+    def __init__(self, reads):
+        self._reads = reads
+
+    def Samfile(self, _filename):
+        return _Samfile(self._reads)
+
+
+def _create_tables(temp_folder, reads):
+    node = DepthHistogramNode(config      = None,
+                              target_name = "target",
+                              input_files = "input.bam",
+                              output_file = os.path.join(temp_folder, "output.txt"))
+    node._pipe, node._procs = "input.bam", []
+    with Monkeypatch("pypeline.nodes.depthhist.pysam", _Pysam(reads)):
+        return node._create_tables(None, temp_folder)
+
+
+@with_temp_folder
+def test_depth_histogram__sorted_reads(temp_folder):
+    reads = [_Read(0, 10, 20), _Read(0, 10, 15), _Read(0, 15, 25), _Read(1, 0, 10)]
+    table, _ = _create_tables(temp_folder, reads)
+    counts = table["<NA>"]["<NA>"][None]
+    assert_equal(counts[:4], [175, 15, 10, 0])
+
+
+@with_temp_folder
+def test_depth_histogram__unsorted_contigs(temp_folder):
+    reads = [_Read(1, 10, 20), _Read(0, 15, 25)]
+    assert_raises(NodeError, _create_tables, temp_folder, reads)
+
+
+@with_temp_folder
+def test_depth_histogram__unsorted_positions(temp_folder):
+    reads = [_Read(0, 15, 25), _Read(0, 10, 20)]
+    assert_raises(NodeError, _create_tables, temp_folder, reads)
+
+
+@with_temp_folder
+def test_depth_histogram__unmapped_reads_ignored(temp_folder):
+    reads = [_Read(0, 15, 25), _Read(0, 10, 20, is_unmapped = True), _Read(0, 20, 30)]
+    table, _ = _create_tables(temp_folder, reads)
+    assert_equal(table["<NA>"]["<NA>"][None][:3], [185, 10, 5])
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     set_file_contents, \
+     get_file_contents
+from pypeline.node import Node, NodeError, MetaNode
+from pypeline.nodegraph import NodeGraph
+from pypeline.pipeline import \
+     Pypeline, \
+     _CompletionQueue, \
+     _call_run, \
+     _get_idle_resources
+
+
+class _TouchNode(Node):
+    def __init__(self, output_file, fail = False, dependencies = (), **kwargs):
+        Node.__init__(self,
+                      output_files = output_file,
+                      dependencies = dependencies,
+                      **kwargs)
+        self._fail = fail
+
+    def _run(self, _config, _temp):
+        if self._fail:
+            raise NodeError("Failed on purpose")
+        set_file_contents(iter(self.output_files).next(), "")
+
+
+class _Config: # pylint: disable=W0232
+    temp_root = None
+
+
+class _Pool: # pylint: disable=W0232
+    @classmethod
+    def apply_async(cls, *_vargs, **_kwargs):
+        return None
+
+
+def _build_chain(temp_folder, length, fail_at = None):
+    node = None
+    for index in range(length):
+        filename = os.path.join(temp_folder, "file_%i" % (index,))
+        node = _TouchNode(filename,
+                          fail         = (index == fail_at),
+                          dependencies = filter(None, [node]))
+    return node
+
+
+################################################################################
+################################################################################
+## _CompletionQueue
+
+def test_completion_queue__get_returns_all_items():
+    queue = _CompletionQueue()
+    queue.put("node_a", None)
+    queue.put("node_b", "error")
+    assert_equal(queue.get(), [("node_a", None), ("node_b", "error")])
+    queue.close()
+
+
+def test_completion_queue__get_after_empty():
+    queue = _CompletionQueue()
+    queue.put("node_a", None)
+    assert_equal(queue.get(), [("node_a", None)])
+    queue.put("node_b", None)
+    assert_equal(queue.get(), [("node_b", None)])
+    queue.close()
+
+
+def test_call_run__returns_errors():
+    error, usage, checksums = _call_run(_TouchNode("/does/not/exist", fail = True), _Config)
+    assert isinstance(error, NodeError)
+    assert_equal(usage, None)
+    assert_equal(checksums, None)
+
+
+@with_temp_folder
+def test_call_run__returns_usage(temp_folder):
+    _Config.temp_root = temp_folder
+    error, usage, checksums = _call_run(_TouchNode(os.path.join(temp_folder, "file")), _Config)
+    assert_equal(error, None)
+    assert_equal(sorted(usage), ["cpu", "rss", "wall"])
+    assert usage["wall"] >= 0
+    assert_equal(checksums, None)
+
+
+@with_temp_folder
+def test_call_run__returns_checksums(temp_folder):
+    _Config.temp_root = temp_folder
+    input_file = os.path.join(temp_folder, "input")
+    set_file_contents(input_file, "foo")
+    node = _TouchNode(os.path.join(temp_folder, "file"), input_files = input_file)
+    error, _, checksums = _call_run(node, _Config, checksums = True)
+    assert_equal(error, None)
+    assert_equal(checksums, [[input_file, "acbd18db4cc2f85cedef654fccc4a4d8"]])
+
+
+################################################################################
+################################################################################
+## Resource limits
+
+def test_get_idle_resources():
+    running = {_TouchNode("/a", threads = 2, memory = 1024) : None,
+               _TouchNode("/b", threads = 1, io_weight = 1) : None}
+    assert_equal(_get_idle_resources(running, (4, 4096, 2)), (1, 3072, 1))
+
+
+def test_get_idle_resources__unlimited():
+    running = {_TouchNode("/a", threads = 2, memory = 1024) : None}
+    assert_equal(_get_idle_resources(running, (4, None, None)), (2, None, None))
+
+
+def test_start_new_tasks__memory_limit():
+    nodes = [_TouchNode("/does/not/exist/%i" % (index,), memory = 3072) for index in range(2)]
+    nodegraph, running, completed = NodeGraph(nodes), {}, _CompletionQueue()
+    pipeline = Pypeline(_Config)
+    assert pipeline._start_new_tasks(running, nodegraph, (4, 4096, None), _Pool, completed)
+    assert_equal(len(running), 1)
+    assert not pipeline._start_new_tasks(running, nodegraph, (4, 4096, None), _Pool, completed)
+    assert_equal(len(running), 1)
+    completed.close()
+
+
+def test_start_new_tasks__io_limit():
+    nodes = [_TouchNode("/does/not/exist/%i" % (index,), io_weight = 1) for index in range(3)]
+    nodegraph, running, completed = NodeGraph(nodes), {}, _CompletionQueue()
+    pipeline = Pypeline(_Config)
+    assert pipeline._start_new_tasks(running, nodegraph, (4, None, 2), _Pool, completed)
+    assert_equal(len(running), 2)
+    completed.close()
+
+
+@with_temp_folder
+def test_run__node_exceeds_memory_limit(temp_folder):
+    _Config.temp_root = temp_folder
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_TouchNode(os.path.join(temp_folder, "file"), memory = 4096))
+    assert not pipeline.run(max_running = 1, max_memory = 2048, verbose = False)
+    assert not os.path.exists(os.path.join(temp_folder, "file"))
+
+
+################################################################################
+################################################################################
+## Pypeline.run
+
+@with_temp_folder
+def test_run__chain(temp_folder):
+    _Config.temp_root = temp_folder
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_build_chain(temp_folder, 5))
+    assert pipeline.run(max_running = 2, verbose = False)
+    assert_equal(sorted(os.listdir(temp_folder)),
+                 ["file_%i" % (index,) for index in range(5)])
+
+
+@with_temp_folder
+def test_run__error_stops_dependencies(temp_folder):
+    _Config.temp_root = temp_folder
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(MetaNode(dependencies = _build_chain(temp_folder, 5, fail_at = 2)))
+    assert not pipeline.run(max_running = 2, verbose = False)
+    assert os.path.exists(os.path.join(temp_folder, "file_1"))
+    assert not os.path.exists(os.path.join(temp_folder, "file_2"))
+    assert not os.path.exists(os.path.join(temp_folder, "file_3"))
+
+
+@with_temp_folder
+def test_run__journal(temp_folder):
+    _Config.temp_root = temp_folder
+    journal = os.path.join(temp_folder, "journal")
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_build_chain(temp_folder, 3))
+    assert pipeline.run(max_running = 1, verbose = False, journal = journal)
+    assert_equal(len(get_file_contents(journal).split("\n")), 4)
+
+
+@with_temp_folder
+def test_run__journal_checksums(temp_folder):
+    _Config.temp_root = temp_folder
+    journal = os.path.join(temp_folder, "journal")
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_build_chain(temp_folder, 3))
+    assert pipeline.run(max_running = 1, verbose = False, journal = journal, checksums = True)
+    assert_equal(get_file_contents(journal).count('"checksums"'), 3)
+
+
+def _run_touched_input(temp_folder, contents):
+    _Config.temp_root = temp_folder
+    journal = os.path.join(temp_folder, "journal")
+    input_file = os.path.join(temp_folder, "input")
+    output_file = os.path.join(temp_folder, "output")
+    set_file_contents(input_file, "ACGT")
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_TouchNode(output_file, input_files = input_file))
+    assert pipeline.run(max_running = 1, verbose = False, journal = journal, checksums = True)
+
+    set_file_contents(input_file, contents)
+    os.utime(input_file, (os.path.getmtime(output_file) + 10,) * 2)
+    # Fails if re-run
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_TouchNode(output_file, input_files = input_file, fail = True))
+    return pipeline.run(max_running = 1, verbose = False, journal = journal, checksums = True)
+
+
+@with_temp_folder
+def test_run__journal_checksums__touched_input_not_rerun(temp_folder):
+    assert _run_touched_input(temp_folder, "ACGT")
+
+
+@with_temp_folder
+def test_run__journal_checksums__modified_input_rerun(temp_folder):
+    assert not _run_touched_input(temp_folder, "TGCA")
+
+
+@with_temp_folder
+def test_run__database(temp_folder):
+    _Config.temp_root = temp_folder
+    database = os.path.join(temp_folder, "runtimes")
+    pipeline = Pypeline(_Config)
+    pipeline.add_nodes(_build_chain(temp_folder, 3))
+    assert pipeline.run(max_running = 1, verbose = False, database = database)
+    assert_equal(len(get_file_contents(database).split("\n")), 4)
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+
+from nose.tools import assert_equal, assert_almost_equal
+
+from pypeline.common.testing import \
+     with_temp_folder, \
+     set_file_contents, \
+     get_file_contents
+from pypeline.node import Node, MetaNode
+from pypeline.nodegraph import NodeGraph
+from pypeline.runtimes import \
+     RuntimeDatabase, \
+     get_usage, \
+     usage_since
+
+
+class _NodeA(Node):
+    pass
+
+class _NodeB(Node):
+    pass
+
+
+def _setup_node(temp_folder, cls = _NodeA, size = 10, name = "in"):
+    input_file = os.path.join(temp_folder, name)
+    set_file_contents(input_file, "x" * size)
+    return cls(input_files = input_file)
+
+
+def _usage(wall):
+    return {"wall" : wall, "cpu" : wall, "rss" : None}
+
+
+################################################################################
+################################################################################
+## RuntimeDatabase
+
+@with_temp_folder
+def test_database__empty(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    assert_equal(len(database), 0)
+    assert_equal(database.estimate(_setup_node(temp_folder)), 1)
+
+
+@with_temp_folder
+def test_database__meta_node(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    database.add(_setup_node(temp_folder), _usage(100))
+    assert_equal(database.estimate(MetaNode()), 0)
+
+
+@with_temp_folder
+def test_database__scaled_by_input_size(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    database.add(_setup_node(temp_folder, size = 10), _usage(100))
+    assert_almost_equal(database.estimate(_setup_node(temp_folder, size = 20)), 200)
+
+
+@with_temp_folder
+def test_database__median_of_records(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    for wall in (10, 20, 1000):
+        database.add(_setup_node(temp_folder, size = 10), _usage(wall))
+    assert_almost_equal(database.estimate(_setup_node(temp_folder, size = 10)), 20)
+
+
+@with_temp_folder
+def test_database__missing_input_files(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    database.add(_setup_node(temp_folder, size = 10), _usage(100))
+    database.add(_setup_node(temp_folder, size = 10), _usage(50))
+    node = _NodeA(input_files = os.path.join(temp_folder, "missing"))
+    assert_almost_equal(database.estimate(node), 75)
+
+
+@with_temp_folder
+def test_database__unknown_class(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    database.add(_setup_node(temp_folder), _usage(100))
+    assert_almost_equal(database.estimate(_setup_node(temp_folder, _NodeB)), 100)
+
+
+@with_temp_folder
+def test_database__keyed_by_class(temp_folder):
+    database = RuntimeDatabase(os.path.join(temp_folder, "database"))
+    database.add(_setup_node(temp_folder, _NodeA), _usage(100))
+    database.add(_setup_node(temp_folder, _NodeB), _usage(10))
+    assert_almost_equal(database.estimate(_setup_node(temp_folder, _NodeA)), 100)
+    assert_almost_equal(database.estimate(_setup_node(temp_folder, _NodeB)), 10)
+
+
+@with_temp_folder
+def test_database__reloaded(temp_folder):
+    filename = os.path.join(temp_folder, "database")
+    database = RuntimeDatabase(filename)
+    database.add(_setup_node(temp_folder), _usage(100))
+    database.close()
+
+    database = RuntimeDatabase(filename)
+    assert_equal(len(database), 1)
+    assert_almost_equal(database.estimate(_setup_node(temp_folder)), 100)
+
+
+@with_temp_folder
+def test_database__truncated_lines_are_ignored(temp_folder):
+    filename = os.path.join(temp_folder, "database")
+    database = RuntimeDatabase(filename)
+    database.add(_setup_node(temp_folder), _usage(100))
+    database.close()
+    with open(filename, "a") as handle:
+        handle.write('{"key":"foo","wa')
+
+    database = RuntimeDatabase(filename)
+    assert_equal(len(database), 1)
+
+
+@with_temp_folder
+def test_database__compacted(temp_folder):
+    filename = os.path.join(temp_folder, "database")
+    database = RuntimeDatabase(filename)
+    node = _setup_node(temp_folder)
+    for _ in range(1200):
+        database.add(node, _usage(100))
+    database.close()
+    assert_equal(len(get_file_contents(filename).split("\n")), 1201)
+
+    database = RuntimeDatabase(filename)
+    assert_equal(len(database), 50)
+    assert_equal(len(get_file_contents(filename).split("\n")), 51)
+
+
+################################################################################
+################################################################################
+## get_usage / usage_since
+
+def test_usage_since():
+    usage = usage_since(get_usage())
+    assert_equal(sorted(usage), ["cpu", "rss", "wall"])
+    assert usage["wall"] >= 0
+    assert usage["cpu"] >= 0
+
+
+def test_usage_since__rss_unknown_if_not_increased():
+    before = get_usage()
+    assert_equal(usage_since(before)["rss"], None)
+
+
+################################################################################
+################################################################################
+## NodeGraph.estimate_remaining_time
+
+def test_estimate_remaining_time__no_runtimes():
+    graph = NodeGraph([Node(output_files = "tests/data/missing_runtimes_file")])
+    assert_equal(graph.estimate_remaining_time(4), None)
+
+
+def test_estimate_remaining_time__work_bound():
+    nodes = [Node(output_files = "tests/data/missing_runtimes_file_%i" % (index,))
+             for index in range(8)]
+    graph = NodeGraph(nodes, runtimes = lambda _node: 10)
+    assert_almost_equal(graph.estimate_remaining_time(4), 20)
+
+
+def test_estimate_remaining_time__critical_path_bound():
+    node = None
+    for index in range(4):
+        node = Node(output_files = "tests/data/missing_runtimes_file_%i" % (index,),
+                    dependencies = filter(None, [node]))
+    graph = NodeGraph([node], runtimes = lambda _node: 10)
+    assert_almost_equal(graph.estimate_remaining_time(4), 40)
+
+
+def test_estimate_remaining_time__updated_as_nodes_finish():
+    node = None
+    for index in range(4):
+        node = Node(output_files = "tests/data/missing_runtimes_file_%i" % (index,),
+                    dependencies = filter(None, [node]))
+    graph = NodeGraph([node], runtimes = lambda _node: 10)
+
+    first = graph.pop_runable_node(1)
+    graph.set_node_state(first, NodeGraph.RUNNING)
+    assert_almost_equal(graph.estimate_remaining_time(4), 40)
+    graph.set_node_state(first, NodeGraph.DONE)
+    assert_almost_equal(graph.estimate_remaining_time(4), 30)
+
+    graph.refresh_states()
+    # The output file of 'first' is missing, so it is RUNABLE once again
+    assert_almost_equal(graph.estimate_remaining_time(4), 40)
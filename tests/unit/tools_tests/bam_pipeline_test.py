@@ -0,0 +1,328 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2012 Mikkel Schubert <MSchubert@snm.ku.dk>
+#
+# Permission is herby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# Disable warning caused by "invalid" function names
+# pylint: disable=C0103
+# Disable warning caused by touching private member variables/functions
+# pylint: disable=W0212
+import os
+import gzip
+import StringIO
+
+from nose.tools import assert_equal, assert_raises
+
+from pypeline.common.testing import \
+     Monkeypatch, \
+     with_temp_folder, \
+     set_file_contents
+
+from pypeline.node import Node, NodeError
+from pypeline.tools.bam_pipeline.nodes import SplitFASTQNode, \
+     MergeChunksNode
+from pypeline.tools.bam_pipeline.parts.lane import Lane
+from pypeline.tools.bam_pipeline.pipeline import parse_config
+
+
+_RECORDS = ["@read_%i\nACGT\n+\nIIII\n" % (index,) for index in range(5)]
+
+
+class _Config:
+    def __init__(self, temp_root):
+        self.temp_root = temp_root
+        self.jar_root  = temp_root
+
+
+def _read_gzip(filename):
+    handle = gzip.open(filename)
+    try:
+        return handle.read()
+    finally:
+        handle.close()
+
+
+################################################################################
+################################################################################
+## SplitFASTQNode
+
+@with_temp_folder
+def test_split_fastq_node__single_end(temp_folder):
+    input_file = os.path.join(temp_folder, "reads.fastq")
+    set_file_contents(input_file, "".join(_RECORDS))
+    output_files = [os.path.join(temp_folder, "out", "chunk%i.fastq.gz" % (index,))
+                    for index in range(2)]
+
+    node = SplitFASTQNode(input_files  = [input_file],
+                          output_files = [output_files])
+    assert_equal(node.output_files, frozenset(output_files))
+    node.run(_Config(temp_folder))
+
+    assert_equal(_read_gzip(output_files[0]), "".join(_RECORDS[0::2]))
+    assert_equal(_read_gzip(output_files[1]), "".join(_RECORDS[1::2]))
+
+
+@with_temp_folder
+def test_split_fastq_node__paired_end(temp_folder):
+    input_files, output_files = [], []
+    for mate in (1, 2):
+        input_files.append(os.path.join(temp_folder, "reads.pair%i.fastq" % (mate,)))
+        set_file_contents(input_files[-1], "".join(record.replace("\nACGT", "/%i\nACGT" % (mate,))
+                                                   for record in _RECORDS))
+        output_files.append([os.path.join(temp_folder, "chunk%i.pair%i.fastq.gz" % (index, mate))
+                             for index in range(3)])
+
+    node = SplitFASTQNode(input_files  = input_files,
+                          output_files = output_files)
+    node.run(_Config(temp_folder))
+
+    for (mate, filenames) in enumerate(output_files, start = 1):
+        for (index, filename) in enumerate(filenames):
+            expected = "".join(record.replace("\nACGT", "/%i\nACGT" % (mate,))
+                               for record in _RECORDS[index::3])
+            assert_equal(_read_gzip(filename), expected)
+
+
+@with_temp_folder
+def test_split_fastq_node__no_partial_output_on_error(temp_folder):
+    output_file = os.path.join(temp_folder, "chunk.fastq.gz")
+    node = SplitFASTQNode(input_files  = [os.path.join(temp_folder, "missing.fastq")],
+                          output_files = [[output_file]])
+    assert_raises(NodeError, node.run, _Config(temp_folder))
+    assert not os.path.exists(output_file)
+
+
+################################################################################
+################################################################################
+## MergeChunksNode
+
+@with_temp_folder
+def test_merge_chunks_node__removes_intermediate_files(temp_folder):
+    input_bams = [os.path.join(temp_folder, "chunk%i.bam" % (index,)) for index in range(2)]
+    intermediate_files = [os.path.join(temp_folder, "chunk%i.fastq.gz" % (index,)) for index in range(2)]
+    for filename in input_bams + intermediate_files:
+        set_file_contents(filename, "")
+
+    config = _Config(temp_folder)
+    node = MergeChunksNode(config             = config,
+                           input_bams         = input_bams,
+                           output_bam         = os.path.join(temp_folder, "merged.bam"),
+                           intermediate_files = input_bams + intermediate_files)
+    assert_equal(node.input_files, frozenset(input_bams))
+
+    calls = []
+    def _teardown(*args):
+        assert_equal(sorted(os.listdir(temp_folder)), sorted(map(os.path.basename, input_bams + intermediate_files)))
+        calls.append(args)
+
+    with Monkeypatch("pypeline.node.CommandNode._teardown", _teardown):
+        node._teardown(config, "/tmp/xTMPx")
+    assert_equal(calls, [(node, config, "/tmp/xTMPx")])
+    assert_equal(os.listdir(temp_folder), [])
+
+
+@with_temp_folder
+def test_merge_chunks_node__files_kept_by_default(temp_folder):
+    input_bams = [os.path.join(temp_folder, "chunk%i.bam" % (index,)) for index in range(2)]
+    for filename in input_bams:
+        set_file_contents(filename, "")
+
+    config = _Config(temp_folder)
+    node = MergeChunksNode(config     = config,
+                           input_bams = input_bams,
+                           output_bam = os.path.join(temp_folder, "merged.bam"))
+
+    with Monkeypatch("pypeline.node.CommandNode._teardown", lambda *_args: None):
+        node._teardown(config, "/tmp/xTMPx")
+    assert_equal(sorted(os.listdir(temp_folder)), ["chunk0.bam", "chunk1.bam"])
+
+
+@with_temp_folder
+def test_merge_chunks_node__files_kept_on_failure(temp_folder):
+    input_bams = [os.path.join(temp_folder, "chunk%i.bam" % (index,)) for index in range(2)]
+    for filename in input_bams:
+        set_file_contents(filename, "")
+
+    config = _Config(temp_folder)
+    node = MergeChunksNode(config             = config,
+                           input_bams         = input_bams,
+                           output_bam         = os.path.join(temp_folder, "merged.bam"),
+                           intermediate_files = input_bams)
+
+    def _teardown(*_args):
+        raise NodeError("failed")
+
+    with Monkeypatch("pypeline.node.CommandNode._teardown", _teardown):
+        assert_raises(NodeError, node._teardown, config, "/tmp/xTMPx")
+    assert_equal(sorted(os.listdir(temp_folder)), ["chunk0.bam", "chunk1.bam"])
+
+
+################################################################################
+################################################################################
+## Lane._build_chunked_alignment_node
+
+class _Reads:
+    def __init__(self, folder, nodes = ()):
+        self.folder = folder
+        self.nodes  = tuple(nodes)
+
+
+class _Lane(Lane):
+    def __init__(self, reads): # pylint: disable=W0231
+        self.reads = reads
+        self.tags  = {}
+
+
+def _build_aln_node(_config, parameters, input_filename, _tags, _options):
+    return Node(description  = input_filename,
+                input_files  = [input_filename.format(Pair = pair) for pair in (1, 2)],
+                output_files = [parameters["output_file"]],
+                dependencies = parameters["dependencies"])
+
+
+def _build_chunked_alignment_node(temp_folder, input_filename, num_chunks, remove_chunks = False,
+                                  prefix = "prefix"):
+    reads_folder = os.path.join(temp_folder, "reads")
+    lane = _Lane(_Reads(reads_folder))
+    parameters = {"output_file"  : os.path.join(temp_folder, prefix, "single.minQ25.bam"),
+                  "dependencies" : ()}
+    options = {"SplitReadsIntoChunks" : num_chunks,
+               "RemoveChunks"         : remove_chunks}
+    return lane._build_chunked_alignment_node(_Config(temp_folder), parameters, _build_aln_node,
+                                              "Single", input_filename, options)
+
+
+def _get_split_node(node):
+    split_nodes = set()
+    for aln_node in node.dependencies:
+        assert_equal(len(aln_node.dependencies), 1)
+        split_nodes.update(aln_node.dependencies)
+    assert_equal(len(split_nodes), 1)
+
+    split_node = split_nodes.pop()
+    assert isinstance(split_node, SplitFASTQNode)
+    return split_node
+
+
+@with_temp_folder
+def test_chunked_alignment__single_end(temp_folder):
+    input_filename = os.path.join(temp_folder, "reads.truncated.gz")
+    node = _build_chunked_alignment_node(temp_folder, input_filename, 2)
+    assert isinstance(node, MergeChunksNode)
+
+    chunk_bams = [os.path.join(temp_folder, "prefix", "single.minQ25.chunk%03i.bam" % (index,)) for index in range(2)]
+    chunk_reads = [os.path.join(temp_folder, "reads", "chunks", "single.chunk%03i.fastq.gz" % (index,)) for index in range(2)]
+    assert_equal(node.input_files, frozenset(chunk_bams))
+    assert_equal(node.output_files, frozenset([os.path.join(temp_folder, "prefix", "single.minQ25.bam"),
+                                               os.path.join(temp_folder, "prefix", "single.minQ25.bai")]))
+    assert_equal(node._intermediate_files, ())
+
+    aln_nodes = sorted(node.dependencies, key = str)
+    assert_equal([str(aln_node) for aln_node in aln_nodes], chunk_reads)
+
+    split_node = _get_split_node(node)
+    assert_equal(split_node.input_files, frozenset([input_filename]))
+    assert_equal(split_node.output_files, frozenset(chunk_reads))
+
+
+@with_temp_folder
+def test_chunked_alignment__paired_end(temp_folder):
+    input_filename = os.path.join(temp_folder, "reads.pair{Pair}.truncated.gz")
+    node = _build_chunked_alignment_node(temp_folder, input_filename, 2)
+
+    aln_nodes = sorted(node.dependencies, key = str)
+    template = os.path.join(temp_folder, "reads", "chunks", "single.chunk%03i.pair{Pair}.fastq.gz")
+    assert_equal([str(aln_node) for aln_node in aln_nodes], [template % (index,) for index in range(2)])
+
+    split_node = _get_split_node(node)
+    assert_equal(split_node.input_files, frozenset([input_filename.format(Pair = pair) for pair in (1, 2)]))
+    assert_equal(split_node.output_files,
+                 frozenset((template % (index,)).format(Pair = pair) for index in range(2) for pair in (1, 2)))
+
+
+@with_temp_folder
+def test_chunked_alignment__chunks_shared_between_prefixes(temp_folder):
+    input_filename = os.path.join(temp_folder, "reads.truncated.gz")
+    node_a = _build_chunked_alignment_node(temp_folder, input_filename, 2, prefix = "prefix_a")
+    node_b = _build_chunked_alignment_node(temp_folder, input_filename, 2, prefix = "prefix_b")
+
+    assert not (node_a.input_files & node_b.input_files)
+    assert _get_split_node(node_a) is _get_split_node(node_b)
+
+
+@with_temp_folder
+def test_chunked_alignment__output_exists(temp_folder):
+    # Chunks are not removed by default, so the normal checks apply
+    input_filename = os.path.join(temp_folder, "reads.truncated.gz")
+    set_file_contents(input_filename, "")
+    os.makedirs(os.path.join(temp_folder, "prefix"))
+    set_file_contents(os.path.join(temp_folder, "prefix", "single.minQ25.bam"), "")
+
+    node = _build_chunked_alignment_node(temp_folder, input_filename, 2)
+    assert isinstance(node, MergeChunksNode)
+    assert_equal(len(node.dependencies), 2)
+
+
+@with_temp_folder
+def test_chunked_alignment__remove_chunks(temp_folder):
+    input_filename = os.path.join(temp_folder, "reads.truncated.gz")
+    node = _build_chunked_alignment_node(temp_folder, input_filename, 2, remove_chunks = True)
+
+    chunk_bams = [os.path.join(temp_folder, "prefix", "single.minQ25.chunk%03i.bam" % (index,)) for index in range(2)]
+    chunk_reads = [os.path.join(temp_folder, "prefix", "single.minQ25.chunk%03i.fastq.gz" % (index,)) for index in range(2)]
+    assert_equal(node.input_files, frozenset(chunk_bams))
+    assert_equal(sorted(node._intermediate_files), sorted(chunk_bams + chunk_reads))
+    assert_equal(_get_split_node(node).output_files, frozenset(chunk_reads))
+
+
+@with_temp_folder
+def test_chunked_alignment__removed_chunks_not_shared_between_prefixes(temp_folder):
+    input_filename = os.path.join(temp_folder, "reads.truncated.gz")
+    node_a = _build_chunked_alignment_node(temp_folder, input_filename, 2, remove_chunks = True, prefix = "prefix_a")
+    node_b = _build_chunked_alignment_node(temp_folder, input_filename, 2, remove_chunks = True, prefix = "prefix_b")
+
+    assert not (_get_split_node(node_a).output_files & _get_split_node(node_b).output_files)
+
+
+################################################################################
+################################################################################
+## parse_config
+
+def _parse_config(temp_folder, *args):
+    stderr = StringIO.StringIO()
+    with Monkeypatch("os.path.expanduser", lambda path: path.replace("~", temp_folder)):
+        with Monkeypatch("sys.stderr", stderr):
+            result = parse_config(["--temp-root", temp_folder] + list(args))
+    return result, stderr.getvalue()
+
+
+@with_temp_folder
+def test_parse_config__journal_checksums_with_journal(temp_folder):
+    journal = os.path.join(temp_folder, "journal")
+    (config, _), _ = _parse_config(temp_folder, "--journal", journal, "--journal-checksums")
+    assert_equal(config.journal, journal)
+    assert config.journal_checksums
+
+
+@with_temp_folder
+def test_parse_config__journal_checksums_requires_journal(temp_folder):
+    result, stderr = _parse_config(temp_folder, "--journal-checksums")
+    assert_equal(result, None)
+    assert "--journal" in stderr